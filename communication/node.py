@@ -85,7 +85,7 @@ class Node(ABC):
 
     def get_connected_nodes(self):
         with self.node_connections_lock:
-            return self.node_connections.keys()
+            return list(self.node_connections.keys())
 
     def accept_connections(self):
         """
@@ -245,7 +245,8 @@ class Node(ABC):
                 requested_object = self.get_requested_object(msg_subtype, msg_params)
 
                 # if the node cannot handle the request, discard it for now and trust other node to answer it
-                if not requested_object:
+                # (an empty list is still an answer, e.g. no headers after an up-to-date hash)
+                if requested_object is None:
                     return
                 self.send_focused_message(
                     node_address,
@@ -261,13 +262,13 @@ class Node(ABC):
                 self.node_logger.debug(
                     f"received response {msg_subtype} object: ({msg_object}) from node with address: {node_address}"
                 )
-                self.process_object_data(msg_subtype, msg_object)
+                self.process_object_data(msg_subtype, msg_object, node_address)
 
             case MsgTypes.BROADCAST:
                 msg_object = msg_params[0]
                 self.node_logger.debug(f"received broadcast {msg_subtype} object: ({msg_object})"
                                       f" from node with address: {node_address}")
-                already_seen = self.process_object_data(msg_subtype, msg_object)
+                already_seen = self.process_object_data(msg_subtype, msg_object, node_address)
                 if not already_seen:
                     self.send_distributed_message(msg_type, msg_subtype, excluded_node=node_address, *msg_params)
 
@@ -285,16 +286,21 @@ class Node(ABC):
         match object_type:
             case MsgSubTypes.BLOCKCHAIN:
                 results = self.serve_blockchain_request(params[0])
+            case MsgSubTypes.HEADERS:
+                results = self.serve_headers_request(params[0])
+            case MsgSubTypes.BLOCKS:
+                results = self.serve_blocks_request(params[0], params[1])
             case MsgSubTypes.NODE_ADDRESS:
                 results = self.serve_node_request()
 
         return results
 
-    def process_object_data(self, object_type, msg_object):
+    def process_object_data(self, object_type, msg_object, node_address=None):
         """
         Routes send messages to specific handlers based on object type.
         :param object_type: Type of object sent (e.g., BLOCK, NODE, TRANSACTION).
         :param msg_object: Additional parameters for message processing.
+        :param node_address: Address of the node that sent the object.
         """
         already_seen = False
         match object_type:
@@ -305,6 +311,13 @@ class Node(ABC):
                 # blockchain is only request-send pair message, so it always needs new
                 self.process_blockchain_data(msg_object)
 
+            case MsgSubTypes.HEADERS:
+                # headers and blocks are request-send pair messages as well
+                self.process_headers_data(msg_object, node_address)
+
+            case MsgSubTypes.BLOCKS:
+                self.process_blocks_data(msg_object, node_address)
+
             case MsgSubTypes.NODE_ADDRESS:
                 # node is only request-send pair message, so it always needs new
                 self.process_node_data(msg_object)
@@ -340,6 +353,20 @@ class Node(ABC):
         """
         pass
 
+    @abstractmethod
+    def serve_headers_request(self, latest_hash):
+        """
+        Handles requests for the block headers following a hash (abstract method).
+        """
+        pass
+
+    @abstractmethod
+    def serve_blocks_request(self, start_hash, count):
+        """
+        Handles requests for a range of blocks following a hash (abstract method).
+        """
+        pass
+
     @abstractmethod
     def serve_node_request(self):
         """
@@ -365,6 +392,26 @@ class Node(ABC):
         """
         pass
 
+    @abstractmethod
+    def process_headers_data(self, headers, node_address):
+        """
+        Handles received block headers (abstract method).
+
+        :param headers: List of block headers.
+        :param node_address: Address of the node that sent them.
+        """
+        pass
+
+    @abstractmethod
+    def process_blocks_data(self, blocks, node_address):
+        """
+        Handles a received range of blocks (abstract method).
+
+        :param blocks: List of blocks.
+        :param node_address: Address of the node that sent them.
+        """
+        pass
+
     @abstractmethod
     def process_node_data(self, params):
         """
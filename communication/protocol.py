@@ -7,6 +7,7 @@ import pickle
 from utils.logging_utils import setup_basic_logger
 from utils.config import MsgSubTypes, MsgStructure, MsgTypes
 from core.blockchain import Transaction, Blockchain, Block
+from core.block import BlockHeader
 
 
 # Setup logger for file
@@ -95,6 +96,12 @@ def decrypt_msg_params(msg_type, msg_subtype, params_bytes):
         case MsgSubTypes.BLOCKCHAIN:
             main_object = Blockchain.from_dict(main_object_dict)
 
+        case MsgSubTypes.HEADERS:
+            main_object = [BlockHeader.from_dict(header_dict) for header_dict in main_object_dict]
+
+        case MsgSubTypes.BLOCKS:
+            main_object = [Block.from_dict(block_dict) for block_dict in main_object_dict]
+
         case MsgSubTypes.NODE_ADDRESS:
             # address is just a tuple, no need to convert
             main_object = main_object_dict
@@ -151,9 +158,11 @@ def construct_message(msg_type: str, msg_sub_type: str, *params) -> bytes:
         # Handle parameters, including the case of no parameters
         if params:
             msg_params = list(params)
-            # Convert the first parameter to a dictionary if it has a 'to_dict' method
+            # Convert the first parameter to a dictionary if it has a 'to_dict' method, or a list of such objects
             if hasattr(msg_params[0], "to_dict"):
                 msg_params[0] = msg_params[0].to_dict()
+            elif isinstance(msg_params[0], list) and msg_params[0] and hasattr(msg_params[0][0], "to_dict"):
+                msg_params[0] = [item.to_dict() for item in msg_params[0]]
             params_data = pickle.dumps(msg_params)
             msg_len = str(len(params_data)).encode()
             message = msg_len + MsgStructure.DIVIDER + msg_type_encoded + msg_sub_type_encoded + params_data
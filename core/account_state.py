@@ -0,0 +1,119 @@
+import hashlib
+
+from core.transaction import create_sample_transaction
+from utils.logging_utils import setup_basic_logger
+
+# Setup logger for file
+logger = setup_basic_logger()
+
+# Constants for assertion error messages
+BALANCE_ERROR = "Balance should follow the applied transactions"
+COUNT_ERROR = "Transaction count should count the sent transactions"
+RESTORE_ERROR = "Restoring a snapshot should undo the later transactions"
+DIGEST_ERROR = "Digest should change exactly with the accounts"
+
+
+class AccountState:
+    """
+    The balance of every account on a chain, keyed by public key fingerprint, updated block by block.
+    Like the wallet, a transaction moves its amount from the sender to the recipient,
+    tips are paid to the miner by the tipping transaction.
+    """
+
+    def __init__(self, accounts=None):
+        """
+        :param accounts: Dictionary of fingerprint to (balance, sent transactions count).
+        """
+        self.accounts = dict(accounts) if accounts else {}
+
+    def __len__(self):
+        return len(self.accounts)
+
+    def get_balance(self, fingerprint):
+        """
+        :param fingerprint: Fingerprint of the account's public key.
+        :return: The balance of the account, 0 for an unknown account.
+        """
+        return self.accounts.get(fingerprint, (0, 0))[0]
+
+    def get_transaction_count(self, fingerprint):
+        """
+        :param fingerprint: Fingerprint of the account's public key.
+        :return: Number of transactions the account sent.
+        """
+        return self.accounts.get(fingerprint, (0, 0))[1]
+
+    def can_spend(self, fingerprint, amount):
+        return self.get_balance(fingerprint) >= amount
+
+    def apply_transaction(self, transaction):
+        sender = transaction.get_sender_fingerprint()
+        balance, count = self.accounts.get(sender, (0, 0))
+        self.accounts[sender] = (balance - transaction.amount, count + 1)
+
+        recipient = transaction.get_recipient_fingerprint()
+        balance, count = self.accounts.get(recipient, (0, 0))
+        self.accounts[recipient] = (balance + transaction.amount, count)
+
+    def apply_block(self, block):
+        for transaction in block.transactions:
+            self.apply_transaction(transaction)
+
+    def get_digest(self):
+        """
+        :return: SHA-256 digest (bytes) of all the accounts, in fingerprint order.
+        """
+        digest = hashlib.sha256()
+        for fingerprint in sorted(self.accounts):
+            balance, count = self.accounts[fingerprint]
+            digest.update(fingerprint)
+            digest.update(f"{balance}:{count};".encode())
+        return digest.digest()
+
+    def snapshot(self):
+        """
+        :return: A copy of the accounts, which restore() returns to.
+        """
+        return dict(self.accounts)
+
+    def restore(self, snapshot):
+        self.accounts = dict(snapshot)
+
+    @classmethod
+    def from_blocks(cls, blocks):
+        """
+        Replay blocks into a new account state.
+        :param blocks: Iterable of blocks, in chain order.
+        :return: The account state after all the blocks.
+        """
+        account_state = cls()
+        for block in blocks:
+            account_state.apply_block(block)
+        logger.debug("Account state rebuilt with %d accounts", len(account_state))
+        return account_state
+
+
+def assertion_check():
+    transaction = create_sample_transaction(30)
+    sender = transaction.get_sender_fingerprint()
+    recipient = transaction.get_recipient_fingerprint()
+
+    account_state = AccountState()
+    snapshot = account_state.snapshot()
+    account_state.apply_transaction(transaction)
+    assert account_state.get_balance(sender) == -30 and account_state.get_balance(recipient) == 30, BALANCE_ERROR
+    assert account_state.get_transaction_count(sender) == 1, COUNT_ERROR
+    assert account_state.get_transaction_count(recipient) == 0, COUNT_ERROR
+    assert account_state.can_spend(recipient, 30) and not account_state.can_spend(recipient, 31), BALANCE_ERROR
+
+    digest = account_state.get_digest()
+    account_state.restore(snapshot)
+    assert account_state.get_balance(recipient) == 0 and len(account_state) == 0, RESTORE_ERROR
+    assert account_state.get_digest() != digest, DIGEST_ERROR
+    account_state.apply_transaction(transaction)
+    assert account_state.get_digest() == digest, DIGEST_ERROR
+    print("Account state assertions passed!")
+
+
+if __name__ == "__main__":
+    assertion_check()
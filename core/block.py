@@ -1,10 +1,13 @@
 import hashlib
 import random
+import struct
 import time
+from core.merkle import MerkleTree, verify_merkle_proof
 from core.transaction import Transaction, create_sample_transaction, get_sk_pk_pair
+from core.verification import get_verifier
 from utils.logging_utils import setup_basic_logger
 from utils.config import MinerSettings, BlockSettings, KeysSettings
-from utils.keys_manager import load_key
+from utils.keys_manager import load_key, get_key_fingerprint
 
 # Setup logger for file
 logger = setup_basic_logger()
@@ -13,6 +16,13 @@ logger = setup_basic_logger()
 HASH_VALIDATION_ERROR = "Calculated hash should match the expected hash"
 MINE_SUCCESS_ERROR = "Mined block hash should meet difficulty target"
 NONCE_INCREMENT_ERROR = "Nonce should increment in the mining process"
+HEADER_SIZE_ERROR = "Block header should have a fixed size"
+MERKLE_PROOF_ERROR = "Merkle proof should verify only transactions of the block"
+HEADER_POW_ERROR = "A block header should verify the block's proof of work without its transactions"
+
+# version, previous hash, merkle root, difficulty, timestamp | nonce
+HEADER_PREFIX_STRUCT = struct.Struct(">I32s32sId")
+NONCE_STRUCT = struct.Struct(">I")
 
 
 class Block:
@@ -43,6 +53,8 @@ class Block:
         self.timestamp = timestamp or time.time()
         self.nonce = nonce
         self.hash = block_hash  # Initially None to avoid confusion before mining
+        self._merkle_tree = None
+        self._merkle_transactions = []
 
     def to_dict(self):
         return {
@@ -80,16 +92,103 @@ class Block:
                      f"Transactions: [{transaction_reprs if len(self.transactions) < 5 else len(self.transactions)}])")
         return str_value
 
+    def get_merkle_tree(self):
+        """
+        Get the Merkle tree of the transaction hashes. The tree is cached and rebuilt only
+        when the transactions list holds different transactions.
+
+        :return: The MerkleTree of the block transactions.
+        """
+        cached_transactions = self._merkle_transactions
+        if (
+                self._merkle_tree is None
+                or len(cached_transactions) != len(self.transactions)
+                or any(cached is not tx for cached, tx in zip(cached_transactions, self.transactions))
+        ):
+            self._merkle_tree = MerkleTree([get_transaction_leaf(tx) for tx in self.transactions])
+            self._merkle_transactions = list(self.transactions)
+        return self._merkle_tree
+
+    def get_merkle_root(self):
+        """
+        Get the Merkle root committing to the block transactions.
+
+        :return: The 32 byte Merkle root of the transaction hashes.
+        """
+        return self.get_merkle_tree().root
+
+    def get_transaction_proof(self, transaction):
+        """
+        Build a Merkle inclusion proof for a transaction of this block.
+
+        :param transaction: A transaction in the block.
+        :return: The proof (see MerkleTree.get_proof), or None if the transaction is not in the block.
+        """
+        for index, tx in enumerate(self.transactions):
+            if tx is transaction or tx == transaction:
+                return self.get_merkle_tree().get_proof(index)
+        return None
+
+    @staticmethod
+    def verify_transaction_proof(transaction, proof, merkle_root):
+        """
+        Check that a transaction is committed to by a block Merkle root, without the block transactions.
+
+        :param transaction: The transaction to check.
+        :param proof: The proof from get_transaction_proof.
+        :param merkle_root: The Merkle root from the block header.
+        :return: True if the transaction is in the block.
+        """
+        return verify_merkle_proof(get_transaction_leaf(transaction), proof, merkle_root)
+
+    def get_header_timestamp(self):
+        """
+        :return: The timestamp as stored in the header. Non numeric timestamps (the genesis "time-zero") are 0.
+        """
+        if isinstance(self.timestamp, (int, float)):
+            return float(self.timestamp)
+        return 0.0
+
+    def get_hash_prefix(self):
+        """
+        Serialize the binary block header without the nonce:
+        version, previous hash, transactions Merkle root, difficulty and timestamp as fixed-width fields.
+        Miners hash this prefix once per job and only feed the nonce suffix per attempt.
+
+        :return: The fixed size header bytes preceding the nonce.
+        """
+        return pack_hash_prefix(self.previous_hash, self.get_merkle_root(), self.difficulty, self.get_header_timestamp())
+
+    def get_header(self):
+        """
+        :return: The BlockHeader of the block, which is enough to check its proof of work.
+        """
+        return BlockHeader(
+            self.previous_hash,
+            self.get_merkle_root(),
+            self.difficulty,
+            self.get_header_timestamp(),
+            self.nonce,
+            self.hash
+        )
+
+    @staticmethod
+    def encode_nonce(nonce):
+        """
+        Encode a nonce the way it is appended to the hash prefix.
+
+        :param nonce: The nonce to encode.
+        :return: The encoded nonce suffix.
+        """
+        return NONCE_STRUCT.pack(nonce)
+
     def calculate_hash(self):
         """
-        Calculate an SHA-256 hash based on the block contents.
+        Calculate an SHA-256 hash of the binary block header.
 
         :return: A string representing the hash of the block.
         """
-        # Serialize transactions to strings using repr
-        serialized_transactions = ''.join(repr(tx) for tx in self.transactions)
-        data = f"{self.previous_hash}|{serialized_transactions}|{self.difficulty}|{self.timestamp}|{self.nonce}"
-        block_hash = hashlib.sha256(data.encode()).hexdigest()
+        block_hash = hashlib.sha256(self.get_hash_prefix() + self.encode_nonce(self.nonce)).hexdigest()
         return block_hash
 
     def validate_block(self):
@@ -98,8 +197,8 @@ class Block:
 
         :return: True if all transactions are valid, False otherwise.
         """
-        bonus_pk = load_key(KeysSettings.BONUS_PK)
-        tipping_pk = load_key(KeysSettings.TIPPING_PK)
+        bonus_fingerprint = get_key_fingerprint(KeysSettings.BONUS_PK)
+        tipping_fingerprint = get_key_fingerprint(KeysSettings.TIPPING_PK)
         tips_sum = 0
         tips_transaction = self.transactions[0]
         bonus_transaction = self.transactions[-1]
@@ -110,7 +209,7 @@ class Block:
         # check every transaction except for the first and last one (tips and bonus)
         for transaction in self.transactions[1:-1]:
             # check for invalid pk (tipping or bonus)
-            if transaction.sender_pk == bonus_pk or transaction.sender_pk == tipping_pk:
+            if transaction.get_sender_fingerprint() in (bonus_fingerprint, tipping_fingerprint):
                 logger.warning(f"Invalid transaction: use of global pk {transaction.sender_pk}")
                 return False
 
@@ -119,11 +218,6 @@ class Block:
                 logger.warning(f"Invalid transaction amount ({transaction.amount}) in transaction: {transaction}")
                 return False
 
-            # check for not valid signature
-            if not transaction.verify_signature():
-                logger.warning("Invalid transaction detected: %s", transaction)
-                return False
-
             # check for duplicate
             if transaction in seen_transactions:
                 logger.warning(f"Duplicate transaction used twice: {transaction}")
@@ -132,8 +226,14 @@ class Block:
 
             tips_sum += transaction.tip
 
+        # check the signatures of all the transactions in parallel
+        invalid_index = get_verifier().find_invalid(self.transactions[1:-1])
+        if invalid_index is not None:
+            logger.warning("Invalid transaction detected: %s", self.transactions[1 + invalid_index])
+            return False
+
         # check the tipping transaction
-        if tips_transaction.sender_pk != tipping_pk:  # check public key
+        if tips_transaction.get_sender_fingerprint() != tipping_fingerprint:  # check public key
             logger.warning(f"tipping transaction does not contain correct tipping pk. pk: {tips_transaction.sender_pk}")
             return False
         if tips_sum != tips_transaction.amount:  # check amount
@@ -142,7 +242,7 @@ class Block:
             return False
 
         # check bonus transaction
-        if bonus_transaction.sender_pk != bonus_pk:  # check public key
+        if bonus_transaction.get_sender_fingerprint() != bonus_fingerprint:  # check public key
             logger.warning(f"bonus transaction does not contain correct bonus pk. pk: {bonus_transaction.sender_pk}")
             return False
         if bonus_transaction.amount != BlockSettings.BONUS_AMOUNT:  # check amount
@@ -174,6 +274,82 @@ class Block:
         self.transactions.append(transaction)
 
 
+class BlockHeader:
+    """
+    The fields of a block covered by its hash, with the Merkle root standing in for the transactions.
+    Headers are small and fixed size, so a chain of them can be downloaded and its proof of work checked
+    before any block body is fetched.
+    """
+
+    def __init__(self, previous_hash, merkle_root, difficulty, timestamp, nonce, block_hash):
+        """
+        :param merkle_root: The 32 byte Merkle root of the block transactions.
+        :param timestamp: The timestamp as stored in the header.
+        :param block_hash: The claimed hash of the block.
+        """
+        self.previous_hash = previous_hash
+        self.merkle_root = merkle_root
+        self.difficulty = difficulty
+        self.timestamp = timestamp
+        self.nonce = nonce
+        self.hash = block_hash
+
+    def to_dict(self):
+        return {
+            "previous_hash": self.previous_hash,
+            "merkle_root": self.merkle_root.hex(),
+            "difficulty": self.difficulty,
+            "timestamp": self.timestamp,
+            "nonce": self.nonce,
+            "hash": self.hash,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            previous_hash=data["previous_hash"],
+            merkle_root=bytes.fromhex(data["merkle_root"]),
+            difficulty=data["difficulty"],
+            timestamp=data["timestamp"],
+            nonce=data["nonce"],
+            block_hash=data["hash"],
+        )
+
+    def __repr__(self):
+        return f"BlockHeader(Previous Hash: {self.previous_hash[:6]}..., Hash: {self.hash[:6]}...)"
+
+    def calculate_hash(self):
+        prefix = pack_hash_prefix(self.previous_hash, self.merkle_root, self.difficulty, self.timestamp)
+        return hashlib.sha256(prefix + Block.encode_nonce(self.nonce)).hexdigest()
+
+    def has_valid_pow(self):
+        """
+        :return: True if the claimed hash is the header's hash and meets the header's difficulty.
+        """
+        return self.hash == self.calculate_hash() and self.hash[:self.difficulty] == "0" * self.difficulty
+
+
+def pack_hash_prefix(previous_hash, merkle_root, difficulty, timestamp):
+    """
+    :return: The fixed size binary header preceding the nonce, see Block.get_hash_prefix.
+    """
+    return HEADER_PREFIX_STRUCT.pack(
+        BlockSettings.HEADER_VERSION,
+        bytes.fromhex(previous_hash),
+        merkle_root,
+        difficulty,
+        timestamp
+    )
+
+
+def get_transaction_leaf(transaction):
+    """
+    :param transaction: A transaction.
+    :return: The Merkle leaf of the transaction, the bytes of its hash.
+    """
+    return bytes.fromhex(transaction.calculate_hash())
+
+
 def assertion_check():
     """
     Performs various assertions to verify the functionality of the Block class using Transaction objects.
@@ -188,7 +364,33 @@ def assertion_check():
     initial_hash = test_block.calculate_hash()
     assert test_block.hash is None, HASH_VALIDATION_ERROR  # Ensure no hash is set initially
     assert initial_hash == test_block.calculate_hash(), HASH_VALIDATION_ERROR
+
+    # the header does not grow with the transactions
+    bigger_block = create_sample_block(transactions_num=5)
+    assert len(test_block.get_hash_prefix()) == len(bigger_block.get_hash_prefix()) == HEADER_PREFIX_STRUCT.size, \
+        HEADER_SIZE_ERROR
     assert test_block.validate_block()
+
+    # every transaction should be provable against the Merkle root alone
+    merkle_root = test_block.get_merkle_root()
+    for transaction in test_block.transactions:
+        proof = test_block.get_transaction_proof(transaction)
+        assert Block.verify_transaction_proof(transaction, proof, merkle_root), MERKLE_PROOF_ERROR
+    assert not Block.verify_transaction_proof(create_sample_transaction(10), proof, merkle_root), MERKLE_PROOF_ERROR
+
+    # the header alone verifies the proof of work
+    test_block.difficulty = 1
+    while not test_block.calculate_hash().startswith("0"):
+        test_block.nonce += 1
+    test_block.hash = test_block.calculate_hash()
+    header = BlockHeader.from_dict(test_block.get_header().to_dict())
+    assert header.has_valid_pow() and header.calculate_hash() == test_block.hash, HEADER_POW_ERROR
+    header.nonce += 1
+    assert not header.has_valid_pow(), HEADER_POW_ERROR
+
+    # changing the transactions list should change the root
+    test_block.transactions.insert(1, create_sample_transaction(10))
+    assert test_block.get_merkle_root() != merkle_root, MERKLE_PROOF_ERROR
     logger.info("All assertions passed for Block class.")
 
 
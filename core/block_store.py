@@ -0,0 +1,477 @@
+import json
+import math
+import mmap
+import os
+import struct
+import threading
+import zlib
+
+from core.block import Block, create_sample_block
+from utils.config import BlockStoreSettings
+from utils.logging_utils import setup_basic_logger
+
+# Setup logger for file
+logger = setup_basic_logger()
+
+# Constants for assertion error messages
+REOPEN_ERROR = "Reopened store should return the appended blocks"
+TORN_TAIL_ERROR = "A torn tail record should be truncated on recovery"
+LAZY_BODY_ERROR = "Lazy blocks should load their bodies only when the transactions are used"
+INDEX_REBUILD_ERROR = "A missing index should be rebuilt from the segments"
+TRUNCATE_ERROR = "Truncating should keep only the first blocks"
+
+# magic, payload length, CRC-32 of the payload
+RECORD_HEADER_STRUCT = struct.Struct(">4sII")
+RECORD_MAGIC = b"DBLK"
+# segment, offset, record length | hash, previous hash, merkle root, difficulty, timestamp, nonce
+INDEX_ENTRY_STRUCT = struct.Struct(">IQI32s32s32sIdQ")
+SEGMENT_FILE_FORMAT = "segment_{:06d}.dat"
+INDEX_FILE_NAME = "index_v2.dat"
+LEGACY_INDEX_FILE_NAMES = ("index.dat",)  # indexes of older entry layouts, rebuilt from the segments
+FSYNC_POLICIES = ("always", "batch", "never")
+
+
+class LazyBlock(Block):
+    """
+    A stored block whose header comes from the block index, and whose transactions are read
+    from the block store the first time they are used.
+    Until then, the Merkle root comes from the index as well, so headers can be served without the bodies.
+    """
+
+    def __init__(self, block_store, store_index, previous_hash, merkle_root, difficulty, timestamp, nonce, block_hash):
+        self.block_store = block_store
+        self.store_index = store_index
+        self.merkle_root = merkle_root
+        self._transactions = None
+        super().__init__(previous_hash, None, difficulty, timestamp, nonce, block_hash)
+
+    @property
+    def transactions(self):
+        if self._transactions is None:
+            self._transactions = self.block_store.read_block(self.store_index).transactions
+        return self._transactions
+
+    @transactions.setter
+    def transactions(self, transactions):
+        self._transactions = transactions
+
+    def is_loaded(self):
+        return self._transactions is not None
+
+    def read_body(self):
+        """
+        :return: The block with its transactions, read from the block store without keeping them
+                 when they aren't loaded, so going over the chain doesn't load every body for good.
+        """
+        if self._transactions is not None:
+            return self
+        return self.block_store.read_block(self.store_index)
+
+    def get_merkle_root(self):
+        if self._transactions is None:
+            return self.merkle_root
+        return super().get_merkle_root()
+
+
+class BlockStore:
+    """
+    Append-only storage of blocks in segment files, one CRC protected record per block.
+    A new segment is started once the current one reaches `segment_size` bytes.
+
+    Next to the segments, a fixed-width index file holds the location and header of every block,
+    so opening the store reads only the index and the records appended after it, and blocks are loaded
+    as headers with their bodies read from the memory mapped segments on demand.
+    On open, a torn record at the end (from a crash during an append) is truncated.
+
+    The fsync policy decides when appended records are forced to disk:
+    "always" after every block, "batch" every FSYNC_BATCH blocks and on sync(), "never" leaves it to the OS.
+    """
+
+    def __init__(
+            self,
+            directory,
+            fsync_policy=BlockStoreSettings.FSYNC_POLICY,
+            segment_size=BlockStoreSettings.SEGMENT_SIZE
+    ):
+        """
+        :param directory: Directory of the segment files, created if missing.
+        :param fsync_policy: "always", "batch" or "never".
+        :param segment_size: Size in bytes after which a new segment is started.
+        """
+        if fsync_policy not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy '{fsync_policy}'")
+        self.directory = directory
+        self.fsync_policy = fsync_policy
+        self.segment_size = segment_size
+        self.lock = threading.Lock()
+        self.entries = []  # block index -> index entry tuple
+        self.segment_maps = {}  # segment -> read only mmap
+        self.unsynced = 0
+        self.segment_file = None
+        self.index_file = None
+        os.makedirs(directory, exist_ok=True)
+        self._recover()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _segment_path(self, segment):
+        return os.path.join(self.directory, SEGMENT_FILE_FORMAT.format(segment))
+
+    def _list_segments(self):
+        segments = []
+        for file_name in os.listdir(self.directory):
+            prefix, _, suffix = SEGMENT_FILE_FORMAT.partition("{:06d}")
+            if file_name.startswith(prefix) and file_name.endswith(suffix):
+                number = file_name[len(prefix):len(file_name) - len(suffix)]
+                if number.isdigit():
+                    segments.append(int(number))
+        return sorted(segments)
+
+    @staticmethod
+    def _parse_record(data, offset):
+        """
+        Parse the record at an offset of a segment's contents.
+        :return: (payload, record length), or None if the record is missing, torn or corrupted
+        """
+        header_end = offset + RECORD_HEADER_STRUCT.size
+        if header_end > len(data):
+            return None
+        magic, length, crc = RECORD_HEADER_STRUCT.unpack_from(data, offset)
+        if magic != RECORD_MAGIC or header_end + length > len(data):
+            return None
+        payload = bytes(data[header_end:header_end + length])
+        if zlib.crc32(payload) != crc:
+            return None
+        return payload, RECORD_HEADER_STRUCT.size + length
+
+    @staticmethod
+    def _create_entry(segment, offset, length, block):
+        # a non numeric timestamp (the genesis block's) is kept as NaN, and read from the body when needed
+        timestamp = block.timestamp if isinstance(block.timestamp, (int, float)) else math.nan
+        return (segment, offset, length, bytes.fromhex(block.hash), bytes.fromhex(block.previous_hash),
+                block.get_merkle_root(), block.difficulty, timestamp, block.nonce)
+
+    def _load_index(self):
+        """
+        Read the entries of the index file through a memory map, dropping a torn entry at its end.
+        """
+        for legacy_file_name in LEGACY_INDEX_FILE_NAMES:
+            legacy_path = os.path.join(self.directory, legacy_file_name)
+            if os.path.exists(legacy_path):
+                logger.info(f"Replacing the block index {legacy_path} of an older layout")
+                os.remove(legacy_path)
+
+        path = os.path.join(self.directory, INDEX_FILE_NAME)
+        if not os.path.exists(path):
+            return
+        file_size = os.path.getsize(path)
+        complete_size = file_size - file_size % INDEX_ENTRY_STRUCT.size
+        if complete_size:
+            with open(path, "rb") as index_file, \
+                    mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ) as index_map:
+                self.entries = list(INDEX_ENTRY_STRUCT.iter_unpack(index_map[:complete_size]))
+        if complete_size < file_size:
+            logger.warning(f"Truncating a torn entry of the block index {path}")
+            with open(path, "r+b") as index_file:
+                index_file.truncate(complete_size)
+
+    def _recover(self):
+        """
+        Load the index, check it against the segments, index the records appended after it, and truncate
+        a torn tail record. Records after a corrupted one can't be trusted to follow the chain,
+        so they are dropped as well.
+        """
+        self._load_index()
+        segments = self._list_segments()
+        segment_sizes = {segment: os.path.getsize(self._segment_path(segment)) for segment in segments}
+
+        # drop index entries of records that never reached the segments
+        valid_entries = 0
+        for segment, offset, length, *_ in self.entries:
+            if segment_sizes.get(segment, 0) < offset + length:
+                break
+            valid_entries += 1
+        index_rewrite = valid_entries < len(self.entries)
+        if index_rewrite:
+            logger.warning(f"Dropping {len(self.entries) - valid_entries} block index entries without records")
+            self.entries = self.entries[:valid_entries]
+
+        # scan the records after the last indexed one
+        if self.entries:
+            last_segment, last_offset, last_length, *_ = self.entries[-1]
+            scan_segments = [segment for segment in segments if segment >= last_segment]
+            scan_offset = last_offset + last_length
+        else:
+            scan_segments = segments
+            scan_offset = 0
+        new_entries = []
+        for position, segment in enumerate(scan_segments):
+            path = self._segment_path(segment)
+            offset = scan_offset if position == 0 else 0
+            with open(path, "rb") as segment_file:
+                data = segment_file.read()
+            while offset < len(data):
+                record = self._parse_record(data, offset)
+                if record is None:
+                    break
+                block = Block.from_dict(json.loads(record[0]))
+                new_entries.append(self._create_entry(segment, offset, record[1], block))
+                offset += record[1]
+
+            if offset < len(data):
+                logger.warning(f"Truncating {len(data) - offset} bytes of a torn record in {path}")
+                with open(path, "r+b") as segment_file:
+                    segment_file.truncate(offset)
+                    os.fsync(segment_file.fileno())
+                for later_segment in scan_segments[position + 1:]:
+                    logger.error(f"Dropping segment {later_segment} after the torn record")
+                    os.remove(self._segment_path(later_segment))
+                segments = [segment for segment in segments if segment <= scan_segments[position]]
+                break
+
+        self.entries += new_entries
+        index_path = os.path.join(self.directory, INDEX_FILE_NAME)
+        if index_rewrite:
+            with open(index_path, "wb") as index_file:
+                for entry in self.entries:
+                    index_file.write(INDEX_ENTRY_STRUCT.pack(*entry))
+        elif new_entries:
+            logger.info(f"Indexing {len(new_entries)} blocks missing from the block index")
+            with open(index_path, "ab") as index_file:
+                for entry in new_entries:
+                    index_file.write(INDEX_ENTRY_STRUCT.pack(*entry))
+
+        self.segment = segments[-1] if segments else 0
+        self.segment_file = open(self._segment_path(self.segment), "ab")
+        self.index_file = open(index_path, "ab")
+        logger.info(f"Block store opened with {len(self.entries)} blocks in {len(segments)} segments")
+
+    def _fsync(self):
+        self.segment_file.flush()
+        os.fsync(self.segment_file.fileno())
+        # the index is synced after the segment, so it never points at records missing from the disk
+        self.index_file.flush()
+        os.fsync(self.index_file.fileno())
+        self.unsynced = 0
+
+    def _close_maps(self):
+        for segment_map in self.segment_maps.values():
+            segment_map.close()
+        self.segment_maps = {}
+
+    def append(self, block):
+        """
+        Append a block record to the current segment, and its entry to the block index.
+        :param block: The block to store.
+        :return: Index of the block in the store
+        """
+        payload = json.dumps(block.to_dict(), separators=(",", ":")).encode()
+        record = RECORD_HEADER_STRUCT.pack(RECORD_MAGIC, len(payload), zlib.crc32(payload)) + payload
+        with self.lock:
+            offset = self.segment_file.tell()
+            if offset > 0 and offset + len(record) > self.segment_size:
+                self._fsync()
+                self.segment_file.close()
+                self.segment += 1
+                self.segment_file = open(self._segment_path(self.segment), "ab")
+                offset = 0
+
+            self.segment_file.write(record)
+            self.segment_file.flush()
+            entry = self._create_entry(self.segment, offset, len(record), block)
+            self.index_file.write(INDEX_ENTRY_STRUCT.pack(*entry))
+            self.index_file.flush()
+            self.entries.append(entry)
+            self.unsynced += 1
+            if self.fsync_policy == "always" or (
+                    self.fsync_policy == "batch" and self.unsynced >= BlockStoreSettings.FSYNC_BATCH):
+                self._fsync()
+            return len(self.entries) - 1
+
+    def sync(self):
+        """
+        Force the appended records to disk, unless the policy leaves it to the OS.
+        """
+        with self.lock:
+            if self.segment_file and self.unsynced and self.fsync_policy != "never":
+                self._fsync()
+
+    def _get_segment_map(self, segment, end):
+        """
+        :return: A memory map of the segment covering at least `end` bytes, remapped if the segment grew.
+        """
+        segment_map = self.segment_maps.get(segment)
+        if segment_map is None or len(segment_map) < end:
+            if segment_map is not None:
+                segment_map.close()
+            with open(self._segment_path(segment), "rb") as segment_file:
+                segment_map = mmap.mmap(segment_file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.segment_maps[segment] = segment_map
+        return segment_map
+
+    def read_block(self, index):
+        """
+        :param index: Index of the block in the store.
+        :return: The stored Block
+        """
+        with self.lock:
+            segment, offset, length, *_ = self.entries[index]
+            record = self._parse_record(self._get_segment_map(segment, offset + length), offset)
+        if record is None:
+            raise ValueError(f"Corrupted record of block {index} in segment {segment}")
+        return Block.from_dict(json.loads(record[0]))
+
+    def read_header(self, index):
+        """
+        :param index: Index of the block in the store.
+        :return: A LazyBlock built from the block index, which reads its transactions on first use
+        """
+        _, _, _, block_hash, previous_hash, merkle_root, difficulty, timestamp, nonce = self.entries[index]
+        if math.isnan(timestamp):
+            timestamp = self.read_block(index).timestamp
+        return LazyBlock(self, index, previous_hash.hex(), merkle_root, difficulty, timestamp, nonce,
+                         block_hash.hex())
+
+    def iter_headers(self):
+        """
+        Build LazyBlocks of all the stored blocks, in order, without reading their bodies.
+        """
+        for index in range(len(self.entries)):
+            yield self.read_header(index)
+
+    def iter_blocks(self):
+        """
+        Read all the stored blocks with their bodies, in order.
+        """
+        for index in range(len(self.entries)):
+            yield self.read_block(index)
+
+    def reset(self, blocks):
+        """
+        Replace the stored blocks, used when the whole chain is replaced or migrated.
+        :param blocks: The blocks to store, in chain order.
+        """
+        with self.lock:
+            self._close_maps()
+            self.segment_file.close()
+            self.index_file.close()
+            for segment in self._list_segments():
+                os.remove(self._segment_path(segment))
+            self.entries = []
+            self.segment = 0
+            self.segment_file = open(self._segment_path(self.segment), "ab")
+            self.index_file = open(os.path.join(self.directory, INDEX_FILE_NAME), "wb")
+        fsync_policy = self.fsync_policy
+        self.fsync_policy = "never"  # write the whole chain first, then sync once
+        try:
+            for block in blocks:
+                self.append(block)
+        finally:
+            self.fsync_policy = fsync_policy
+        self.sync()
+
+    def truncate(self, count):
+        """
+        Drop the stored blocks after the first `count` ones, used when the end of the chain turns out invalid.
+        :param count: Number of blocks to keep.
+        """
+        with self.lock:
+            if count >= len(self.entries):
+                return
+            self._close_maps()
+            self.segment_file.close()
+            self.index_file.close()
+            if count:
+                segment, offset, length, *_ = self.entries[count - 1]
+                end = offset + length
+            else:
+                segment, end = 0, 0
+            for later_segment in self._list_segments():
+                if later_segment > segment:
+                    os.remove(self._segment_path(later_segment))
+            with open(self._segment_path(segment), "ab") as segment_file:
+                segment_file.truncate(end)
+                os.fsync(segment_file.fileno())
+
+            self.entries = self.entries[:count]
+            index_path = os.path.join(self.directory, INDEX_FILE_NAME)
+            with open(index_path, "wb") as index_file:
+                for entry in self.entries:
+                    index_file.write(INDEX_ENTRY_STRUCT.pack(*entry))
+                index_file.flush()
+                os.fsync(index_file.fileno())
+            self.segment = segment
+            self.segment_file = open(self._segment_path(segment), "ab")
+            self.index_file = open(index_path, "ab")
+            self.unsynced = 0
+        logger.warning(f"Block store truncated to {count} blocks")
+
+    def close(self):
+        with self.lock:
+            self._close_maps()
+            if self.segment_file:
+                if self.fsync_policy != "never":
+                    self._fsync()
+                self.segment_file.close()
+                self.index_file.close()
+                self.segment_file = None
+                self.index_file = None
+
+
+def assertion_check():
+    import tempfile
+
+    blocks = [create_sample_block() for _ in range(3)]
+    for block in blocks:
+        block.hash = block.calculate_hash()
+    with tempfile.TemporaryDirectory() as directory:
+        store = BlockStore(directory, segment_size=1)  # a segment per block
+        for block in blocks:
+            store.append(block)
+        store.close()
+
+        store = BlockStore(directory)
+        assert [block.to_dict() for block in store.iter_blocks()] == [block.to_dict() for block in blocks], \
+            REOPEN_ERROR
+        headers = list(store.iter_headers())
+        assert [header.hash for header in headers] == [block.hash for block in blocks], REOPEN_ERROR
+        assert headers[1].get_header().to_dict() == blocks[1].get_header().to_dict(), LAZY_BODY_ERROR
+        assert not headers[1].is_loaded(), LAZY_BODY_ERROR
+        assert headers[1].to_dict() == blocks[1].to_dict() and headers[1].is_loaded(), LAZY_BODY_ERROR
+        store.close()
+
+        # simulate a crash in the middle of appending the last record
+        last_segment = os.path.join(directory, SEGMENT_FILE_FORMAT.format(2))
+        with open(last_segment, "r+b") as segment_file:
+            segment_file.truncate(os.path.getsize(last_segment) - 10)
+        store = BlockStore(directory)
+        assert len(store) == 2 and os.path.getsize(last_segment) == 0, TORN_TAIL_ERROR
+        store.append(blocks[2])
+        store.close()
+
+        # dropping the last blocks removes their records and segments
+        store = BlockStore(directory)
+        store.truncate(1)
+        store.close()
+        store = BlockStore(directory)
+        assert [block.hash for block in store.iter_blocks()] == [blocks[0].hash], TRUNCATE_ERROR
+        assert not os.path.exists(last_segment), TRUNCATE_ERROR
+        store.append(blocks[1])
+        store.append(blocks[2])
+        store.close()
+
+        # a lost index, or one of an older layout, is rebuilt by scanning the segments
+        os.remove(os.path.join(directory, INDEX_FILE_NAME))
+        with open(os.path.join(directory, LEGACY_INDEX_FILE_NAMES[0]), "wb") as legacy_index_file:
+            legacy_index_file.write(bytes(100))
+        store = BlockStore(directory)
+        assert [header.hash for header in store.iter_headers()] == [block.hash for block in blocks], \
+            INDEX_REBUILD_ERROR
+        assert not os.path.exists(os.path.join(directory, LEGACY_INDEX_FILE_NAMES[0])), INDEX_REBUILD_ERROR
+        store.close()
+    print("Block store assertions passed!")
+
+
+if __name__ == "__main__":
+    assertion_check()
@@ -1,10 +1,14 @@
 import hashlib
+import threading
 
+from core.account_state import AccountState
 from core.block import Block, create_sample_block
-from core.transaction import Transaction
+from core.block_store import BlockStore, LazyBlock
+from core.checkpoints import Checkpoint
+from core.transaction import Transaction, get_sk_pk_pair
 from utils.logging_utils import setup_basic_logger
 from utils.config import MinerSettings, BlockChainSettings, KeysSettings
-from utils.keys_manager import load_key
+from utils.keys_manager import load_key, get_public_key_fingerprint
 # Setup logger for file
 logger = setup_basic_logger()
 
@@ -12,6 +16,11 @@ logger = setup_basic_logger()
 GENESIS_BLOCK_ERROR = "Genesis block should be the first block in the chain"
 LATEST_BLOCK_ERROR = "Latest block should match the last block in the chain"
 BLOCKCHAIN_VALIDITY_ERROR = "core should be valid after adding a new block"
+BALANCE_ERROR = "Balance should be the sum of the amounts received"
+BLOCKS_AFTER_ERROR = "Blocks after a hash should be the chain slice after that block"
+TRANSACTION_LOCATION_ERROR = "Indexes should locate blocks and transactions"
+CHECKPOINT_ERROR = "Validation should start after a trusted checkpoint, and full validation should check all"
+LAZY_VALIDATION_ERROR = "Validating a stored chain should not keep the block bodies loaded"
 
 
 class Blockchain:
@@ -25,6 +34,13 @@ class Blockchain:
         Initialize a core instance with a specified mining difficulty and create the genesis block.
         """
         self.chain = [self.create_genesis_block()]
+        # serializes adding and dropping blocks with the threads reading the chain
+        self.lock = threading.RLock()
+        self.block_store = None
+        self.checkpoint = None  # trusted checkpoint, validation of the chain starts after it
+        self.validated_height = 0  # height up to which the chain is known to be valid
+        self.first_invalid_height = None  # height of the first invalid block found by the last validation
+        self.rebuild_indexes()
         logger.info("core created")
 
     def to_dict(self):
@@ -32,10 +48,37 @@ class Blockchain:
             "chain": [block.to_dict() for block in self.chain],
         }
 
+    @classmethod
+    def from_block_store(cls, block_store):
+        """
+        Load a blockchain from a block store, and keep appending its new blocks to the store.
+        Only the block headers are read, the bodies are read from the store when first used.
+        An empty store is initialized with the genesis block.
+        :param block_store: The BlockStore to load from.
+        :return: The loaded blockchain.
+        """
+        blockchain = cls()
+        if len(block_store) == 0:
+            block_store.reset(blockchain.chain)
+        else:
+            blockchain.chain = list(block_store.iter_headers())
+            blockchain.rebuild_indexes()
+        blockchain.block_store = block_store
+        return blockchain
+
+    def attach_block_store(self, block_store):
+        """
+        Replace the contents of a block store with this chain, and keep appending new blocks to it.
+        :param block_store: The BlockStore to write to.
+        """
+        block_store.reset(self.chain)
+        self.block_store = block_store
+
     @classmethod
     def from_dict(cls, data):
         blockchain = cls()
         blockchain.chain = [Block.from_dict(block_data) for block_data in data["chain"]]
+        blockchain.rebuild_indexes()
         return blockchain
 
     def __repr__(self):
@@ -94,36 +137,135 @@ class Blockchain:
             logger.error("Failed to add block: Block is not mined or does not meet the difficulty requirements.")
             return False
 
-        if new_block.previous_hash != self.get_latest_block().hash:
-            logger.error("Failed to add block: block previous hash does not match latest hash")
-            return False
+        with self.lock:
+            if new_block.previous_hash != self.get_latest_block().hash:
+                logger.error("Failed to add block: block previous hash does not match latest hash")
+                return False
 
-        if not new_block.validate_block():
-            logger.error("Failed to add block: Contains invalid transactions.")
-            return False
+            if not new_block.validate_block():
+                logger.error("Failed to add block: Contains invalid transactions.")
+                return False
 
-        self.chain.append(new_block)
+            self.chain.append(new_block)
+            if self.validated_height == len(self.chain) - 2:
+                self.validated_height += 1
+            if self.block_store is not None:
+                self.block_store.append(new_block)
+            self._index_block(new_block, len(self.chain) - 1)
+            if self._transaction_locations is not None:
+                self._index_transactions(new_block, len(self.chain) - 1)
+            if self._account_state is not None:
+                self._account_state.apply_block(new_block)
         logger.info("New block added: %s", new_block)
         return True
 
+    def _index_block(self, block, height):
+        self.height_by_hash[block.hash] = height
+        # a sub-blockchain doesn't contain the parent of its first block, so blocks are also found by their parent
+        self.height_by_previous_hash.setdefault(block.previous_hash, height)
+
+    def _index_transactions(self, block, height):
+        for index, transaction in enumerate(block.transactions):
+            self._transaction_locations[transaction.get_txid()] = (height, index)
+
+    def rebuild_indexes(self):
+        """
+        Rebuild the block indexes after the chain was replaced. They only need the block headers,
+        the transaction index and the account state need every block body, so they are rebuilt on first use.
+        """
+        self.height_by_hash = {}  # block hash -> height
+        self.height_by_previous_hash = {}  # previous hash -> height of the first block pointing to it
+        for height, block in enumerate(self.chain):
+            self._index_block(block, height)
+        self._transaction_locations = None
+        self._account_state = None
+        self.checkpoint = None
+        self.validated_height = 0
+
+    @property
+    def transaction_locations(self):
+        """
+        :return: Dictionary of txid to (height, index in block).
+        """
+        with self.lock:
+            if self._transaction_locations is None:
+                self._transaction_locations = {}
+                for height, block in enumerate(iter_bodies(self.chain)):
+                    self._index_transactions(block, height)
+            return self._transaction_locations
+
+    @property
+    def account_state(self):
+        """
+        :return: The AccountState of the chain, replayed from all the blocks on first use.
+        """
+        with self.lock:
+            if self._account_state is None:
+                self._account_state = AccountState.from_blocks(iter_bodies(self.chain))
+            return self._account_state
+
+    def get_block_height(self, block_hash):
+        """
+        :param block_hash: The hash of a block.
+        :return: The height of the block in the chain, or None if it is not in the chain.
+        """
+        return self.height_by_hash.get(block_hash)
+
+    def get_transaction_location(self, transaction):
+        """
+        :param transaction: A transaction.
+        :return: (block height, index in the block) of the transaction, or None if it is not in the chain.
+        """
+        return self.transaction_locations.get(transaction.get_txid())
+
+    def get_balance(self, fingerprint):
+        """
+        :param fingerprint: Fingerprint of the account's public key.
+        :return: The confirmed balance of the account.
+        """
+        return self.account_state.get_balance(fingerprint)
+
     def get_blocks_after(self, latest_hash):
         """
         Retrieve all blocks from the blockchain starting after the block with the given hash.
         :param latest_hash: The hash of the last known block.
         :return: A list of blocks after the specified hash.
         """
-        blocks = []
-        found = False
+        with self.lock:
+            height = self.height_by_previous_hash.get(latest_hash)
+            if height is not None:
+                return self.chain[height:]
+
+            # the latest block has no blocks after it
+            if latest_hash in self.height_by_hash:
+                return []
 
-        for block in self.chain:
-            if found or block.previous_hash == latest_hash:  # Find the block with the latest_hash
-                found = True
-                blocks.append(block)
+        logger.warning("Hash not found in the blockchain: %s", latest_hash)
+        return []
 
-        if not found:
-            logger.warning("Hash not found in the blockchain: %s", latest_hash)
+    def get_headers_after(self, latest_hash, max_headers):
+        """
+        :param latest_hash: The hash of the last known block.
+        :param max_headers: Maximum number of headers to return.
+        :return: Headers of the blocks following the given hash, or None if the hash is not in the chain.
+        """
+        with self.lock:
+            height = self.height_by_hash.get(latest_hash)
+            if height is None:
+                return None
+            return [block.get_header() for block in self.chain[height + 1:height + 1 + max_headers]]
 
-        return blocks
+    def get_block_range(self, start_hash, count):
+        """
+        :param start_hash: The hash of the block preceding the range.
+        :param count: Maximum number of blocks to return.
+        :return: Blocks following the given hash, or None if the hash is not in the chain.
+        """
+        with self.lock:
+            height = self.height_by_hash.get(start_hash)
+            if height is None:
+                return None
+            return self.chain[height + 1:height + 1 + count]
 
     def create_sub_blockchain(self, latest_hash):
         """
@@ -133,40 +275,160 @@ class Blockchain:
         """
         new_blockchain = Blockchain()
         new_blockchain.chain.extend(self.get_blocks_after(latest_hash))  # Add subsequent blocks
+        new_blockchain.rebuild_indexes()
 
         logger.info("Created a sub-blockchain with %d blocks starting after hash: %s",
                     len(new_blockchain.chain) - 1, latest_hash)
 
         return new_blockchain
 
-    def is_chain_valid(self):
+    def create_checkpoint(self, private_key):
+        """
+        Create a signed checkpoint of the validated part of the chain.
+        :param private_key: The node's private key.
+        :return: The checkpoint, or None if no block after the genesis block was validated
+        """
+        height = self.validated_height
+        if height == 0:
+            return None
+        blocks = self.chain[:height + 1]
+        if height == len(self.chain) - 1:
+            state_digest = self.account_state.get_digest()
+        else:
+            state_digest = AccountState.from_blocks(iter_bodies(blocks)).get_digest()
+        checkpoint = Checkpoint(height, blocks[-1].hash, state_digest)
+        checkpoint.sign(private_key)
+        logger.info("Created %s", checkpoint)
+        return checkpoint
+
+    def set_checkpoint(self, checkpoint):
+        """
+        Trust a checkpoint of this chain, so validation starts after it.
+        :param checkpoint: A checkpoint with a verified signature.
+        :return: True if the checkpoint matches the chain
+        """
+        if checkpoint.height >= len(self.chain) or self.chain[checkpoint.height].hash != checkpoint.block_hash:
+            logger.warning("Checkpoint does not match the chain: %s", checkpoint)
+            return False
+        self.checkpoint = checkpoint
+        self.validated_height = max(self.validated_height, checkpoint.height)
+        return True
+
+    def is_chain_valid(self, full=False):
         """
         Check the validity of the blockchain by ensuring each block's hash is correct and that each block points
         to the correct previous block, while also validating each block's transactions.
+        With a trusted checkpoint, only the blocks after it are checked, unless `full` is set.
+        A full validation also checks the account state at the checkpoint against its digest.
+        Stored block bodies are read for the check only, so validating doesn't keep the whole chain in memory.
 
+        :param full: Validate the whole chain from the genesis block.
         :return: True if the blockchain is valid; otherwise, False.
+                 On an invalid block its height is kept in `first_invalid_height`,
+                 it stays None when only the account state digest does not match.
         """
-        for i in range(1, len(self.chain)):
-            current_block = self.chain[i]
-            previous_block = self.chain[i - 1]
+        valid, first_invalid_height = self._validate(full)
+        with self.lock:
+            self.first_invalid_height = first_invalid_height
+        return valid
 
-            # Check if the current block's hash is valid
-            if current_block.hash != current_block.calculate_hash():
+    def _validate(self, full):
+        """
+        Validate a snapshot of the chain, see is_chain_valid.
+        :return: (True if the chain is valid, height of the first invalid block or None)
+        """
+        with self.lock:
+            chain = self.chain[:]  # the chain may change while a background validation runs
+            checkpoint = self.checkpoint
+        start = 1 if full or checkpoint is None else checkpoint.height + 1
+        # the account state at the checkpoint is replayed along the validation
+        check_state = full and checkpoint is not None
+        account_state = AccountState.from_blocks(iter_bodies(chain[:1])) if check_state else None
+
+        for i, current_block in enumerate(iter_bodies(chain[start:]), start):
+            previous_block = chain[i - 1]
+
+            # Check if the block's hash is valid, and is the hash the chain links it by
+            if chain[i].hash != current_block.calculate_hash():
                 logger.warning("Block hash mismatch at index %d", i)
-                return False
+                return False, i
 
             # Check if the previous hash is correctly set
             if current_block.previous_hash != previous_block.hash:
                 logger.warning("Previous hash mismatch at index %d", i)
-                return False
+                return False, i
 
             # Validate transactions within the block
             if not current_block.validate_block():
                 logger.warning("Block validation failed due to invalid transaction at index %d", i)
-                return False
+                return False, i
 
-        logger.info("core validation succeeded.")
-        return True
+            if check_state and i <= checkpoint.height:
+                account_state.apply_block(current_block)
+
+        if check_state:
+            if account_state.get_digest() != checkpoint.state_digest:
+                logger.warning("Account state does not match the digest of %s", checkpoint)
+                return False, None
+
+        with self.lock:
+            # unless the validated blocks were dropped meanwhile
+            if len(self.chain) >= len(chain) and self.chain[len(chain) - 1] is chain[-1]:
+                self.validated_height = max(self.validated_height, len(chain) - 1)
+        logger.info("core validation succeeded from height %d.", start)
+        return True, None
+
+    def truncate(self, height):
+        """
+        Drop the blocks after `height`, used when they turn out invalid.
+        :param height: Height of the last block to keep, the blocks up to it are known to be valid.
+        :return: List of the dropped blocks, with their transactions
+        """
+        with self.lock:
+            if height >= len(self.chain) - 1:
+                return []
+            logger.warning("Dropping %d blocks after height %d", len(self.chain) - 1 - height, height)
+            # the bodies are read before their records are removed from the block store
+            dropped = []
+            for block in self.chain[height + 1:]:
+                try:
+                    dropped.append(block.read_body() if isinstance(block, LazyBlock) else block)
+                except ValueError as e:
+                    logger.warning("Could not read the dropped block %s: %s", block.hash, e)
+            self.chain = self.chain[:height + 1]
+            self.rebuild_indexes()
+            self.validated_height = height
+            if self.block_store is not None:
+                self.block_store.truncate(height + 1)
+        return dropped
+
+    def validate_in_background(self, on_done=None):
+        """
+        Fully revalidate the chain in a background thread.
+        :param on_done: Optional callable receiving the validation result,
+                        and the height of the first invalid block or None.
+        :return: The validation thread
+        """
+        def validate():
+            valid, first_invalid_height = self._validate(full=True)
+            if not valid:
+                logger.error("Background revalidation of the chain failed")
+            if on_done:
+                on_done(valid, first_invalid_height)
+
+        thread = threading.Thread(target=validate, daemon=True)
+        thread.start()
+        return thread
+
+
+def iter_bodies(blocks):
+    """
+    :param blocks: Iterable of blocks, in chain order.
+    :return: Iterator of the blocks with their transactions, stored blocks whose bodies aren't loaded
+             are read without keeping the bodies.
+    """
+    for block in blocks:
+        yield block.read_body() if isinstance(block, LazyBlock) else block
 
 
 def assertion_check():
@@ -179,6 +441,59 @@ def assertion_check():
     # Add mined block to the blockchain and validate the chain's integrity
     assert blockchain.is_chain_valid(), BLOCKCHAIN_VALIDITY_ERROR
 
+    recipient_pk = get_sk_pk_pair()[1]
+    blockchain = create_sample_blockchain(blocks_num=1, transactions_nums=[2], transactions_ranges=[[10, 20]],
+                                          recipient_pk=recipient_pk)
+    assert blockchain.get_balance(get_public_key_fingerprint(recipient_pk)) == 30, BALANCE_ERROR
+    restored = Blockchain.from_dict(blockchain.to_dict())
+    assert restored.account_state.accounts == blockchain.account_state.accounts, BALANCE_ERROR
+
+    # Check the block and transaction indexes
+    genesis_hash = blockchain.chain[0].hash
+    assert blockchain.get_blocks_after(BlockChainSettings.GENESYS_PREVIEWS_HASH) == blockchain.chain, BLOCKS_AFTER_ERROR
+    assert blockchain.get_blocks_after(genesis_hash) == blockchain.chain[1:], BLOCKS_AFTER_ERROR
+    assert blockchain.get_blocks_after(blockchain.get_latest_block().hash) == [], BLOCKS_AFTER_ERROR
+    assert blockchain.get_blocks_after("f" * 64) == [], BLOCKS_AFTER_ERROR
+    sub_blockchain = restored.create_sub_blockchain(genesis_hash)
+    assert sub_blockchain.get_blocks_after(genesis_hash) == sub_blockchain.chain[1:], BLOCKS_AFTER_ERROR
+    transaction = blockchain.chain[1].transactions[2]
+    assert blockchain.get_transaction_location(transaction) == (1, 2), TRANSACTION_LOCATION_ERROR
+    assert restored.get_block_height(blockchain.get_latest_block().hash) == 1, TRANSACTION_LOCATION_ERROR
+
+    # Check serving ranges of headers and blocks
+    genesis_hash = blockchain.chain[0].hash
+    headers = blockchain.get_headers_after(genesis_hash, 1)
+    assert [header.hash for header in headers] == [blockchain.chain[1].hash], BLOCKS_AFTER_ERROR
+    assert blockchain.get_block_range(genesis_hash, 5) == blockchain.chain[1:], BLOCKS_AFTER_ERROR
+    assert blockchain.get_block_range("f" * 64, 5) is None, BLOCKS_AFTER_ERROR
+
+    # Check validation from a checkpoint
+    sk, pk = get_sk_pk_pair()
+    blockchain = create_sample_blockchain()
+    checkpoint = blockchain.create_checkpoint(sk)
+    assert checkpoint.height == 2 and checkpoint.verify(pk), CHECKPOINT_ERROR
+    restored = Blockchain.from_dict(blockchain.to_dict())
+    assert restored.validated_height == 0 and restored.set_checkpoint(checkpoint), CHECKPOINT_ERROR
+    restored.chain[1].transactions[1].amount += 1  # not revalidated below the checkpoint
+    assert restored.is_chain_valid(), CHECKPOINT_ERROR
+    results = []
+    restored.validate_in_background(lambda *result: results.append(result)).join()
+    assert results == [(False, 1)] and restored.first_invalid_height is None, CHECKPOINT_ERROR
+    dropped = restored.truncate(results[0][1] - 1)
+    assert [block.hash for block in dropped] == [block.hash for block in blockchain.chain[1:]], CHECKPOINT_ERROR
+    assert len(restored.chain) == 1 and restored.is_chain_valid(full=True), CHECKPOINT_ERROR
+
+    # Check that validating a stored chain reads the bodies without keeping them
+    import tempfile
+    with tempfile.TemporaryDirectory() as directory:
+        store = BlockStore(directory)
+        create_sample_blockchain().attach_block_store(store)
+        stored = Blockchain.from_block_store(store)
+        assert stored.is_chain_valid(full=True), LAZY_VALIDATION_ERROR
+        assert stored.get_balance(get_public_key_fingerprint(recipient_pk)) == 0, LAZY_VALIDATION_ERROR
+        assert not any(block.is_loaded() for block in stored.chain), LAZY_VALIDATION_ERROR
+        store.close()
+
     logger.info("All assertions passed for core class.")
 
 
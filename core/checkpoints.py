@@ -0,0 +1,153 @@
+import json
+import os
+
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import padding
+
+from core.transaction import get_sk_pk_pair
+from utils.config import CheckpointSettings
+from utils.logging_utils import setup_basic_logger
+
+# Setup logger for file
+logger = setup_basic_logger()
+
+# Constants for assertion error messages
+SIGNATURE_ERROR = "Checkpoint should verify only with the signer's key"
+STORE_ERROR = "Checkpoint store should keep the latest checkpoints"
+
+
+class Checkpoint:
+    """
+    A signed statement that the chain up to `height` was validated, ending with the block `block_hash`
+    and leading to the account state with digest `state_digest`.
+    """
+
+    def __init__(self, height, block_hash, state_digest, signature=None):
+        """
+        :param height: Height of the last validated block.
+        :param block_hash: Hash of that block.
+        :param state_digest: AccountState digest (bytes) after that block.
+        :param signature: Signature of the checkpoint, None until signed.
+        """
+        self.height = height
+        self.block_hash = block_hash
+        self.state_digest = state_digest
+        self.signature = signature
+
+    def to_dict(self):
+        return {
+            "height": self.height,
+            "block_hash": self.block_hash,
+            "state_digest": self.state_digest.hex(),
+            "signature": self.signature.hex() if self.signature else None,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        signature = bytes.fromhex(data["signature"]) if data["signature"] else None
+        return cls(data["height"], data["block_hash"], bytes.fromhex(data["state_digest"]), signature)
+
+    def __repr__(self):
+        return f"Checkpoint(Height: {self.height}, Hash: {self.block_hash[:6]}...)"
+
+    def get_signed_data(self):
+        return f"{self.height}|{self.block_hash}|{self.state_digest.hex()}".encode()
+
+    def sign(self, private_key):
+        self.signature = private_key.sign(
+            self.get_signed_data(),
+            padding.PSS(mgf=padding.MGF1(hashes.SHA256()), salt_length=padding.PSS.MAX_LENGTH),
+            hashes.SHA256()
+        )
+
+    def verify(self, public_key):
+        """
+        :param public_key: Public key of the node that signed the checkpoint.
+        :return: True if the checkpoint is signed by that key.
+        """
+        if not self.signature:
+            return False
+        try:
+            public_key.verify(
+                self.signature,
+                self.get_signed_data(),
+                padding.PSS(mgf=padding.MGF1(hashes.SHA256()), salt_length=padding.PSS.MAX_LENGTH),
+                hashes.SHA256()
+            )
+            return True
+        except InvalidSignature:
+            return False
+
+
+class CheckpointStore:
+    """
+    The latest checkpoints of a node, kept in a JSON file next to its chain.
+    The file is replaced atomically, so a crash never leaves a partially written file.
+    """
+
+    def __init__(self, path, kept=CheckpointSettings.KEPT):
+        self.path = path
+        self.kept = kept
+        self.checkpoints = []
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            try:
+                with open(path, "r") as f:
+                    self.checkpoints = [Checkpoint.from_dict(data) for data in json.load(f)]
+            except Exception as e:
+                logger.error(f"Error loading checkpoints from {path}: {e}")
+
+    def add(self, checkpoint):
+        self.checkpoints.append(checkpoint)
+        self.checkpoints = self.checkpoints[-self.kept:]
+        self.save()
+
+    def clear(self):
+        self.checkpoints = []
+        self.save()
+
+    def save(self):
+        temporary_path = self.path + ".tmp"
+        with open(temporary_path, "w") as f:
+            json.dump([checkpoint.to_dict() for checkpoint in self.checkpoints], f, indent=4)
+        os.replace(temporary_path, self.path)
+
+    def get_latest(self, public_key):
+        """
+        :param public_key: Public key the checkpoint must be signed with.
+        :return: The latest checkpoint signed with the key, or None.
+        """
+        for checkpoint in reversed(self.checkpoints):
+            if checkpoint.verify(public_key):
+                return checkpoint
+            logger.warning(f"Ignoring checkpoint with an invalid signature: {checkpoint}")
+        return None
+
+
+def assertion_check():
+    import tempfile
+
+    sk, pk = get_sk_pk_pair()
+    other_pk = get_sk_pk_pair()[1]
+    checkpoint = Checkpoint(5, "ab" * 32, bytes(32))
+    checkpoint.sign(sk)
+    assert checkpoint.verify(pk) and not checkpoint.verify(other_pk), SIGNATURE_ERROR
+    checkpoint.height += 1
+    assert not checkpoint.verify(pk), SIGNATURE_ERROR
+    checkpoint.height -= 1
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "checkpoints.json")
+        store = CheckpointStore(path, kept=2)
+        for height in (5, 6, 7):
+            new_checkpoint = Checkpoint(height, "ab" * 32, bytes(32))
+            new_checkpoint.sign(sk)
+            store.add(new_checkpoint)
+        loaded = CheckpointStore(path)
+        assert [cp.height for cp in loaded.checkpoints] == [6, 7], STORE_ERROR
+        assert loaded.get_latest(pk).height == 7 and loaded.get_latest(other_pk) is None, STORE_ERROR
+    print("Checkpoint assertions passed!")
+
+
+if __name__ == "__main__":
+    assertion_check()
@@ -0,0 +1,108 @@
+import hashlib
+
+EMPTY_ROOT = bytes(32)
+
+# Constants for assertion error messages
+PROOF_VALID_ERROR = "Proof of an included leaf should verify"
+PROOF_INVALID_ERROR = "Proof should not verify a different leaf"
+ROOT_MISMATCH_ERROR = "Tree root should match compute_merkle_root"
+
+
+def hash_pair(left, right):
+    """
+    Hash two child nodes into their parent node.
+    :param left: Left child hash (bytes).
+    :param right: Right child hash (bytes).
+    :return: The parent hash (bytes).
+    """
+    return hashlib.sha256(left + right).digest()
+
+
+class MerkleTree:
+    """
+    A binary Merkle tree over 32 byte leaf hashes. An odd node at the end of a level is paired with itself.
+    All the levels are kept, so inclusion proofs are read straight from the tree.
+    """
+
+    def __init__(self, leaves):
+        """
+        :param leaves: List of 32 byte leaf hashes.
+        """
+        self.levels = [list(leaves)]
+        while len(self.levels[-1]) > 1:
+            level = self.levels[-1]
+            parents = []
+            for i in range(0, len(level), 2):
+                right = level[i + 1] if i + 1 < len(level) else level[i]
+                parents.append(hash_pair(level[i], right))
+            self.levels.append(parents)
+
+    @property
+    def root(self):
+        """
+        :return: The 32 byte root, or EMPTY_ROOT if there are no leaves.
+        """
+        if not self.levels[0]:
+            return EMPTY_ROOT
+        return self.levels[-1][0]
+
+    def __len__(self):
+        return len(self.levels[0])
+
+    def get_proof(self, index):
+        """
+        Build the inclusion proof of a leaf: its sibling at every level, from the bottom up.
+        :param index: Index of the leaf.
+        :return: List of (sibling hash, True if the sibling is on the left) pairs.
+        """
+        if not 0 <= index < len(self):
+            raise IndexError(f"Leaf index {index} out of range for a tree of {len(self)} leaves")
+        proof = []
+        for level in self.levels[:-1]:
+            if index % 2 == 0:
+                sibling = level[index + 1] if index + 1 < len(level) else level[index]
+                proof.append((sibling, False))
+            else:
+                proof.append((level[index - 1], True))
+            index //= 2
+        return proof
+
+
+def verify_merkle_proof(leaf, proof, root):
+    """
+    Check that a leaf is included under a Merkle root.
+    :param leaf: The 32 byte leaf hash.
+    :param proof: Proof from MerkleTree.get_proof.
+    :param root: The expected 32 byte root.
+    :return: True if the proof leads from the leaf to the root.
+    """
+    node = leaf
+    for sibling, sibling_is_left in proof:
+        node = hash_pair(sibling, node) if sibling_is_left else hash_pair(node, sibling)
+    return node == root
+
+
+def compute_merkle_root(leaves):
+    """
+    Compute the Merkle root of a list of leaf hashes.
+    :param leaves: List of 32 byte leaf hashes.
+    :return: The 32 byte root, or EMPTY_ROOT if there are no leaves.
+    """
+    return MerkleTree(leaves).root
+
+
+def assertion_check():
+    for leaves_num in range(1, 10):
+        leaves = [hashlib.sha256(str(i).encode()).digest() for i in range(leaves_num)]
+        tree = MerkleTree(leaves)
+        assert tree.root == compute_merkle_root(leaves), ROOT_MISMATCH_ERROR
+        for index, leaf in enumerate(leaves):
+            proof = tree.get_proof(index)
+            assert verify_merkle_proof(leaf, proof, tree.root), PROOF_VALID_ERROR
+            assert not verify_merkle_proof(bytes(32), proof, tree.root), PROOF_INVALID_ERROR
+    assert MerkleTree([]).root == EMPTY_ROOT, ROOT_MISMATCH_ERROR
+    print("All Merkle tree assertions passed!")
+
+
+if __name__ == "__main__":
+    assertion_check()
@@ -0,0 +1,84 @@
+import threading
+from collections import OrderedDict
+
+from utils.config import TransactionSettings
+
+
+class SignatureCache:
+    """
+    A bounded, thread safe LRU cache of signature verification results.
+    Keys are (txid, signature, public key fingerprint), so a cached result can only be reused
+    for exactly the same signed contents, signature and signer.
+    """
+
+    def __init__(self, max_size=TransactionSettings.SIGNATURE_CACHE_SIZE):
+        self.max_size = max_size
+        self.results = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """
+        :param key: The (txid, signature, fingerprint) key.
+        :return: The cached verification result, or None if it is not cached.
+        """
+        with self.lock:
+            result = self.results.get(key)
+            if result is None:
+                self.misses += 1
+                return None
+            self.results.move_to_end(key)
+            self.hits += 1
+            return result
+
+    def put(self, key, result):
+        """
+        Store a verification result, evicting the least recently used results if the cache is full.
+        """
+        with self.lock:
+            self.results[key] = result
+            self.results.move_to_end(key)
+            while len(self.results) > self.max_size:
+                self.results.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.results.clear()
+
+    def get_stats(self):
+        """
+        :return: Dictionary with the cache size, hits, misses, evictions and hit ratio.
+        """
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.results),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+
+# process wide cache used by Transaction.verify_signature
+signature_cache = SignatureCache()
+
+
+def assertion_check():
+    cache = SignatureCache(max_size=2)
+    cache.put("a", True)
+    cache.put("b", False)
+    assert cache.get("a") is True, "Cached result should be returned"
+    cache.put("c", True)  # evicts "b", the least recently used
+    assert cache.get("b") is None and cache.get("c") is True, "Least recently used result should be evicted"
+    stats = cache.get_stats()
+    assert stats["hits"] == 2 and stats["misses"] == 1 and stats["evictions"] == 1, "Wrong cache counters"
+    print("Signature cache assertions passed!")
+
+
+if __name__ == "__main__":
+    assertion_check()
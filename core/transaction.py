@@ -1,10 +1,11 @@
 import hashlib
-import json
 import random
 
 from cryptography.hazmat.primitives.asymmetric import rsa, padding
 from cryptography.hazmat.primitives import hashes, serialization
 from cryptography.exceptions import InvalidSignature
+from core.signature_cache import signature_cache
+from utils.keys_manager import get_pem_fingerprint
 from utils.logging_utils import setup_basic_logger
 
 # Setup logger for file
@@ -15,6 +16,11 @@ HASH_LENGTH_ERROR = "Hash length should be 64 characters"
 SIGNATURE_CREATION_ERROR = "Signature should be created after signing"
 VERIFICATION_SUCCESS_ERROR = "Verification should succeed with correct public key"
 VERIFICATION_FAIL_ERROR = "Verification should fail with incorrect public key"
+SIGNATURE_CACHE_ERROR = "Repeated verification should hit the signature cache"
+IDENTITY_ERROR = "Transactions should be equal only when contents and signature match"
+
+# fields covered by the signature, changing them changes both the signed hash and the transaction id
+SIGNED_FIELDS = ("sender_pk", "recipient_pk", "amount", "tip")
 
 
 class Transaction:
@@ -30,6 +36,14 @@ class Transaction:
         :param recipient_pk: RSA public key object representing the recipient's public key.
         :param amount: The amount of currency to be transferred.
         """
+        # cached encodings and hashes, see __setattr__
+        self._sender_pem = None
+        self._recipient_pem = None
+        self._sender_fingerprint = None
+        self._recipient_fingerprint = None
+        self._signing_hash = None
+        self._txid = None
+
         self.sender_pk = sender_pk
         self.recipient_pk = recipient_pk
         self.amount = amount
@@ -41,16 +55,70 @@ class Transaction:
                     self.amount,
                     self.tip)
 
+    def __setattr__(self, name, value):
+        """
+        Drop the cached hashes whenever a field they depend on changes.
+        """
+        super().__setattr__(name, value)
+        if name in SIGNED_FIELDS:
+            super().__setattr__("_signing_hash", None)
+            super().__setattr__("_txid", None)
+            if name == "sender_pk":
+                super().__setattr__("_sender_pem", None)
+                super().__setattr__("_sender_fingerprint", None)
+            elif name == "recipient_pk":
+                super().__setattr__("_recipient_pem", None)
+                super().__setattr__("_recipient_fingerprint", None)
+        elif name == "signature":
+            super().__setattr__("_txid", None)
+
+    def get_sender_pem(self):
+        if self._sender_pem is None:
+            self._sender_pem = get_public_key_pem(self.sender_pk)
+        return self._sender_pem
+
+    def get_recipient_pem(self):
+        if self._recipient_pem is None:
+            self._recipient_pem = get_public_key_pem(self.recipient_pk)
+        return self._recipient_pem
+
+    def get_sender_fingerprint(self):
+        """
+        :return: SHA-256 digest of the sender's PEM encoded public key.
+        """
+        if self._sender_fingerprint is None:
+            self._sender_fingerprint = get_pem_fingerprint(self.get_sender_pem())
+        return self._sender_fingerprint
+
+    def get_recipient_fingerprint(self):
+        """
+        :return: SHA-256 digest of the recipient's PEM encoded public key.
+        """
+        if self._recipient_fingerprint is None:
+            self._recipient_fingerprint = get_pem_fingerprint(self.get_recipient_pem())
+        return self._recipient_fingerprint
+
+    def get_signature_cache_key(self):
+        """
+        :return: The key of this transaction's verification result in the signature cache.
+        """
+        return self.get_txid(), self.signature, self.get_sender_fingerprint()
+
+    def get_txid(self):
+        """
+        The transaction id: a hash of the signed contents and the signature.
+        It is computed once and cached until one of the fields changes.
+
+        :return: The 32 byte transaction id.
+        """
+        if self._txid is None:
+            self._txid = hashlib.sha256(bytes.fromhex(self.calculate_hash()) + (self.signature or b"")).digest()
+        return self._txid
+
     def to_dict(self):
         return {
-            "sender_pk": self.sender_pk.public_bytes(
-                encoding=serialization.Encoding.PEM,
-                format=serialization.PublicFormat.SubjectPublicKeyInfo
-            ).decode(),
-            "recipient_pk": self.recipient_pk.public_bytes(
-                encoding=serialization.Encoding.PEM,
-                format=serialization.PublicFormat.SubjectPublicKeyInfo
-            ).decode(),
+            "sender_pk": self.get_sender_pem().decode(),
+            "recipient_pk": self.get_recipient_pem().decode(),
             "amount": self.amount,
             "tip": self.tip,
             "signature": self.signature.hex() if self.signature else None,
@@ -65,20 +133,17 @@ class Transaction:
 
     def __hash__(self):
         """
-        Hash the transaction based on its dictionary representation.
+        Hash the transaction based on its cached transaction id.
         """
-        transaction_dict = self.to_dict()
-        # Convert the dictionary to a JSON string for consistent hashing
-        transaction_json = json.dumps(transaction_dict, sort_keys=True)
-        return hash(hashlib.sha256(transaction_json.encode()).hexdigest())
+        return hash(self.get_txid())
 
     def __eq__(self, other):
         """
-        Compare transactions based on their dictionary representations.
+        Compare transactions based on their transaction ids.
         """
         if not isinstance(other, Transaction):
             return False
-        return self.to_dict() == other.to_dict()
+        return self.get_txid() == other.get_txid()
 
     def __repr__(self):
         """
@@ -94,25 +159,21 @@ class Transaction:
 
     def calculate_hash(self):
         """
-        Calculate an SHA-256 hash of the transaction contents.
+        Calculate an SHA-256 hash of the transaction contents (this is the signed data).
+        The hash is cached until one of the contents changes.
 
         :return: Hash string representing the transaction.
         """
-        sender_pk_str = self.sender_pk.public_bytes(
-            encoding=serialization.Encoding.PEM,
-            format=serialization.PublicFormat.SubjectPublicKeyInfo
-        )
-        recipient_pk_str = self.recipient_pk.public_bytes(
-            encoding=serialization.Encoding.PEM,
-            format=serialization.PublicFormat.SubjectPublicKeyInfo
-        )
+        if self._signing_hash is not None:
+            return self._signing_hash
+
         data = (
-            f"{sender_pk_str}"
-            f"{recipient_pk_str}"
+            f"{self.get_sender_pem()}"
+            f"{self.get_recipient_pem()}"
             f"{self.amount}"
             f"{self.tip}")
         transaction_hash = hashlib.sha256(data.encode()).hexdigest()
-        logger.debug("Transaction hash calculated: %s", transaction_hash[:5] + "...")
+        self._signing_hash = transaction_hash
         return transaction_hash
 
     def sign_transaction(self, private_key):
@@ -138,6 +199,7 @@ class Transaction:
     def verify_signature(self):
         """
         Verify the transaction's signature using the sender's public key.
+        Results are kept in the process wide signature cache, so a transaction is only verified once.
 
         :return: True if the signature is valid, False otherwise.
         """
@@ -145,6 +207,11 @@ class Transaction:
             logger.error("Verification failed: No signature present in transaction.")
             raise ValueError("No signature in this transaction.")
 
+        cache_key = self.get_signature_cache_key()
+        cached_result = signature_cache.get(cache_key)
+        if cached_result is not None:
+            return cached_result
+
         hash_value = self.calculate_hash().encode()
         try:
             self.sender_pk.verify(
@@ -154,10 +221,23 @@ class Transaction:
                 hashes.SHA256()
             )
             logger.debug("Signature verification succeeded")
-            return True
+            verified = True
         except InvalidSignature:
             logger.debug("Signature verification failed")
-            return False
+            verified = False
+        signature_cache.put(cache_key, verified)
+        return verified
+
+
+def get_public_key_pem(public_key):
+    """
+    :param public_key: RSA public key object.
+    :return: The PEM encoded key bytes.
+    """
+    return public_key.public_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PublicFormat.SubjectPublicKeyInfo
+    )
 
 
 def get_sk_pk_pair():
@@ -184,9 +264,20 @@ def assert_transaction():
     # Verify the signature - should return True with correct public key
     assert transaction.verify_signature(), VERIFICATION_SUCCESS_ERROR
 
+    # Verifying again should be answered by the signature cache
+    hits = signature_cache.get_stats()["hits"]
+    assert transaction.verify_signature(), VERIFICATION_SUCCESS_ERROR
+    assert signature_cache.get_stats()["hits"] == hits + 1, SIGNATURE_CACHE_ERROR
+
+    # A copy is equal, and lands in the same set bucket
+    copy = Transaction.from_dict(transaction.to_dict())
+    assert copy == transaction and hash(copy) == hash(transaction), IDENTITY_ERROR
+    assert copy in {transaction}, IDENTITY_ERROR
+
     # Modify the amount and check that verification fails
     transaction.amount = 20
     assert not transaction.verify_signature(), VERIFICATION_FAIL_ERROR
+    assert copy != transaction, IDENTITY_ERROR
 
     logger.info("All assertions passed for Transaction class.")
 
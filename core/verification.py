@@ -0,0 +1,133 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from core.signature_cache import signature_cache
+from core.transaction import Transaction, create_sample_transaction
+from utils.config import VerificationSettings
+from utils.logging_utils import setup_basic_logger
+
+logger = setup_basic_logger()
+
+# Constants for assertion error messages
+VALID_BATCH_ERROR = "A batch of valid transactions should have no failing index"
+INVALID_INDEX_ERROR = "The first failing transaction index should be returned"
+
+
+class TransactionVerifier:
+    """
+    Verifies the signatures of many transactions in parallel.
+    Uses a thread pool by default (the RSA verification in `cryptography` releases the GIL),
+    or a process pool, which gets the transactions as dictionaries since key objects can't be pickled.
+    """
+
+    def __init__(self, workers=VerificationSettings.WORKERS, executor_type=VerificationSettings.EXECUTOR):
+        """
+        :param workers: Number of verification workers, None for the number of CPUs.
+        :param executor_type: "thread" or "process".
+        """
+        if executor_type not in ("thread", "process"):
+            raise ValueError(f"Unknown verification executor type '{executor_type}'")
+        self.workers = workers or os.cpu_count() or 1
+        self.executor_type = executor_type
+        self.executor = None
+        self.executor_lock = threading.Lock()
+
+    def _get_executor(self):
+        with self.executor_lock:
+            if self.executor is None:
+                if self.executor_type == "process":
+                    self.executor = ProcessPoolExecutor(max_workers=self.workers)
+                else:
+                    self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="verifier")
+            return self.executor
+
+    def shutdown(self):
+        with self.executor_lock:
+            if self.executor is not None:
+                self.executor.shutdown(wait=True)
+                self.executor = None
+
+    def verify_all(self, transactions):
+        """
+        Verify the signatures of all the transactions.
+        :param transactions: List of Transaction objects.
+        :return: List of booleans, one per transaction.
+        """
+        if len(transactions) < VerificationSettings.MIN_PARALLEL_BATCH or self.workers == 1:
+            return [_verify_transaction(tx) for tx in transactions]
+
+        if self.executor_type == "thread":
+            return list(self._get_executor().map(_verify_transaction, transactions))
+
+        # only ship transactions that are not already in this process' signature cache
+        results = [signature_cache.get(tx.get_signature_cache_key()) if tx.signature else False
+                   for tx in transactions]
+        pending = [index for index, result in enumerate(results) if result is None]
+        pending_dicts = [transactions[index].to_dict() for index in pending]
+        chunk_size = max(1, len(pending_dicts) // (self.workers * 4))
+        for index, result in zip(pending, self._get_executor().map(
+                _verify_transaction_dict, pending_dicts, chunksize=chunk_size)):
+            results[index] = result
+            if transactions[index].signature:
+                signature_cache.put(transactions[index].get_signature_cache_key(), result)
+        return results
+
+    def find_invalid(self, transactions):
+        """
+        Verify the signatures of all the transactions.
+        :param transactions: List of Transaction objects.
+        :return: Index of the first transaction with an invalid signature, or None if all are valid.
+        """
+        for index, verified in enumerate(self.verify_all(transactions)):
+            if not verified:
+                return index
+        return None
+
+
+def _verify_transaction(transaction):
+    try:
+        return transaction.verify_signature()
+    except ValueError as e:
+        logger.warning(f"Failed to verify transaction {transaction}: {e}")
+        return False
+
+
+def _verify_transaction_dict(transaction_dict):
+    return _verify_transaction(Transaction.from_dict(transaction_dict))
+
+
+_verifier = None
+_verifier_lock = threading.Lock()
+
+
+def get_verifier():
+    """
+    :return: The process wide TransactionVerifier, created on first use from VerificationSettings.
+    """
+    global _verifier
+    with _verifier_lock:
+        if _verifier is None:
+            _verifier = TransactionVerifier()
+        return _verifier
+
+
+def assertion_check():
+    transactions = [create_sample_transaction(10) for _ in range(12)]
+    for executor_type in ("thread", "process"):
+        signature_cache.clear()
+        verifier = TransactionVerifier(workers=4, executor_type=executor_type)
+        assert verifier.find_invalid(transactions) is None, VALID_BATCH_ERROR
+        verifier.shutdown()
+
+    transactions[5].amount += 1  # breaks the signature
+    transactions[9].amount += 1
+    signature_cache.clear()
+    verifier = TransactionVerifier(workers=4, executor_type="process")
+    assert verifier.find_invalid(transactions) == 5, INVALID_INDEX_ERROR
+    verifier.shutdown()
+    print("Transaction verifier assertions passed!")
+
+
+if __name__ == "__main__":
+    assertion_check()
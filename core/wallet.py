@@ -1,6 +1,6 @@
 from cryptography.hazmat.primitives import serialization
 from network.miner.action import Action
-from utils.keys_manager import load_key
+from utils.keys_manager import get_key_fingerprint, get_public_key_fingerprint
 from utils.logging_utils import configure_logger
 from utils.config import BlockChainSettings, KeysSettings, ActionStatus, ActionType, ActionSettings, NodeSettings
 from core.transaction import Transaction, get_sk_pk_pair, create_sample_transaction
@@ -19,8 +19,10 @@ class Wallet:
     """
     def __init__(self, owner_pk, balance=0, actions=None, latest_hash=None, instance_id=None, child_dir="wallet", name=NodeSettings.DEFAULT_NAME):
         self.owner_pk = owner_pk
+        self.owner_fingerprint = get_public_key_fingerprint(owner_pk)
         self.balance = balance
         self.actions = actions or {}
+        self.changed_actions = set()  # ids of actions added or updated since the wallet was last saved
         self.latest_hash = latest_hash if latest_hash else BlockChainSettings.GENESYS_HASH
         self.instance_id = instance_id
         self.wallet_logger = configure_logger(
@@ -41,6 +43,7 @@ class Wallet:
             name
         )
         self.actions[action.id] = action
+        self.changed_actions.add(action.id)
         if name:
             self.wallet_logger.info(f"Added pending transaction with name {name}")
 
@@ -53,10 +56,12 @@ class Wallet:
         """
 
         # add or subtract transaction from balance
-        if transaction.sender_pk == self.owner_pk:
+        sender_fingerprint = transaction.get_sender_fingerprint()
+        recipient_fingerprint = transaction.get_recipient_fingerprint()
+        if sender_fingerprint == self.owner_fingerprint:
             self.balance -= transaction.amount
             addision = False
-        elif transaction.recipient_pk == self.owner_pk:
+        elif recipient_fingerprint == self.owner_fingerprint:
             self.balance += transaction.amount
             addision = True
 
@@ -68,26 +73,25 @@ class Wallet:
         if transaction_id in self.actions:
             action = self.actions[transaction_id]
             self.actions[transaction_id].status = ActionStatus.APPROVED
+            self.changed_actions.add(transaction_id)
             self.wallet_logger.info(f"transaction of type '{action.type}' with amount {action.amount} is approved")
         else:
             name = None
-            lord_key = load_key(KeysSettings.LORD_PK)
-            bonus_key = load_key(KeysSettings.BONUS_PK)
-            tipping_key = load_key(KeysSettings.TIPPING_PK)
-            if transaction.sender_pk == lord_key:
+            lord_fingerprint = get_key_fingerprint(KeysSettings.LORD_PK)
+            if sender_fingerprint == lord_fingerprint:
                 action_type = ActionType.BUY
-            elif transaction.recipient_pk == lord_key:
+            elif recipient_fingerprint == lord_fingerprint:
                 action_type = ActionType.SELL
-            elif transaction.sender_pk == bonus_key:
+            elif sender_fingerprint == get_key_fingerprint(KeysSettings.BONUS_PK):
                 action_type = ActionType.MINE
-            elif transaction.sender_pk == tipping_key:
+            elif sender_fingerprint == get_key_fingerprint(KeysSettings.TIPPING_PK):
                 action_type = ActionType.TIP
             else:
                 if addision:
                     action_type = ActionType.RECEIVE
                 else:
                     action_type = ActionType.TRANSFER
-                target_pk = transaction.sender_pk if transaction.sender_pk != self.owner_pk else transaction.recipient_pk
+                target_pk = transaction.sender_pk if addision else transaction.recipient_pk
                 name = next(k for k, v in names_pk_dict.items() if v == target_pk)
 
             action = Action(
@@ -98,9 +102,17 @@ class Wallet:
                 name
             )
             self.actions[transaction_id] = action
+            self.changed_actions.add(transaction_id)
             self.wallet_logger.info(f"new transaction of type transfer was added with amount of {action.amount}")
         return True
 
+    def take_changed_actions(self):
+        """
+        :return: Ids of the actions changed since the last call, which are then no longer marked as changed.
+        """
+        changed_actions, self.changed_actions = self.changed_actions, set()
+        return changed_actions
+
     def filter_and_add_block(self, block, names_pk_dict):
         """
         Filters and adds a block to the blockchain if it is valid.
@@ -0,0 +1,163 @@
+import json
+import sqlite3
+import threading
+
+from cryptography.hazmat.primitives import serialization
+
+from core.transaction import get_sk_pk_pair, create_sample_transaction
+from core.wallet import Wallet
+from network.miner.action import Action
+from utils.config import WalletStoreSettings, ActionType, NodeSettings
+from utils.logging_utils import setup_basic_logger
+
+# Setup logger for file
+logger = setup_basic_logger()
+
+# Constants for assertion error messages
+REOPEN_ERROR = "Reopened store should return the saved wallet"
+INCREMENTAL_ERROR = "Saving should write only the changed actions"
+
+
+class WalletStore:
+    """
+    SQLite storage of a wallet: one row per action and a few state values (owner key, balance, latest hash).
+    Wallets track the actions changed since they were saved, so a save writes only those rows,
+    all in a single transaction, instead of rewriting the whole wallet.
+    """
+
+    def __init__(self, path, synchronous=WalletStoreSettings.SYNCHRONOUS):
+        """
+        :param path: Path of the database file, created if missing.
+        :param synchronous: SQLite synchronous mode, "FULL", "NORMAL" or "OFF".
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        # the node's threads share the connection, the lock serializes them
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(f"PRAGMA synchronous={synchronous}")
+        with self.connection:
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS state (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                )
+            """)
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS actions (
+                    id TEXT PRIMARY KEY,
+                    data TEXT
+                )
+            """)
+        self.closed = False
+        self.saves = 0
+        self.actions_written = 0
+
+    def is_empty(self):
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM state").fetchone()[0] == 0
+
+    def save(self, wallet, full=False):
+        """
+        Writes the wallet state and its changed actions in one transaction.
+        :param wallet: The wallet to save.
+        :param full: Replace all the stored actions with the wallet's ones (used when migrating a wallet).
+        :return: Number of action rows written
+        """
+        action_ids = set(wallet.actions) if full else wallet.take_changed_actions()
+        rows = []
+        for action_id in action_ids:
+            data = wallet.actions[action_id].to_dict()
+            rows.append((data["id"], json.dumps(data)))
+        state = [
+            ("owner_pk", wallet.owner_pk.public_bytes(
+                encoding=serialization.Encoding.PEM,
+                format=serialization.PublicFormat.SubjectPublicKeyInfo
+            ).decode()),
+            ("balance", json.dumps(wallet.balance)),
+            ("instance_id", json.dumps(wallet.instance_id)),
+            ("latest_hash", json.dumps(wallet.latest_hash)),
+        ]
+        with self.lock:
+            try:
+                with self.connection:
+                    if full:
+                        self.connection.execute("DELETE FROM actions")
+                    self.connection.executemany("INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)", state)
+                    self.connection.executemany("INSERT OR REPLACE INTO actions (id, data) VALUES (?, ?)", rows)
+            except sqlite3.Error:
+                # keep the actions marked as changed, so the next save writes them
+                wallet.changed_actions.update(action_ids)
+                raise
+            self.saves += 1
+            self.actions_written += len(rows)
+        logger.debug(f"Wallet saved to {self.path} with {len(rows)} changed actions")
+        return len(rows)
+
+    def load(self, child_dir="wallet", name=NodeSettings.DEFAULT_NAME):
+        """
+        :param child_dir: Logs directory of the loaded wallet.
+        :param name: Name of the wallet's node.
+        :return: The stored wallet, or None if the store is empty.
+        """
+        with self.lock:
+            state = dict(self.connection.execute("SELECT key, value FROM state").fetchall())
+            rows = self.connection.execute("SELECT data FROM actions").fetchall()
+        if not state:
+            return None
+
+        owner_pk = serialization.load_pem_public_key(state["owner_pk"].encode())
+        actions = {}
+        for (data,) in rows:
+            action = Action.from_dict(json.loads(data))
+            actions[action.id] = action
+        return Wallet(
+            owner_pk,
+            json.loads(state["balance"]),
+            actions,
+            json.loads(state["latest_hash"]),
+            json.loads(state["instance_id"]),
+            child_dir=child_dir,
+            name=name
+        )
+
+    def close(self):
+        with self.lock:
+            if not self.closed:
+                self.connection.close()
+                self.closed = True
+
+
+def assertion_check():
+    import os
+    import tempfile
+
+    sk, pk = get_sk_pk_pair()
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "wallet.db")
+        wallet = Wallet(pk, instance_id="assertion")
+        for amount in (10, 20, 30):
+            wallet.add_pending_transaction(create_sample_transaction(amount), ActionType.TRANSFER, "other")
+        store = WalletStore(path)
+        assert store.is_empty() and store.save(wallet) == 3, INCREMENTAL_ERROR
+
+        wallet.balance += 5
+        wallet.add_pending_transaction(create_sample_transaction(40), ActionType.BUY)
+        assert store.save(wallet) == 1 and store.save(wallet) == 0, INCREMENTAL_ERROR
+        store.close()
+
+        store = WalletStore(path)
+        loaded = store.load()
+        assert loaded.to_dict() == wallet.to_dict(), REOPEN_ERROR
+        assert not loaded.changed_actions, REOPEN_ERROR
+
+        # a full save replaces the stored wallet
+        other_wallet = Wallet(pk, instance_id="other")
+        store.save(other_wallet, full=True)
+        assert store.load().to_dict() == other_wallet.to_dict(), REOPEN_ERROR
+        store.close()
+    print("Wallet store assertions passed!")
+
+
+if __name__ == "__main__":
+    assertion_check()
@@ -135,6 +135,18 @@ class Bootstrap(Node):
     def serve_blockchain_request(self, latest_hash):
         self.bootstrap_logger.debug(f"Bootstrap does not handle block requests")
 
+    def serve_headers_request(self, latest_hash):
+        self.bootstrap_logger.debug(f"Bootstrap does not handle header requests")
+
+    def serve_blocks_request(self, start_hash, count):
+        self.bootstrap_logger.debug(f"Bootstrap does not handle block requests")
+
+    def process_headers_data(self, headers, node_address):
+        self.bootstrap_logger.debug(f"Bootstrap does not handle headers")
+
+    def process_blocks_data(self, blocks, node_address):
+        self.bootstrap_logger.debug(f"Bootstrap does not handle block sending")
+
     def get_public_key(self):
         return None
 
@@ -0,0 +1,362 @@
+import threading
+import time
+
+from core.blockchain import create_sample_blockchain
+from utils.config import MsgSubTypes, SyncSettings
+from utils.logging_utils import configure_logger
+
+
+class ChainSynchronizer:
+    """
+    Headers-first synchronization of the chain after the node's latest block.
+
+    The headers are requested from one peer at a time, and their chain is checked cheaply:
+    every header links to the previous one and its hash meets its difficulty.
+    The bodies of the validated headers are then requested in ranges of `blocks_per_request` blocks,
+    spread over the peers with up to `max_in_flight` ranges requested at once, and each range is requested
+    from a single peer at a time. A request that is not answered within `timeout` seconds is sent to another peer.
+    Received bodies must hash to their header, and are handed over in chain order, one batch per response.
+    """
+
+    def __init__(
+            self,
+            send_request,
+            get_peers,
+            get_latest_hash,
+            on_blocks,
+            instance_id,
+            child_dir="sync",
+            max_headers=SyncSettings.MAX_HEADERS,
+            blocks_per_request=SyncSettings.BLOCKS_PER_REQUEST,
+            max_in_flight=SyncSettings.MAX_IN_FLIGHT,
+            timeout=SyncSettings.REQUEST_TIMEOUT
+    ):
+        """
+        :param send_request: Callable (address, message subtype, *params) sending a request, returns True if sent.
+        :param get_peers: Callable returning the addresses of the connected peers.
+        :param get_latest_hash: Callable returning the hash of the node's latest block.
+        :param on_blocks: Callable receiving a list of new blocks, in chain order.
+        """
+        self.sync_logger = configure_logger(
+            class_name="ChainSynchronizer",
+            child_dir=child_dir,
+            instance_id=instance_id
+        )
+        self.send_request = send_request
+        self.get_peers = get_peers
+        self.get_latest_hash = get_latest_hash
+        self.on_blocks = on_blocks
+        self.max_headers = max_headers
+        self.blocks_per_request = blocks_per_request
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+
+        self.lock = threading.Lock()
+        self.delivery_lock = threading.Lock()  # keeps the handed over batches in chain order
+        self.serving_peers = {}  # peers that answered a request, in the order they did (dict as an ordered set)
+
+        # the headers request in flight: the peer, when it was sent, and the hash the headers should follow
+        self.headers_peer = None
+        self.headers_requested_at = 0
+        self.headers_anchor = None
+        self.tried_header_peers = set()
+
+        # validated headers waiting for their bodies, in chain order
+        self.pending_headers = []
+        self.pending_by_hash = {}
+        self.bodies = {}  # hash to received block
+
+        # body ranges by the hash preceding them, each a dict of the range hashes, the peer it was requested from,
+        # when it was requested and the peers that failed to answer it
+        self.ranges = {}
+
+        self.stop_event = threading.Event()
+        self.thread = None
+
+        self.headers_received = 0
+        self.blocks_received = 0
+        self.duplicate_blocks = 0
+        self.timeouts = 0
+
+    def start(self):
+        if self.thread and self.thread.is_alive():
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if not self.thread:
+            return
+        self.stop_event.set()
+        self.thread.join()
+        self.thread = None
+
+    def is_synchronizing(self):
+        with self.lock:
+            return self.headers_peer is not None or bool(self.pending_headers)
+
+    def synchronize(self):
+        """
+        Starts synchronizing after the node's latest block, unless a synchronization is already running.
+        :return: True if a headers request was sent
+        """
+        with self.lock:
+            if self.headers_peer is not None or self.pending_headers:
+                self.sync_logger.debug("Synchronization already in progress")
+                return False
+            self.tried_header_peers.clear()
+            return self._request_headers(self.get_latest_hash())
+
+    def _order_peers(self, peers, excluded):
+        # peers that answered before come first
+        candidates = [peer for peer in self.serving_peers if peer in peers and peer not in excluded]
+        candidates += [peer for peer in peers if peer not in self.serving_peers and peer not in excluded]
+        return candidates
+
+    def _request_headers(self, anchor):
+        peers = self._order_peers(list(self.get_peers()), self.tried_header_peers)
+        for peer in peers:
+            if self.send_request(peer, MsgSubTypes.HEADERS, anchor):
+                self.headers_peer = peer
+                self.headers_requested_at = time.monotonic()
+                self.headers_anchor = anchor
+                self.sync_logger.info(f"Requested headers after {anchor[:6]}... from {peer}")
+                return True
+            self.tried_header_peers.add(peer)
+
+        self.headers_peer = None
+        self.sync_logger.info(f"No peer to request headers from, tried {len(self.tried_header_peers)}")
+        return False
+
+    def validate_headers(self, headers, previous_hash):
+        """
+        Checks that the headers form a chain following `previous_hash`, with valid proof of work.
+        :return: True if all the headers are valid
+        """
+        for header in headers:
+            if header.previous_hash != previous_hash:
+                self.sync_logger.warning(f"Header {header} does not follow {previous_hash[:6]}...")
+                return False
+            if not header.has_valid_pow():
+                self.sync_logger.warning(f"Header {header} has invalid proof of work")
+                return False
+            previous_hash = header.hash
+        return True
+
+    def handle_headers(self, headers, peer):
+        """
+        Validates received headers and requests the bodies of the valid ones.
+        :param headers: List of block headers.
+        :param peer: Address of the peer that sent them.
+        :return: None
+        """
+        with self.lock:
+            if peer != self.headers_peer:
+                self.sync_logger.debug(f"Ignoring unrequested headers from {peer}")
+                return
+            self.headers_peer = None
+            if not self.validate_headers(headers, self.headers_anchor):
+                # try another peer for the same headers
+                self.tried_header_peers.add(peer)
+                self._request_headers(self.headers_anchor)
+                return
+
+            self.serving_peers[peer] = None
+            self.headers_received += len(headers)
+            for start in range(0, len(headers), self.blocks_per_request):
+                range_headers = headers[start:start + self.blocks_per_request]
+                self.ranges[range_headers[0].previous_hash] = {
+                    "hashes": [header.hash for header in range_headers],
+                    "peer": None,
+                    "requested_at": 0,
+                    "failed": set(),
+                }
+            for header in headers:
+                self.pending_headers.append(header)
+                self.pending_by_hash[header.hash] = header
+            self.sync_logger.info(f"Validated {len(headers)} headers from {peer}")
+
+            # a full response means the peer has more headers
+            if len(headers) == self.max_headers:
+                self.tried_header_peers.clear()
+                self._request_headers(headers[-1].hash)
+            self._dispatch_ranges()
+
+    def _dispatch_ranges(self):
+        peers = list(self.get_peers())
+        in_flight = {}
+        for body_range in self.ranges.values():
+            if body_range["peer"] is not None:
+                in_flight[body_range["peer"]] = in_flight.get(body_range["peer"], 0) + 1
+
+        for start_hash, body_range in self.ranges.items():
+            if sum(in_flight.values()) >= self.max_in_flight:
+                return
+            if body_range["peer"] is not None:
+                continue
+            candidates = self._order_peers(peers, body_range["failed"])
+            if not candidates:
+                # every peer failed this range, start over with all of them
+                body_range["failed"].clear()
+                candidates = self._order_peers(peers, ())
+            # spread the ranges, the least loaded peer first (the sort keeps serving peers first on ties)
+            candidates.sort(key=lambda candidate: in_flight.get(candidate, 0))
+            for peer in candidates:
+                if self.send_request(peer, MsgSubTypes.BLOCKS, start_hash, len(body_range["hashes"])):
+                    body_range["peer"] = peer
+                    body_range["requested_at"] = time.monotonic()
+                    in_flight[peer] = in_flight.get(peer, 0) + 1
+                    break
+                body_range["failed"].add(peer)
+
+    def handle_blocks(self, blocks, peer):
+        """
+        Stores received bodies that match their validated headers and hands over the ones that complete the chain.
+        :param blocks: List of blocks.
+        :param peer: Address of the peer that sent them.
+        :return: None
+        """
+        with self.delivery_lock:
+            with self.lock:
+                for block in blocks:
+                    header = self.pending_by_hash.get(block.hash)
+                    if header is None or block.hash in self.bodies:
+                        self.duplicate_blocks += 1
+                        continue
+                    if block.calculate_hash() != header.hash:
+                        self.sync_logger.warning(f"Block {block} from {peer} does not match its header")
+                        break
+                    self.bodies[block.hash] = block
+                    self.blocks_received += 1
+
+                if blocks:
+                    self.serving_peers[peer] = None
+                    self._update_range(blocks[0].previous_hash, peer)
+                ready = self._take_ready_blocks()
+                self._dispatch_ranges()
+                done = not self.pending_headers and self.headers_peer is None
+
+            if ready:
+                self.on_blocks(ready)
+                self.sync_logger.info(f"Handed over {len(ready)} synchronized blocks")
+            if done and ready:
+                self.sync_logger.info("Synchronization complete")
+
+    def _update_range(self, start_hash, peer):
+        body_range = self.ranges.pop(start_hash, None)
+        if body_range is None:
+            return
+        missing = [block_hash for block_hash in body_range["hashes"] if block_hash not in self.bodies]
+        if not missing:
+            return
+
+        # request the rest of the range again, from another peer if this one sent nothing new
+        if len(missing) == len(body_range["hashes"]):
+            body_range["failed"].add(peer)
+        body_range["hashes"] = missing
+        body_range["peer"] = None
+        self.ranges[self.pending_by_hash[missing[0]].previous_hash] = body_range
+
+    def _take_ready_blocks(self):
+        ready_count = 0
+        while ready_count < len(self.pending_headers) and self.pending_headers[ready_count].hash in self.bodies:
+            ready_count += 1
+        ready_headers = self.pending_headers[:ready_count]
+        del self.pending_headers[:ready_count]
+
+        ready = []
+        for header in ready_headers:
+            del self.pending_by_hash[header.hash]
+            ready.append(self.bodies.pop(header.hash))
+        return ready
+
+    def _run(self):
+        while not self.stop_event.wait(SyncSettings.CHECK_INTERVAL):
+            try:
+                self._check_timeouts()
+            except Exception as e:
+                self.sync_logger.error(f"Failed to check synchronization timeouts: {e}")
+
+    def _check_timeouts(self):
+        now = time.monotonic()
+        with self.lock:
+            if self.headers_peer is not None and now - self.headers_requested_at > self.timeout:
+                self.sync_logger.info(f"Headers request to {self.headers_peer} timed out")
+                self.timeouts += 1
+                self.tried_header_peers.add(self.headers_peer)
+                self._request_headers(self.headers_anchor)
+
+            timed_out = False
+            for body_range in self.ranges.values():
+                if body_range["peer"] is not None and now - body_range["requested_at"] > self.timeout:
+                    self.sync_logger.info(f"Blocks request to {body_range['peer']} timed out")
+                    self.timeouts += 1
+                    body_range["failed"].add(body_range["peer"])
+                    body_range["peer"] = None
+                    timed_out = True
+            if timed_out:
+                self._dispatch_ranges()
+
+    def get_stats(self):
+        """
+        :return: Dictionary with the synchronization counters and the state of the running synchronization.
+        """
+        with self.lock:
+            return {
+                "headers_received": self.headers_received,
+                "blocks_received": self.blocks_received,
+                "duplicate_blocks": self.duplicate_blocks,
+                "timeouts": self.timeouts,
+                "pending_headers": len(self.pending_headers),
+                "ranges_in_flight": sum(1 for body_range in self.ranges.values() if body_range["peer"] is not None),
+                "serving_peers": len(self.serving_peers),
+            }
+
+
+def assertion_check():
+    # two peers serve the chain, a third never answers
+    source = create_sample_blockchain(blocks_num=4, transactions_nums=[1, 1, 1, 1],
+                                      transactions_ranges=[[10], [20], [30], [40]])
+    genesis_hash = source.chain[0].hash
+    requests = []
+    delivered = []
+    synchronizer = ChainSynchronizer(
+        send_request=lambda peer, subtype, *params: requests.append((peer, subtype, params)) or True,
+        get_peers=lambda: ["silent", "first", "second"],
+        get_latest_hash=lambda: genesis_hash,
+        on_blocks=delivered.extend,
+        instance_id="assertion",
+        blocks_per_request=2,
+        timeout=0
+    )
+
+    assert synchronizer.synchronize() and not synchronizer.synchronize(), "A running sync should not restart"
+    synchronizer._check_timeouts()  # the silent peer does not answer
+    assert requests[-1][:2] == ("first", MsgSubTypes.HEADERS), "Headers should be requested from the next peer"
+
+    headers = source.get_headers_after(genesis_hash, SyncSettings.MAX_HEADERS)
+    forged = source.get_headers_after(genesis_hash, SyncSettings.MAX_HEADERS)
+    forged[1].nonce += 1
+    synchronizer.handle_headers(forged, "first")
+    assert not synchronizer.pending_headers, "Headers with invalid proof of work should be rejected"
+    synchronizer.handle_headers(headers, requests[-1][0])
+
+    block_requests = [request for request in requests if request[1] == MsgSubTypes.BLOCKS]
+    assert len(block_requests) == 2 and len({request[0] for request in block_requests}) == 2, \
+        "Body ranges should be spread over the peers"
+
+    # the second range arrives first and waits for the first one, the first range arrives twice
+    for peer, _, (start_hash, count) in reversed(block_requests):
+        synchronizer.handle_blocks(source.get_block_range(start_hash, count), peer)
+        assert delivered == [] or delivered == source.chain[1:], "Blocks should be handed over in chain order"
+    synchronizer.handle_blocks(source.get_block_range(genesis_hash, 2), "first")
+    assert [block.hash for block in delivered] == [block.hash for block in source.chain[1:]], \
+        "All the blocks should be handed over once"
+    stats = synchronizer.get_stats()
+    assert stats["duplicate_blocks"] == 2 and not synchronizer.is_synchronizing(), "Wrong synchronization counters"
+    print("Chain synchronizer assertions passed!")
+
+
+if __name__ == "__main__":
+    assertion_check()
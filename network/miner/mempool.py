@@ -1,39 +1,245 @@
+import functools
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+
 from utils.logging_utils import configure_logger
-from core.transaction import create_sample_transaction
-from utils.config import BlockSettings
+from core.transaction import Transaction, create_sample_transaction, get_sk_pk_pair
+from utils.config import BlockSettings, MempoolSettings, KeysSettings
+from utils.keys_manager import get_key_fingerprint, load_key
 # Setup self.mempool_logger for file
 
 
+def _synchronized(method):
+    """
+    Run a Mempool method while holding the mempool's lock.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
 class Mempool:
     """
     A class to manage a mempool, which holds unique transactions and provides methods
     to add, remove, and select transactions based on specific criteria.
+    Transactions are indexed by their transaction id, ordered by tip in a max-heap for selection,
+    in a min-heap for eviction, and by arrival in a queue for expiry.
+    Removed transactions are only dropped from the index; their entries elsewhere are skipped when met,
+    and the orderings are rebuilt once most of them is stale.
+
+    The pool is capped by transaction count and approximate size in bytes. When it is full the lowest tips are
+    evicted, and the minimum tip for admission is raised above the evicted tip, decaying back over time.
+
+    All the public methods hold the mempool's reentrant lock, and adding transactions notifies the threads
+    waiting in wait_for_transactions.
     """
 
-    def __init__(self, instance_id=None, child_dir="mempool"):
+    def __init__(
+            self,
+            instance_id=None,
+            child_dir="mempool",
+            max_transactions=MempoolSettings.MAX_TRANSACTIONS,
+            max_bytes=MempoolSettings.MAX_BYTES,
+            expiry=MempoolSettings.EXPIRY
+    ):
         """
-        Initializes the mempool with an empty set to store unique transactions.
+        Initializes the mempool with an empty index and orderings.
+        :param max_transactions: Maximum number of transactions, None for no limit.
+        :param max_bytes: Maximum approximate size of the transactions in bytes, None for no limit.
+        :param expiry: Seconds a transaction is kept before it expires, None to keep transactions forever.
         """
-        self.transactions = set()
+        self.max_transactions = max_transactions
+        self.max_bytes = max_bytes
+        self.expiry = expiry
+        self.lock = threading.RLock()
+        self.transactions_added = threading.Condition(self.lock)
+        self.version = 0  # increased whenever transactions are added
+
+        self.transactions = {}  # txid -> (sequence, transaction, added at, size)
+        self.heap = []  # (-tip, sequence, txid), sequence keeps equal tips in arrival order
+        self.eviction_heap = []  # (tip, -sequence, txid), among equal tips the newest is evicted first
+        self.arrivals = deque()  # (added at, sequence, txid)
+        self.sequence = itertools.count()
+        self.total_bytes = 0
+
+        self.dynamic_min_tip = 0
+        self.min_tip_updated = time.monotonic()
+
+        self.added = 0
+        self.removed = 0
+        self.evicted = 0
+        self.expired = 0
+        self.rejected_low_tip = 0
+
         self.mempool_logger = configure_logger(
             class_name="Mempool",
             child_dir=child_dir,
             instance_id=instance_id
         )
 
+    def __len__(self):
+        return len(self.transactions)
+
+    def _is_live(self, txid, sequence):
+        indexed = self.transactions.get(txid)
+        return indexed is not None and indexed[0] == sequence
+
+    def _discard(self, txid):
+        """
+        Drop a transaction from the index.
+        :return: The dropped transaction, or None if it is not in the mempool
+        """
+        indexed = self.transactions.pop(txid, None)
+        if indexed is None:
+            return None
+        self.total_bytes -= indexed[3]
+        return indexed[1]
+
+    def _compact(self):
+        """
+        Rebuild the orderings from the index once stale entries outnumber the live ones.
+        """
+        limit = 2 * len(self.transactions) + MempoolSettings.MIN_COMPACT_SIZE
+        if max(len(self.heap), len(self.eviction_heap), len(self.arrivals)) <= limit:
+            return
+        entries = sorted((sequence, txid, tx, added_at) for txid, (sequence, tx, added_at, _) in self.transactions.items())
+        self.heap = [(-tx.tip, sequence, txid) for sequence, txid, tx, _ in entries]
+        self.eviction_heap = [(tx.tip, -sequence, txid) for sequence, txid, tx, _ in entries]
+        heapq.heapify(self.heap)
+        heapq.heapify(self.eviction_heap)
+        self.arrivals = deque((added_at, sequence, txid) for sequence, txid, _, added_at in entries)
+
+    def _is_full(self):
+        return ((self.max_transactions is not None and len(self.transactions) > self.max_transactions) or
+                (self.max_bytes is not None and self.total_bytes > self.max_bytes))
+
+    def _evict(self):
+        """
+        Evict the lowest tip transactions until the mempool is within its limits,
+        and raise the minimum tip above the highest evicted tip.
+        :return: Set of the evicted transaction ids
+        """
+        evicted = set()
+        highest_evicted_tip = None
+        while self._is_full() and self.eviction_heap:
+            tip, negative_sequence, txid = heapq.heappop(self.eviction_heap)
+            if not self._is_live(txid, -negative_sequence):
+                continue
+            self._discard(txid)
+            evicted.add(txid)
+            highest_evicted_tip = tip
+        if evicted:
+            self.evicted += len(evicted)
+            self.dynamic_min_tip = max(self.get_min_tip(), highest_evicted_tip + MempoolSettings.MIN_TIP_INCREMENT)
+            self.min_tip_updated = time.monotonic()
+            self.mempool_logger.info(f"Evicted {len(evicted)} transactions, minimum tip is now {self.dynamic_min_tip}")
+        return evicted
+
+    @_synchronized
+    def get_min_tip(self):
+        """
+        The minimum tip for admission: the configured floor, or the tip raised by evictions,
+        which halves every MIN_TIP_HALF_LIFE seconds.
+        :return: The minimum tip
+        """
+        elapsed = time.monotonic() - self.min_tip_updated
+        dynamic_min_tip = self.dynamic_min_tip * 0.5 ** (elapsed / MempoolSettings.MIN_TIP_HALF_LIFE)
+        if dynamic_min_tip < MempoolSettings.MIN_TIP_INCREMENT / 2:
+            dynamic_min_tip = 0
+        return max(MempoolSettings.MIN_TIP, dynamic_min_tip)
+
+    @_synchronized
+    def expire_transactions(self):
+        """
+        Remove the transactions that were in the mempool for longer than the expiry time.
+        :return: Number of expired transactions
+        """
+        if self.expiry is None:
+            return 0
+        deadline = time.monotonic() - self.expiry
+        expired = 0
+        while self.arrivals and self.arrivals[0][0] <= deadline:
+            _, sequence, txid = self.arrivals.popleft()
+            if self._is_live(txid, sequence):
+                self._discard(txid)
+                expired += 1
+        if expired:
+            self.expired += expired
+            self.mempool_logger.info(f"Expired {expired} transactions. Count: {len(self.transactions)}")
+            self._compact()
+        return expired
+
+    @_synchronized
     def add_transactions(self, transactions):
         """
         Adds a list of transactions to the mempool.
-        Only transactions not already in the mempool are added.
+        Only transactions not already in the mempool and paying at least the minimum tip are added,
+        and the lowest tip transactions are evicted if the mempool gets over its limits.
 
         :param transactions: List of Transaction objects to add to the mempool
-        :return: None
+        :return: List of the transactions that were added and not evicted
         """
+        self.expire_transactions()
+        min_tip = self.get_min_tip()
+        now = time.monotonic()
+        added = []
         for tx in transactions:
-            if tx not in self.transactions:
-                self.mempool_logger.info(f"Adding transaction: {tx}")
-                self.transactions.add(tx)
+            txid = tx.get_txid()
+            if txid in self.transactions:
+                continue
+            if tx.tip < min_tip:
+                self.rejected_low_tip += 1
+                continue
+            sequence = next(self.sequence)
+            size = get_transaction_size(tx)
+            self.transactions[txid] = (sequence, tx, now, size)
+            self.total_bytes += size
+            heapq.heappush(self.heap, (-tx.tip, sequence, txid))
+            heapq.heappush(self.eviction_heap, (tx.tip, -sequence, txid))
+            self.arrivals.append((now, sequence, txid))
+            added.append(tx)
 
+        if self._is_full():
+            evicted = self._evict()
+            added = [tx for tx in added if tx.get_txid() not in evicted]
+            self._compact()
+        if added:
+            self.added += len(added)
+            self.version += 1
+            self.transactions_added.notify_all()
+            self.mempool_logger.info(f"Added {len(added)} transactions. Count: {len(self.transactions)}")
+        return added
+
+    def wait_for_transactions(
+            self,
+            known_version=None,
+            min_transactions=MempoolSettings.TEMPLATE_MIN_TRANSACTIONS,
+            max_wait=MempoolSettings.TEMPLATE_MAX_WAIT,
+            timeout=None
+    ):
+        """
+        Wait until transactions were added after `known_version`, then give more transactions up to `max_wait`
+        seconds to arrive, or until there are `min_transactions` in the mempool.
+
+        :param known_version: The mempool version the caller already handled, None to accept any pending transactions
+        :param min_transactions: Number of pending transactions that ends the extra wait early
+        :param max_wait: Maximum seconds of the extra wait
+        :param timeout: Maximum seconds to wait for the first transactions, None to wait forever
+        :return: True if there are new transactions, False on timeout
+        """
+        with self.transactions_added:
+            if not self.transactions_added.wait_for(
+                    lambda: self.transactions and self.version != known_version, timeout):
+                return False
+            self.transactions_added.wait_for(lambda: len(self.transactions) >= min_transactions, max_wait)
+            return True
+
+    @_synchronized
     def remove_transactions(self, transactions):
         """
         Removes a list of transactions from the mempool.
@@ -42,14 +248,20 @@ class Mempool:
         :param transactions: List of Transaction objects to remove from the mempool
         :return: None
         """
+        removed = 0
         for tx in transactions:
-            if tx in self.transactions:
-                self.mempool_logger.info(f"Removing transaction: {tx}")
-            self.transactions.discard(tx)
+            if self._discard(tx.get_txid()) is not None:
+                removed += 1
+        if removed:
+            self.removed += removed
+            self.mempool_logger.info(f"Removed {removed} transactions. Count: {len(self.transactions)}")
+            self._compact()
 
+    @_synchronized
     def has_transaction(self, transaction):
-        return transaction in self.transactions
+        return transaction.get_txid() in self.transactions
 
+    @_synchronized
     def get_all_transactions(self):
         """
         Returns all transactions currently in the mempool.
@@ -57,28 +269,87 @@ class Mempool:
         :return: List of Transaction objects currently in the mempool
         """
         self.mempool_logger.info(f"Fetching all transactions. Count: {len(self.transactions)}")
-        return list(self.transactions)
+        return [indexed[1] for indexed in self.transactions.values()]
 
-    def select_transactions(self, num_transactions=BlockSettings.MAX_TRANSACTIONS):
+    @_synchronized
+    def select_transactions(self, num_transactions=BlockSettings.MAX_TRANSACTIONS, get_balance=None):
         """
         Selects the top transactions with the highest 'tip' values.
+        The top entries are popped from the heap and pushed back, so a selection costs O(k log n).
+        When `get_balance` is given, a running balance is projected per sender, and transactions that would
+        spend more than their sender has left are skipped, so the selected set is spendable as a whole.
+        Senders of the lord key are not limited, and transactions sent from the bonus or tipping keys are skipped.
 
         :param num_transactions: Number of transactions to select
+        :param get_balance: Callable returning the confirmed balance of a sender fingerprint, None to select by tip only
         :return: List of selected Transaction objects
         """
         try:
-            sorted_transactions = sorted(
-                self.transactions, key=lambda tx: tx.tip, reverse=True
-            )
-            if num_transactions > len(sorted_transactions):
-                selected = sorted_transactions
-            else:
-                selected = sorted_transactions[:num_transactions]
+            self.expire_transactions()
+            if get_balance is not None:
+                lord_fingerprint = get_key_fingerprint(KeysSettings.LORD_PK)
+                reserved_fingerprints = {get_key_fingerprint(KeysSettings.BONUS_PK),
+                                         get_key_fingerprint(KeysSettings.TIPPING_PK)}
+            projected_balances = {}  # sender fingerprint -> balance left after the selected transactions
+            selected = []
+            popped = []
+            skipped = 0
+            while self.heap and len(selected) < num_transactions:
+                entry = heapq.heappop(self.heap)
+                if not self._is_live(entry[2], entry[1]):
+                    continue  # stale entry of a removed transaction, drop it
+                popped.append(entry)
+                tx = self.transactions[entry[2]][1]
+                if get_balance is not None:
+                    sender = tx.get_sender_fingerprint()
+                    if sender in reserved_fingerprints:
+                        skipped += 1
+                        continue
+                    if sender != lord_fingerprint:
+                        if sender not in projected_balances:
+                            projected_balances[sender] = get_balance(sender)
+                        if tx.amount > projected_balances[sender]:
+                            skipped += 1
+                            continue
+                        projected_balances[sender] -= tx.amount
+                selected.append(tx)
+            for entry in popped:
+                heapq.heappush(self.heap, entry)
+            if skipped:
+                self.mempool_logger.info(f"Skipped {skipped} transactions the senders can't currently pay")
             return selected
         except Exception as e:
             self.mempool_logger.error(f"Error while selecting transactions: {e}")
             return []
 
+    @_synchronized
+    def get_stats(self):
+        """
+        :return: Dictionary with the mempool size, limits, minimum tip and admission counters.
+        """
+        return {
+            "transactions": len(self.transactions),
+            "bytes": self.total_bytes,
+            "max_transactions": self.max_transactions,
+            "max_bytes": self.max_bytes,
+            "min_tip": self.get_min_tip(),
+            "added": self.added,
+            "removed": self.removed,
+            "evicted": self.evicted,
+            "expired": self.expired,
+            "rejected_low_tip": self.rejected_low_tip,
+        }
+
+
+def get_transaction_size(transaction):
+    """
+    :param transaction: A transaction.
+    :return: Approximate size of the transaction in bytes: its encoded keys, signature and numeric fields.
+    """
+    signature_size = len(transaction.signature) if transaction.signature else 0
+    return (len(transaction.get_sender_pem()) + len(transaction.get_recipient_pem()) +
+            signature_size + MempoolSettings.TRANSACTION_OVERHEAD)
+
 
 def assertion_check():
     """
@@ -92,7 +363,7 @@ def assertion_check():
         transactions.append(create_sample_transaction())
 
     # Initialize mempool
-    mempool = Mempool()
+    mempool = Mempool("assertion")
 
     # Test add_transactions
     mempool.add_transactions(transactions)
@@ -106,6 +377,54 @@ def assertion_check():
     selected = mempool.select_transactions(2)
     assert len(selected) == 2, "Select transactions failed."
     assert selected[0].tip >= selected[1].tip, "Transactions not sorted correctly."
+    expected = sorted(transactions[1:], key=lambda tx: tx.tip, reverse=True)[:5]
+    assert [tx.tip for tx in mempool.select_transactions(5)] == [tx.tip for tx in expected], \
+        "Selection should return the highest tips."
+
+    # Test removal of selected transactions and re-adding a removed one
+    mempool.remove_transactions(selected)
+    assert not any(mempool.has_transaction(tx) for tx in selected), "Removed transactions still found."
+    assert all(tx not in mempool.select_transactions() for tx in selected), "Removed transactions selected."
+    mempool.add_transactions(selected[:1])
+    assert mempool.select_transactions().count(selected[0]) == 1, "Re-added transaction selected twice."
+    assert len(mempool) == len(transactions) - 2, "Wrong mempool size."
+
+    # Test the count limit: the lowest tips are evicted and the minimum tip is raised
+    limited = Mempool("assertion_limits", max_transactions=3)
+    tips = [5, 1, 7, 3]
+    limited_transactions = [create_sample_transaction(10, tip) for tip in tips]
+    added = limited.add_transactions(limited_transactions)
+    assert sorted(tx.tip for tx in added) == [3, 5, 7], "Lowest tip transaction should be evicted."
+    assert limited.get_min_tip() > 1, "Minimum tip should be raised by eviction."
+    assert limited.add_transactions([create_sample_transaction(10, 1)]) == [], "Low tip should be rejected."
+    stats = limited.get_stats()
+    assert stats["evicted"] == 1 and stats["rejected_low_tip"] == 1, "Wrong eviction counters."
+
+    # Test the byte limit and expiry
+    sized = Mempool("assertion_limits", max_bytes=2 * get_transaction_size(limited_transactions[0]))
+    sized.add_transactions(limited_transactions)
+    assert len(sized) == 2, "Byte limit should cap the mempool."
+    expiring = Mempool("assertion_limits", expiry=0)
+    expiring.add_transactions(limited_transactions)
+    assert expiring.select_transactions() == [] and expiring.get_stats()["expired"] == 4, "Expired transactions kept."
+
+    # Test balance aware selection: a sender can't spend more than its projected balance
+    sender_sk, sender_pk = get_sk_pk_pair()
+    spending = [create_sample_transaction(amount, tip, pk_sk_pair=(sender_pk, sender_sk))
+                for amount, tip in ((60, 9), (50, 8), (30, 7))]
+    lord_transaction = Transaction(load_key(KeysSettings.LORD_PK), sender_pk, 1000, 1)
+    balanced = Mempool("assertion_balances")
+    balanced.add_transactions(spending + [lord_transaction])
+    selected = balanced.select_transactions(get_balance=lambda fingerprint: 100)
+    assert selected == [spending[0], spending[2], lord_transaction], "Overspending transaction selected."
+
+    # Test waiting for transactions: returns once a batch arrives, or times out when there is nothing new
+    waiting = Mempool("assertion_wait")
+    assert not waiting.wait_for_transactions(timeout=0.01), "Empty mempool should time out."
+    threading.Timer(0.05, waiting.add_transactions, args=(transactions[:2],)).start()
+    assert waiting.wait_for_transactions(min_transactions=2, timeout=5), "Added transactions should wake waiters."
+    assert not waiting.wait_for_transactions(waiting.version, timeout=0.01), "Known transactions should not wake."
+    print("Mempool assertions passed!")
 
 
 if __name__ == "__main__":
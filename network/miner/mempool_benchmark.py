@@ -0,0 +1,171 @@
+"""
+Benchmarks of the mempool hot operations.
+Transactions are built from fixed keys and a fixed seed, with random bytes in place of real signatures,
+so large pools can be created without signing every transaction.
+"""
+import hashlib
+import json
+import random
+
+from cryptography.hazmat.primitives import serialization
+
+from core.transaction import Transaction
+from network.miner.mempool import Mempool
+from utils.benchmark_utils import time_trials, summarize, save_results
+from utils.config import BenchmarkSettings, KeysSettings, BlockSettings
+from utils.keys_manager import load_key
+
+SIGNATURE_LENGTH = 256
+
+
+class LegacyTransactionKey:
+    """
+    The transaction identity as it was before transaction ids were cached:
+    every hash and comparison PEM-encodes both keys and JSON-dumps the transaction.
+    """
+
+    def __init__(self, transaction):
+        self.transaction = transaction
+
+    def to_dict(self):
+        tx = self.transaction
+        return {
+            "sender_pk": tx.sender_pk.public_bytes(
+                encoding=serialization.Encoding.PEM,
+                format=serialization.PublicFormat.SubjectPublicKeyInfo
+            ).decode(),
+            "recipient_pk": tx.recipient_pk.public_bytes(
+                encoding=serialization.Encoding.PEM,
+                format=serialization.PublicFormat.SubjectPublicKeyInfo
+            ).decode(),
+            "amount": tx.amount,
+            "tip": tx.tip,
+            "signature": tx.signature.hex() if tx.signature else None,
+        }
+
+    def __hash__(self):
+        transaction_json = json.dumps(self.to_dict(), sort_keys=True)
+        return hash(hashlib.sha256(transaction_json.encode()).hexdigest())
+
+    def __eq__(self, other):
+        return isinstance(other, LegacyTransactionKey) and self.to_dict() == other.to_dict()
+
+
+class LegacyMempool:
+    """
+    The mempool as it was before it was indexed: a set, sorted by tip on every selection.
+    """
+
+    def __init__(self):
+        self.transactions = set()
+
+    def add_transactions(self, transactions):
+        self.transactions.update(transactions)
+
+    def remove_transactions(self, transactions):
+        for tx in transactions:
+            self.transactions.discard(tx)
+
+    def has_transaction(self, transaction):
+        return transaction in self.transactions
+
+    def select_transactions(self, num_transactions=BlockSettings.MAX_TRANSACTIONS):
+        return sorted(self.transactions, key=lambda tx: tx.tip, reverse=True)[:num_transactions]
+
+
+def create_benchmark_transactions(count, seed=BenchmarkSettings.SEED):
+    """
+    :param count: Number of transactions.
+    :param seed: Seed for amounts, tips and the fake signatures.
+    :return: List of distinct transactions.
+    """
+    rng = random.Random(seed)
+    sender_pk = load_key(KeysSettings.LORD_PK)
+    recipient_pk = load_key(KeysSettings.GENESIS_PK)
+    return [
+        Transaction(
+            sender_pk,
+            recipient_pk,
+            rng.randint(1, 1000),
+            rng.randint(0, 100),
+            signature=rng.randbytes(SIGNATURE_LENGTH)
+        )
+        for _ in range(count)
+    ]
+
+
+def benchmark_identity(count=BenchmarkSettings.MEMPOOL_IDENTITY_COUNT, trials=BenchmarkSettings.TRIALS):
+    """
+    Compare set insert and lookup cost of the legacy identity against the cached transaction id.
+    Every trial uses fresh transaction objects, so the cached ids are computed inside the timed insert.
+    :return: List of results.
+    """
+    results = []
+    for identity in ("legacy", "txid"):
+        insert_samples = []
+        lookup_samples = []
+        for trial in range(trials):
+            transactions = create_benchmark_transactions(count, seed=BenchmarkSettings.SEED + trial)
+            if identity == "legacy":
+                transactions = [LegacyTransactionKey(tx) for tx in transactions]
+            pool = set()
+            insert_samples += time_trials(lambda: pool.update(transactions), 1)
+            lookup_samples += time_trials(lambda: all(tx in pool for tx in transactions), 1)
+
+        for operation, samples in (("insert", insert_samples), ("lookup", lookup_samples)):
+            results.append({
+                "name": f"mempool_{operation}",
+                "params": {"identity": identity, "transactions": count},
+                "seconds": summarize(samples),
+                "seconds_per_transaction": summarize([sample / count for sample in samples]),
+            })
+    return results
+
+
+def benchmark_mempool(sizes=BenchmarkSettings.MEMPOOL_SIZES, trials=BenchmarkSettings.TRIALS):
+    """
+    Time the selection of a block's transactions, the removal of the selected ones and existence checks,
+    for the legacy and the indexed mempool holding `size` pending transactions.
+    :return: List of results.
+    """
+    results = []
+    for size in sizes:
+        transactions = create_benchmark_transactions(size)
+        for tx in transactions:
+            tx.get_txid()  # cache the ids up front, so both implementations are timed with warm ids
+        probes = transactions[::max(1, size // BlockSettings.MAX_TRANSACTIONS)]
+        for implementation in ("legacy", "indexed"):
+            mempool = LegacyMempool() if implementation == "legacy" else Mempool("benchmark", max_transactions=None, max_bytes=None)
+            insert_seconds = time_trials(lambda: mempool.add_transactions(transactions), 1)
+            select_samples = []
+            remove_samples = []
+            for _ in range(trials):
+                selected = []
+                select_samples += time_trials(lambda: selected.extend(mempool.select_transactions()), 1)
+                remove_samples += time_trials(lambda: mempool.remove_transactions(selected), 1)
+                mempool.add_transactions(selected)  # keep the pool at the same size for the next trial
+            lookup_samples = time_trials(lambda: all(mempool.has_transaction(tx) for tx in probes), trials)
+
+            params = {"implementation": implementation, "transactions": size}
+            results += [
+                {"name": "mempool_insert_all", "params": params, "seconds": summarize(insert_seconds)},
+                {"name": "mempool_select", "params": params, "seconds": summarize(select_samples)},
+                {"name": "mempool_remove_selected", "params": params, "seconds": summarize(remove_samples)},
+                {"name": "mempool_lookup", "params": params,
+                 "seconds": summarize([sample / len(probes) for sample in lookup_samples])},
+            ]
+    return results
+
+
+def run_benchmarks(output_path=None):
+    results = benchmark_identity()
+    for result in results:
+        print(f"{result['name']} {result['params']}: p50 {result['seconds_per_transaction']['p50'] * 1e6:.2f}us/tx")
+    mempool_results = benchmark_mempool()
+    for result in mempool_results:
+        print(f"{result['name']} {result['params']}: p50 {result['seconds']['p50'] * 1e3:.3f}ms")
+    return save_results("mempool", results + mempool_results, output_path)
+
+
+if __name__ == "__main__":
+    run_benchmarks()
@@ -1,14 +1,21 @@
 import json
 import os
 import threading
-from utils.config import MsgTypes, MsgSubTypes, FilesSettings, NodeSettings
+import time
+from utils.config import MsgTypes, MsgSubTypes, FilesSettings, NodeSettings, MinerSettings, BlockSettings, \
+    CheckpointSettings, SyncSettings
 from network.user import User
 from network.miner.mempool import Mempool
 from network.miner.multiprocess_mining import MultiprocessMining
+from network.miner.transaction_ingress import TransactionIngress
 from core.transaction import get_sk_pk_pair, create_sample_transaction
 from core.block import Block
+from core.signature_cache import signature_cache
 from core.blockchain import create_sample_blockchain, Blockchain
+from core.block_store import BlockStore
+from core.checkpoints import CheckpointStore
 from utils.logging_utils import configure_logger
+from utils.metrics_server import MetricsServer
 
 
 class Miner(User):
@@ -26,13 +33,15 @@ class Miner(User):
             ip=None,
             port=None,
             child_dir="Miner",
-            name=NodeSettings.DEFAULT_NAME
+            name=NodeSettings.DEFAULT_NAME,
+            metrics_port=MinerSettings.METRICS_PORT
     ):
         """
         Initialize a miner instance with a blockchain reference, mempool, difficulty level, and necessary sync elements.
 
         :param blockchain: The core object this miner will add mined blocks to.
         :param mempool: A list or object representing the transaction pool from which this miner selects transactions.
+        :param metrics_port: Local port to serve the mining stats on, or None to not serve them.
         """
 
         super().__init__(
@@ -52,10 +61,21 @@ class Miner(User):
         )
 
         self.mempool = mempool if mempool else Mempool(name, child_dir)
-        self.mempool_lock = threading.Lock()
+        self.mempool_lock = self.mempool.lock
+        self.ingress = TransactionIngress(self.add_verified_transactions, name, child_dir)
+        self.ingress.start()
         self.multi_miner = MultiprocessMining(name, child_dir=child_dir)
         self.new_block_event = threading.Event()
+        self.template_outdated = threading.Event()
+        self.template_min_tip = None  # lowest tip in the block being mined, None when not mining
+        self.template_started = 0
         self.currently_mining = threading.Event()
+        self.blocks_mined = 0
+        self.blocks_received = 0
+        self.metrics_server = None
+        if metrics_port is not None:
+            self.metrics_server = MetricsServer(self.get_mining_stats, metrics_port)
+            self.metrics_server.start()
 
         directory_name = f"{child_dir}_{name}"
         self.blockchain_path = os.path.join(FilesSettings.DATA_ROOT_DIRECTORY,
@@ -64,57 +84,174 @@ class Miner(User):
                                             )
         full_directory = os.path.dirname(self.blockchain_path)
         os.makedirs(full_directory, exist_ok=True)
+        self.block_store = BlockStore(os.path.join(full_directory, FilesSettings.BLOCK_STORE_FOLDER_NAME))
+        self.checkpoint_store = CheckpointStore(os.path.join(full_directory, FilesSettings.CHECKPOINTS_FILE_NAME))
         if blockchain:
             self.blockchain = blockchain
+            self.blockchain.attach_block_store(self.block_store)
+            self.checkpoint_store.clear()
         else:
             self.blockchain = self.load_blockchain()
+            self.validate_loaded_blockchain()
 
         self.save_blockchain()
 
     def __del__(self):
         super().__del__()
         self.save_blockchain()
+        self.block_store.close()
+        self.ingress.stop()
+        if self.metrics_server:
+            self.metrics_server.stop()
 
     def start_mining(self, blocks_num=-1):
         if self.currently_mining.is_set():
             self.miner_logger.info(f"can't start mining again, process already mining, ")
         self.currently_mining.set()
+        self.multi_miner.start()
         threading.Thread(target=self.mine_blocks, args=(blocks_num,)).start()
 
     def stop_mining(self):
         self.currently_mining.clear()
         self.new_block_event.set()
+        self.multi_miner.shutdown()
+
+    def get_hashrates(self):
+        """
+        :return: Dictionary of mining process id to its latest measured hashes per second.
+        """
+        return self.multi_miner.get_hashrates()
+
+    def get_cancel_latency(self):
+        """
+        :return: Statistics of the time it takes the mining processes to stop working on a cancelled block.
+        """
+        return self.multi_miner.get_cancel_latency()
+
+    def get_mining_stats(self):
+        """
+        :return: A JSON serializable snapshot of the mining processes stats and the miner's block counters.
+        """
+        stats = self.multi_miner.get_stats()
+        stats["blocks_mined"] = self.blocks_mined
+        stats["blocks_received"] = self.blocks_received
+        stats["currently_mining"] = self.currently_mining.is_set()
+        stats["signature_cache"] = signature_cache.get_stats()
+        stats["ingress"] = self.ingress.get_stats()
+        with self.mempool_lock:
+            stats["mempool"] = self.mempool.get_stats()
+        return stats
 
     def load_blockchain(self):
         """
-        Loads the blockchain from a file if it exists.
+        Loads the blockchain from the block store, or migrates a legacy JSON blockchain file into it.
         :return: The blockchain if exists, else initialized blockchain
         """
+        if len(self.block_store) > 0:
+            try:
+                blockchain = Blockchain.from_block_store(self.block_store)
+                self.miner_logger.info(f"core loaded from {self.block_store.directory}")
+                return blockchain
+            except Exception as e:
+                self.miner_logger.error(f"Error loading blockchain: {e}")
+
         if os.path.exists(self.blockchain_path) and not os.path.getsize(self.blockchain_path) == 0:
             try:
                 with open(self.blockchain_path, "r") as f:
                     blockchain_data = json.load(f)
                     blockchain = Blockchain.from_dict(blockchain_data)
-                self.miner_logger.info(f"core loaded from {self.blockchain_path}")
+                blockchain.attach_block_store(self.block_store)
+                self.miner_logger.info(f"core migrated from {self.blockchain_path} to {self.block_store.directory}")
                 return blockchain
             except Exception as e:
                 self.miner_logger.error(f"Error loading blockchain: {e}")
 
-        self.miner_logger.info(f"No blockchain file found at path {self.blockchain_path}, initializing new blockchain.")
-        return Blockchain()
+        self.miner_logger.info(f"No blockchain found at {self.block_store.directory}, initializing new blockchain.")
+        blockchain = Blockchain()
+        blockchain.attach_block_store(self.block_store)
+        return blockchain
+
+    def validate_loaded_blockchain(self):
+        """
+        Validates the loaded blockchain from the latest checkpoint, so a restart only checks the blocks after it.
+        The whole chain is revalidated in the background, and the checkpoints are dropped if it turns out invalid.
+        Without a checkpoint the whole chain is only validated in the background, so the node serves right away.
+        Invalid blocks are dropped in all cases.
+        :return: None
+        """
+        checkpoint = self.checkpoint_store.get_latest(self.public_key)
+        if not (checkpoint and self.blockchain.set_checkpoint(checkpoint)):
+            self.miner_logger.info(f"No checkpoint to validate the blockchain from, validating it in the background")
+            self.blockchain.validate_in_background(self.on_background_validation)
+            return
+
+        self.miner_logger.info(f"Validating blockchain from {checkpoint}")
+        if not self.blockchain.is_chain_valid():
+            self.miner_logger.error(f"Loaded blockchain is invalid after height {self.blockchain.validated_height}")
+            self.drop_invalid_blocks(self.blockchain.first_invalid_height)
+
+        if CheckpointSettings.BACKGROUND_REVALIDATION:
+            self.blockchain.validate_in_background(self.on_background_validation)
+
+    def on_background_validation(self, valid, first_invalid_height):
+        if valid:
+            self.miner_logger.info(f"Background revalidation of the blockchain succeeded")
+            return
+        self.miner_logger.error(f"Background revalidation of the blockchain failed, dropping the checkpoints")
+        self.checkpoint_store.clear()
+        self.drop_invalid_blocks(first_invalid_height)
+
+    def drop_invalid_blocks(self, height):
+        """
+        Cuts the blockchain back to the block before the first invalid one,
+        so the node stops mining on and serving invalid blocks.
+        The transactions of the dropped blocks are submitted again, and verified like incoming ones.
+        :param height: Height of the first invalid block, None when the blocks are valid and only the
+                       checkpoint's account state did not match.
+        :return: None
+        """
+        if height is None:
+            return
+        dropped = self.blockchain.truncate(height - 1)
+        self.miner_logger.error(f"Dropped {len(dropped)} invalid blocks from height {height},"
+                                f" latest block: {self.blockchain.get_latest_block()}")
+
+        # besides the tipping and bonus transactions, which only belong to their block
+        for block in dropped:
+            for transaction in block.transactions[1:-1]:
+                self.ingress.submit(transaction)
+
+        # like a new block, restart mining on the new latest block
+        self.new_block_event.set()
+        self.multi_miner.cancel()
+
+    def update_checkpoint(self):
+        """
+        Creates a checkpoint every CheckpointSettings.INTERVAL validated blocks.
+        :return: None
+        """
+        latest = self.checkpoint_store.checkpoints[-1].height if self.checkpoint_store.checkpoints else 0
+        if self.blockchain.validated_height - latest < CheckpointSettings.INTERVAL:
+            return
+        try:
+            checkpoint = self.blockchain.create_checkpoint(self.private_key)
+            self.checkpoint_store.add(checkpoint)
+            self.miner_logger.info(f"Saved {checkpoint}")
+        except Exception as e:
+            self.miner_logger.error(f"Error saving checkpoint: {e}")
 
     def save_blockchain(self):
         """
-        Saves the current blockchain to a file in JSON format.
+        Blocks are appended to the block store as they are added to the blockchain,
+        this only makes sure they reached the disk.
         :return: None
         """
         try:
-            with open(self.blockchain_path, "w") as f:
-                blockchain_dict = self.blockchain.to_dict()
-                json.dump(blockchain_dict, f, indent=4)
-            self.miner_logger.info(f"blockchain saved to {self.blockchain_path}")
+            self.block_store.sync()
+            self.miner_logger.debug(f"blockchain synced to {self.block_store.directory}")
         except Exception as e:
             self.miner_logger.error(f"Error saving blockchain: {e}")
+        self.update_checkpoint()
 
     def serve_blockchain_request(self, latest_hash):
         """
@@ -125,23 +262,66 @@ class Miner(User):
                                f" sending blockchain: {blockchain}")
         return blockchain
 
+    def serve_headers_request(self, latest_hash):
+        """
+        Handles requests from peers for the headers following their latest hash.
+        :return: Up to SyncSettings.MAX_HEADERS headers, or None if the hash is not in the blockchain
+        """
+        headers = self.blockchain.get_headers_after(latest_hash, SyncSettings.MAX_HEADERS)
+        self.miner_logger.info(f"received headers request with latest hash: {latest_hash},"
+                               f" sending {len(headers) if headers is not None else 'no'} headers")
+        return headers
+
+    def serve_blocks_request(self, start_hash, count):
+        """
+        Handles requests from peers for a range of blocks.
+        :return: Up to SyncSettings.BLOCKS_PER_REQUEST blocks after the hash, or None if there are none
+        """
+        blocks = self.blockchain.get_block_range(start_hash, min(count, SyncSettings.BLOCKS_PER_REQUEST))
+        self.miner_logger.info(f"received blocks request after hash: {start_hash},"
+                               f" sending {len(blocks) if blocks else 'no'} blocks")
+        return blocks or None
+
     def process_transaction_data(self, transaction):
         # first, check if the transaction was already seen
         if self.mempool.has_transaction(transaction):
             return True
 
-        if not transaction.verify_signature():
-            self.miner_logger.warning(f"Found unverified transaction")
-            return
+        # verification and the mempool insert are batched with other incoming transactions
+        self.ingress.submit(transaction)
+
+    def add_verified_transactions(self, transactions):
         with self.mempool_lock:
-            self.mempool.add_transactions([transaction])
+            added = self.mempool.add_transactions(transactions)
+
+        self.miner_logger.info(f"added {len(added)} of {len(transactions)} verified transactions to mempool")
+        self.retarget_template(added)
 
-        self.miner_logger.info(f"added transaction {transaction} to mempool")
+    def retarget_template(self, transactions):
+        """
+        Restart the current mining job with a new block template if better paying transactions arrived.
+        Rebuilds are limited to one per MinerSettings.RETARGET_INTERVAL, so a stream of transactions can't starve
+        the mining processes.
+        :param transactions: The newly added transactions.
+        :return: True if the job was cancelled to rebuild the template
+        """
+        min_tip = self.template_min_tip
+        if min_tip is None or not transactions:
+            return False
+        if time.monotonic() - self.template_started < MinerSettings.RETARGET_INTERVAL:
+            return False
+        if max(tx.tip for tx in transactions) <= min_tip:
+            return False
+        self.template_outdated.set()
+        self.multi_miner.cancel()
+        self.miner_logger.info(f"Rebuilding the block template for transactions with tips above {min_tip}")
+        return True
 
     def process_blockchain_data(self, blockchain):
         super().process_blockchain_data(blockchain)
 
         self.new_block_event.set()
+        self.multi_miner.cancel()
 
         # add blockchain to current blockchain
         relevant_blocks = blockchain.get_blocks_after(self.blockchain.get_latest_block().hash)
@@ -150,6 +330,7 @@ class Miner(User):
             if self.blockchain.filter_and_add_block(block):
                 valid_blocks += 1
                 self.mempool.remove_transactions(block.transactions)
+        self.save_blockchain()
 
         self.miner_logger.info(f"received blockchain ({blockchain.to_dict()}) send and added {valid_blocks} blocks")
 
@@ -162,11 +343,14 @@ class Miner(User):
         super().process_block_data(block)
         # only if new blocks
         if self.blockchain.filter_and_add_block(block):
+            self.blocks_received += 1
+            self.mempool.remove_transactions(block.transactions)
             self.miner_logger.info(f"Added new block to blockchain: {block}")
         else:
             self.miner_logger.info(f"Rejected mined block: {block}")
         self.save_blockchain()
         self.new_block_event.set()
+        self.multi_miner.cancel()
 
     def mine_blocks(self, blocks_num):
         """
@@ -174,31 +358,67 @@ class Miner(User):
         """
         while self.currently_mining.is_set() and blocks_num != 0:
             self.new_block_event.clear()  # Reset the event since we're about to start mining
-
-            # check for available transaction until a block is made
-            current_block = self.create_block()
+            self.template_outdated.clear()
+
+            # wait for transactions instead of polling the mempool, until a block can be made.
+            # if none of the pending transactions can be mined, wait for new ones,
+            # or for a new block, which may fund their senders
+            known_version = None
+            known_tip = self.blockchain.get_latest_block().hash
+            current_block = None
             while current_block is None:
+                if not self.currently_mining.is_set():
+                    return
+                latest_hash = self.blockchain.get_latest_block().hash
+                if latest_hash != known_tip:
+                    known_tip = latest_hash
+                    known_version = None
+                if not self.mempool.wait_for_transactions(known_version,
+                                                          timeout=MinerSettings.TEMPLATE_POLL_INTERVAL):
+                    continue
+                known_version = self.mempool.version
                 current_block = self.create_block()
 
+            # the block is full when it has the maximum number of transactions besides the tipping and bonus ones
+            if len(current_block.transactions) - 2 >= BlockSettings.MAX_TRANSACTIONS:
+                self.template_min_tip = min(tx.tip for tx in current_block.transactions[1:-1])
+            else:
+                self.template_min_tip = 0
+            self.template_started = time.monotonic()
+
             # Begin mining with the given difficulty
-            mined_block = self.multi_miner.get_block_hash(current_block, current_block.difficulty)
+            # a new block sets new_block_event, which cancels the job in the mining processes
+            mined_block = self.multi_miner.get_block_hash(
+                current_block,
+                current_block.difficulty,
+                cancel_event=self.new_block_event
+            )
+
+            self.template_min_tip = None
 
             # if the mining was interrupted, the mined block is None
-            if not mined_block:
-                self.miner_logger.info(f"Mining interrupted by a new block, resetting mining process")
+            if not mined_block and self.template_outdated.is_set():
+                self.miner_logger.info(f"Mining restarted with a new block template")
+            elif not mined_block:
+                self.miner_logger.info(f"Mining interrupted by a new block, resetting mining process."
+                                       f" cancel latency: {self.get_cancel_latency()}")
+            elif not self.blockchain.filter_and_add_block(mined_block):
+                self.miner_logger.info(f"Mined block no longer extends the blockchain, dropping it: {mined_block}")
             else:
-                self.blockchain.filter_and_add_block(mined_block)
                 blocks_num -= 1
+                self.blocks_mined += 1
                 self.send_distributed_message(MsgTypes.BROADCAST, MsgSubTypes.BLOCK, mined_block)
                 self.mempool.remove_transactions(mined_block.transactions)
                 self.save_blockchain()
                 self.miner_logger.info(f"Block mined and added to blockchain successfully. Block: {mined_block}")
+                self.miner_logger.info(f"Mining processes hashrates (hashes/sec): {self.get_hashrates()}")
 
     def create_block(self):
         # Lock mempool to prevent transaction modifications
         with self.mempool_lock:
             # build new block
-            transactions = self.mempool.select_transactions()
+            # only select transactions the senders can pay, so the block never overspends an account
+            transactions = self.mempool.select_transactions(get_balance=self.blockchain.get_balance)
             if len(transactions) == 0:
                 return None
             previous_hash = self.blockchain.get_latest_block().hash
@@ -212,7 +432,7 @@ class Miner(User):
 
 
 def assert_file_saving():
-    pk, sk = get_sk_pk_pair()
+    sk, pk = get_sk_pk_pair()
     ip = "127.0.0.1"
     port = 8110
     miner1 = Miner(pk, sk, blockchain=create_sample_blockchain(), port=port, ip=ip)
@@ -226,9 +446,37 @@ def assert_file_saving():
     assert first_blockchain.to_dict() == second_blockchain.to_dict(), "Loaded blockchain data does not match saved data"
 
 
+def assert_synced_blocks_clear_mempool():
+    sk, pk = get_sk_pk_pair()
+    miner = Miner(pk, sk, blockchain=Blockchain(), port=8111, ip="127.0.0.1")
+    blocks = create_sample_blockchain().chain[1:]
+    miner.mempool.add_transactions([tx for block in blocks for tx in block.transactions[1:-1]])
+
+    # synchronized blocks are handed over as a batch
+    miner.process_blocks(blocks)
+    assert miner.blockchain.get_latest_block().hash == blocks[-1].hash, "Synced blocks should be added"
+    assert len(miner.mempool.transactions) == 0, "Synced blocks should remove their transactions from the mempool"
+
+
+def assert_dropped_blocks_return_transactions():
+    sk, pk = get_sk_pk_pair()
+    blockchain = create_sample_blockchain()
+    miner = Miner(pk, sk, blockchain=blockchain, port=8112, ip="127.0.0.1")
+    transactions = [tx for block in blockchain.chain[1:] for tx in block.transactions[1:-1]]
+
+    # dropping the blocks from height 1 keeps only the genesis block, and their transactions are pending again
+    miner.drop_invalid_blocks(1)
+    assert len(miner.blockchain.chain) == 1 and len(miner.block_store) == 1, "Invalid blocks should be dropped"
+    miner.mempool.wait_for_transactions(min_transactions=len(transactions), timeout=5)
+    assert all(miner.mempool.has_transaction(tx) for tx in transactions), \
+        "Transactions of dropped blocks should return to the mempool"
+
+
 def assertion_checks():
     # first, ensure that blockchain saving also works for miner with regular blockchain
     assert_file_saving()
+    assert_synced_blocks_clear_mempool()
+    assert_dropped_blocks_return_transactions()
 
     # secondly, check mine function
     sk, pk = get_sk_pk_pair()
@@ -240,3 +488,5 @@ def assertion_checks():
 
 if __name__ == "__main__":
     assert_file_saving()
+    assert_synced_blocks_clear_mempool()
+    assert_dropped_blocks_return_transactions()
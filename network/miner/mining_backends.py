@@ -0,0 +1,147 @@
+import hashlib
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+from core.block import Block, NONCE_STRUCT, create_sample_block
+from utils.config import MinerSettings
+
+# Constants for assertion error messages
+NONCE_ENCODING_ERROR = "Batched nonce encoding should match Block.encode_nonce"
+BACKENDS_MISMATCH_ERROR = "Batched backend should find the same nonce as the reference backend"
+HASH_MISMATCH_ERROR = "Found hash should match the block hash"
+
+
+class MiningBackend(ABC):
+    """
+    Searches a nonce range for a hash that meets the difficulty.
+    Backends only get the block hash prefix, so they never touch the block itself.
+    """
+
+    @abstractmethod
+    def search(self, hash_prefix, difficulty, start_nonce, end_nonce, should_stop):
+        """
+        Search the nonce range [start_nonce, end_nonce) for a hash with `difficulty` leading zeros.
+        :param hash_prefix: The encoded block data preceding the nonce (see Block.get_hash_prefix).
+        :param difficulty: Number of leading zero hex digits required.
+        :param start_nonce: Start of the nonce range.
+        :param end_nonce: End of the nonce range (exclusive).
+        :param should_stop: Callable with no arguments, returns True when the search should be abandoned.
+        :return: Tuple of (nonce, block hash, attempts). nonce and hash are None if nothing was found.
+        """
+        pass
+
+
+class ReferenceBackend(MiningBackend):
+    """
+    The original nonce loop: one nonce per iteration, compared as a hex string.
+    Kept as the source of truth for correctness checks of the faster backends.
+    """
+
+    def search(self, hash_prefix, difficulty, start_nonce, end_nonce, should_stop):
+        target = "0" * difficulty
+        midstate = hashlib.sha256(hash_prefix)
+        attempts = 0
+
+        for nonce in range(start_nonce, end_nonce):
+            if should_stop():
+                return None, None, attempts
+
+            attempt = midstate.copy()
+            attempt.update(Block.encode_nonce(nonce))
+            block_hash = attempt.hexdigest()
+            attempts += 1
+
+            if block_hash[:difficulty] == target:
+                return nonce, block_hash, attempts
+
+        return None, None, attempts
+
+
+class BatchedBackend(MiningBackend):
+    """
+    Generates the nonce suffixes of a whole chunk at once with NumPy and checks the
+    difficulty against the raw digest bytes instead of hex strings.
+    The stop callable is only checked once per chunk.
+    """
+
+    def __init__(self, batch_size=MinerSettings.BATCH_SIZE):
+        self.batch_size = batch_size
+
+    def search(self, hash_prefix, difficulty, start_nonce, end_nonce, should_stop):
+        midstate = hashlib.sha256(hash_prefix)
+        copy_midstate = midstate.copy
+        zero_bytes_count, odd_nibble = divmod(difficulty, 2)
+        zero_bytes = bytes(zero_bytes_count)
+        attempts = 0
+
+        for batch_start in range(start_nonce, end_nonce, self.batch_size):
+            if should_stop():
+                return None, None, attempts
+
+            batch_end = min(batch_start + self.batch_size, end_nonce)
+            for offset, suffix in enumerate(encode_nonce_range(batch_start, batch_end)):
+                attempt = copy_midstate()
+                attempt.update(suffix)
+                digest = attempt.digest()
+                if digest.startswith(zero_bytes) and (not odd_nibble or digest[zero_bytes_count] < 0x10):
+                    return batch_start + offset, digest.hex(), attempts + offset + 1
+            attempts += batch_end - batch_start
+
+        return None, None, attempts
+
+
+MINING_BACKENDS = {
+    "reference": ReferenceBackend,
+    "batched": BatchedBackend,
+}
+
+
+def get_mining_backend(name=MinerSettings.MINING_BACKEND):
+    """
+    Create the mining backend registered under the given name.
+    :param name: The backend name, one of MINING_BACKENDS.
+    :return: A MiningBackend instance.
+    """
+    if name not in MINING_BACKENDS:
+        raise ValueError(f"Unknown mining backend '{name}'. options: {list(MINING_BACKENDS)}")
+    return MINING_BACKENDS[name]()
+
+
+def encode_nonce_range(start_nonce, end_nonce):
+    """
+    Encode a range of nonces in one go, the same way Block.encode_nonce encodes a single nonce.
+    :param start_nonce: Start of the nonce range.
+    :param end_nonce: End of the nonce range (exclusive).
+    :return: List of encoded nonce suffixes.
+    """
+    encoded = np.arange(start_nonce, end_nonce, dtype=np.uint64).astype(">u4").tobytes()
+    width = NONCE_STRUCT.size
+    return [encoded[i:i + width] for i in range(0, len(encoded), width)]
+
+
+def assertion_check():
+    """
+    Checks that the batched backend agrees with the reference backend.
+    :return: None
+    """
+    block = create_sample_block()
+    hash_prefix = block.get_hash_prefix()
+
+    for nonce in (0, 9, 10, 12345, 2 ** 32 - 1):
+        assert encode_nonce_range(nonce, nonce + 1) == [Block.encode_nonce(nonce)], NONCE_ENCODING_ERROR
+
+    for difficulty in range(1, 4):
+        reference = ReferenceBackend().search(hash_prefix, difficulty, 0, 2 ** 20, lambda: False)
+        batched = BatchedBackend(batch_size=1000).search(hash_prefix, difficulty, 0, 2 ** 20, lambda: False)
+        assert reference == batched, BACKENDS_MISMATCH_ERROR
+
+        block.nonce = batched[0]
+        assert block.calculate_hash() == batched[1], HASH_MISMATCH_ERROR
+        assert batched[1][:difficulty] == "0" * difficulty, HASH_MISMATCH_ERROR
+
+    print("All mining backend assertions passed!")
+
+
+if __name__ == "__main__":
+    assertion_check()
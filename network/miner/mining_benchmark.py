@@ -0,0 +1,128 @@
+"""
+Reproducible benchmarks of the mining hot path: Block.calculate_hash, the nonce search backends,
+and the full MultiprocessMining.get_block_hash, with a cold (new) and a warm (reused) process pool.
+Blocks are built from a fixed seed and fixed keys, so runs on different commits are comparable.
+"""
+import random
+
+from core.block import Block
+from core.transaction import Transaction
+from network.miner.mining_backends import MINING_BACKENDS, get_mining_backend
+from network.miner.multiprocess_mining import MultiprocessMining
+from utils.benchmark_utils import time_trials, summarize, save_results
+from utils.config import BenchmarkSettings, BlockSettings, KeysSettings, MinerSettings
+from utils.keys_manager import load_key
+
+BENCHMARK_TIMESTAMP = 1700000000.0
+IMPOSSIBLE_DIFFICULTY = 64  # makes the backends search the whole range
+
+
+def create_benchmark_block(transactions_num, seed=BenchmarkSettings.SEED, trial=0):
+    """
+    Build a deterministic block. The transactions are not signed, signatures are not part of the hashed data.
+    :param transactions_num: Number of transactions in the block.
+    :param seed: Seed for the transaction amounts and tips.
+    :param trial: Trial number, moves the timestamp so every trial mines a different block.
+    :return: The block.
+    """
+    rng = random.Random(seed * 100003 + transactions_num)
+    sender_pk = load_key(KeysSettings.LORD_PK)
+    recipient_pk = load_key(KeysSettings.GENESIS_PK)
+    transactions = [
+        Transaction(sender_pk, recipient_pk, rng.randint(1, 1000), rng.randint(0, 100))
+        for _ in range(transactions_num)
+    ]
+    return Block("0" * 64, transactions, timestamp=BENCHMARK_TIMESTAMP + trial)
+
+
+def benchmark_calculate_hash(blocks, trials):
+    results = []
+    for transactions_num, block in blocks.items():
+        samples = time_trials(block.calculate_hash, trials, warmup=1)
+        results.append({
+            "name": "calculate_hash",
+            "params": {"transactions": transactions_num},
+            "seconds": summarize(samples),
+        })
+    return results
+
+
+def benchmark_backends(blocks, trials, nonces=BenchmarkSettings.NONCES_PER_TRIAL):
+    results = []
+    for backend_name in MINING_BACKENDS:
+        backend = get_mining_backend(backend_name)
+        for transactions_num, block in blocks.items():
+            hash_prefix = block.get_hash_prefix()
+            samples = time_trials(
+                lambda: backend.search(hash_prefix, IMPOSSIBLE_DIFFICULTY, 0, nonces, lambda: False),
+                trials
+            )
+            results.append({
+                "name": "backend_search",
+                "params": {"backend": backend_name, "transactions": transactions_num, "nonces": nonces},
+                "seconds": summarize(samples),
+                "hashes_per_second": summarize([nonces / sample for sample in samples]),
+            })
+    return results
+
+
+def benchmark_get_block_hash(transactions_num, difficulties, trials, process_counts):
+    results = []
+    for processes in process_counts:
+        for difficulty in difficulties:
+            # cold: a new pool for every block, as before the pool was persistent
+            cold_samples = []
+            for trial in range(trials):
+                block = create_benchmark_block(transactions_num, trial=trial)
+                miner = MultiprocessMining("benchmark", num_processes=processes)
+                cold_samples += time_trials(lambda: miner.get_block_hash(block, difficulty), 1)
+                miner.shutdown()
+
+            # warm: the pool is already running
+            miner = MultiprocessMining("benchmark", num_processes=processes)
+            miner.start()
+            warm_samples = []
+            for trial in range(trials):
+                block = create_benchmark_block(transactions_num, trial=trial)
+                warm_samples += time_trials(lambda: miner.get_block_hash(block, difficulty), 1)
+            miner.shutdown()
+
+            for pool, samples in (("cold", cold_samples), ("warm", warm_samples)):
+                results.append({
+                    "name": "get_block_hash",
+                    "params": {
+                        "pool": pool,
+                        "processes": processes,
+                        "difficulty": difficulty,
+                        "transactions": transactions_num,
+                        "backend": MinerSettings.MINING_BACKEND,
+                    },
+                    "seconds": summarize(samples),
+                })
+    return results
+
+
+def run_benchmarks(
+        trials=BenchmarkSettings.TRIALS,
+        transactions_nums=(0, 16, 256, BlockSettings.MAX_TRANSACTIONS),
+        difficulties=range(1, 6),
+        process_counts=(1, BlockSettings.PROCESSES_NUMBER),
+        output_path=None
+):
+    """
+    Run all the mining benchmarks and save them as JSON.
+    :return: The path of the results file.
+    """
+    blocks = {transactions_num: create_benchmark_block(transactions_num) for transactions_num in transactions_nums}
+    results = benchmark_calculate_hash(blocks, trials)
+    results += benchmark_backends(blocks, trials)
+    results += benchmark_get_block_hash(BlockSettings.MAX_TRANSACTIONS, difficulties, trials, process_counts)
+    path = save_results("mining", results, output_path)
+
+    for result in results:
+        print(f"{result['name']} {result['params']}: p50 {result['seconds']['p50']:.6f}s")
+    return path
+
+
+if __name__ == "__main__":
+    run_benchmarks()
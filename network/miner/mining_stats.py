@@ -0,0 +1,135 @@
+import threading
+import time
+from collections import deque
+
+from utils.config import MinerSettings
+
+
+class MiningStats:
+    """
+    Thread safe counters of the mining processes: hashrates, job times, stale work and time to solution.
+    Hashes spent on a job after it was cancelled or solved by another worker count as stale.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started_at = time.time()
+        self.workers = {}  # worker id : {"hashes", "seconds", "hashrate"}
+        self.total_hashes = 0
+        self.stale_hashes = 0
+        self.active_jobs = {}  # job id : job record
+        self.finished_jobs = deque(maxlen=MinerSettings.JOBS_KEPT)
+        self.solved_jobs = 0
+        self.aborted_jobs = 0
+        self.solution_times = {}  # difficulty : {"count", "total", "best"} in seconds
+        self.cancel_latencies = deque(maxlen=MinerSettings.LATENCY_SAMPLES)
+
+    def start_job(self, job_id, difficulty):
+        with self.lock:
+            self.active_jobs[job_id] = {
+                "job_id": job_id,
+                "difficulty": difficulty,
+                "started": time.time(),
+                "finished": None,
+                "outcome": None,
+                "hashes": 0,
+            }
+
+    def finish_job(self, job_id, solved):
+        """
+        Close a job. The hashes of an aborted job are all stale.
+        :param job_id: The job id.
+        :param solved: True if a valid nonce was found, False if the job was aborted.
+        """
+        with self.lock:
+            job = self.active_jobs.pop(job_id, None)
+            if not job:
+                return
+            job["finished"] = time.time()
+            duration = job["finished"] - job["started"]
+            if solved:
+                job["outcome"] = "solved"
+                self.solved_jobs += 1
+                times = self.solution_times.setdefault(job["difficulty"], {"count": 0, "total": 0.0, "best": None})
+                times["count"] += 1
+                times["total"] += duration
+                times["best"] = duration if times["best"] is None else min(times["best"], duration)
+            else:
+                job["outcome"] = "aborted"
+                self.aborted_jobs += 1
+                self.stale_hashes += job["hashes"]
+            self.finished_jobs.append(job)
+
+    def record_chunk(self, job_id, worker_id, attempts, elapsed):
+        """
+        Count the hashes of a chunk a worker finished or stopped.
+        """
+        with self.lock:
+            worker = self.workers.setdefault(worker_id, {"hashes": 0, "seconds": 0.0, "hashrate": 0.0})
+            worker["hashes"] += attempts
+            worker["seconds"] += elapsed
+            if elapsed > 0:
+                worker["hashrate"] = attempts / elapsed
+            self.total_hashes += attempts
+
+            job = self.active_jobs.get(job_id)
+            if job:
+                job["hashes"] += attempts
+            else:
+                self.stale_hashes += attempts
+
+    def record_cancel_latency(self, latency):
+        with self.lock:
+            self.cancel_latencies.append(latency)
+
+    def get_hashrates(self):
+        """
+        :return: Dictionary of worker id to hashes per second, measured over the worker's latest chunk.
+        """
+        with self.lock:
+            return {worker_id: worker["hashrate"] for worker_id, worker in self.workers.items()}
+
+    def get_cancel_latency(self):
+        """
+        Cancel latency is the time from cancelling a job until a worker that was searching it stopped.
+        :return: Dictionary with the number of samples, and the last, mean and max latency in seconds.
+        """
+        with self.lock:
+            samples = list(self.cancel_latencies)
+        if not samples:
+            return {"samples": 0, "last": None, "mean": None, "max": None}
+        return {
+            "samples": len(samples),
+            "last": samples[-1],
+            "mean": sum(samples) / len(samples),
+            "max": max(samples),
+        }
+
+    def snapshot(self):
+        """
+        :return: A JSON serializable dictionary of all the counters.
+        """
+        cancel_latency = self.get_cancel_latency()
+        with self.lock:
+            hashrates = {worker_id: worker["hashrate"] for worker_id, worker in self.workers.items()}
+            return {
+                "uptime": time.time() - self.started_at,
+                "hashrate": sum(hashrates.values()),
+                "workers": {str(worker_id): dict(worker) for worker_id, worker in self.workers.items()},
+                "total_hashes": self.total_hashes,
+                "stale_hashes": self.stale_hashes,
+                "stale_ratio": self.stale_hashes / self.total_hashes if self.total_hashes else 0.0,
+                "solved_jobs": self.solved_jobs,
+                "aborted_jobs": self.aborted_jobs,
+                "active_jobs": [dict(job) for job in self.active_jobs.values()],
+                "recent_jobs": [dict(job) for job in self.finished_jobs],
+                "time_to_solution": {
+                    str(difficulty): {
+                        "count": times["count"],
+                        "mean": times["total"] / times["count"],
+                        "best": times["best"],
+                    }
+                    for difficulty, times in self.solution_times.items()
+                },
+                "cancel_latency": cancel_latency,
+            }
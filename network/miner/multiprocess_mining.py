@@ -1,15 +1,86 @@
 import multiprocessing
+import queue
+import threading
 from core.block import create_sample_block
-from utils.config import BlockSettings
+from network.miner.mining_backends import get_mining_backend
+from network.miner.mining_stats import MiningStats
+from utils.config import BlockSettings, MinerSettings
 from utils.logging_utils import configure_logger
 import time
 
 
+class NonceScheduler:
+    """
+    Hands out small nonce chunks of a single block on demand.
+    When the nonce space of the block is exhausted, the block timestamp is rolled forward,
+    which gives a fresh hash prefix and a fresh nonce space.
+    """
+
+    def __init__(self, block, chunk_size=MinerSettings.CHUNK_SIZE, max_nonce=MinerSettings.MAX_NONCE):
+        """
+        :param block: The block being mined.
+        :param chunk_size: Number of nonces in every chunk.
+        :param max_nonce: Size of the nonce space of a single template.
+        """
+        self.block = block
+        self.chunk_size = chunk_size
+        self.max_nonce = max_nonce
+        self.template_id = 0
+        self.templates = {0: block.timestamp}  # template id : block timestamp
+        self.hash_prefix = block.get_hash_prefix()
+        self.next_nonce = 0
+
+    def next_chunk(self):
+        """
+        :return: Tuple of (template id, hash prefix, start nonce, end nonce).
+        """
+        if self.next_nonce >= self.max_nonce:
+            self._roll_template()
+        start_nonce = self.next_nonce
+        self.next_nonce = min(start_nonce + self.chunk_size, self.max_nonce)
+        return self.template_id, self.hash_prefix, start_nonce, self.next_nonce
+
+    def _roll_template(self):
+        """
+        Move the block timestamp forward to get a new hash prefix, and restart the nonce space.
+        :return: None
+        """
+        self.block.timestamp = max(time.time(), self.block.timestamp + 1e-6)
+        self.template_id += 1
+        self.templates[self.template_id] = self.block.timestamp
+        self.hash_prefix = self.block.get_hash_prefix()
+        self.next_nonce = 0
+
+    def apply_solution(self, template_id, nonce, block_hash):
+        """
+        Set the block fields to the solution found for one of the templates.
+        :return: The solved block.
+        """
+        self.block.timestamp = self.templates[template_id]
+        self.block.nonce = nonce
+        self.block.hash = block_hash
+        return self.block
+
+
 class MultiprocessMining:
-    def __init__(self, instance_id,  num_processes=BlockSettings.PROCESSES_NUMBER, child_dir="multiprocess_mining"):
+    """
+    Owns a pool of long-lived mining processes.
+    Every block is a new job, split into small nonce chunks that the workers pull from a shared queue,
+    so a slow worker only holds back its current chunk. A shared job counter lets the workers drop
+    a job as soon as it is replaced or cancelled.
+    """
+
+    def __init__(
+            self,
+            instance_id,
+            num_processes=BlockSettings.PROCESSES_NUMBER,
+            child_dir="multiprocess_mining",
+            backend_name=MinerSettings.MINING_BACKEND
+    ):
         """
         Initialize the MultiprocessMining class.
         :param num_processes: Number of processes to use for mining.
+        :param backend_name: Name of the mining backend the processes search with (see mining_backends).
         """
         self.multiproc_logger = configure_logger(
             class_name="multiprocess_mining",
@@ -17,125 +88,292 @@ class MultiprocessMining:
             instance_id=instance_id
         )
         self.num_processes = num_processes
-        self.new_block_event = multiprocessing.Event()
+        self.backend_name = backend_name
+
+        self.job_lock = threading.Lock()
+        self.job_id = 0
+        self.current_job = multiprocessing.Value("q", 0)
+        self.task_queue = multiprocessing.Queue()
+        self.result_queue = multiprocessing.Queue()
+        self.processes = []
+        self.pool_lock = threading.Lock()  # guards starting and stopping the processes
+        self.stopped = threading.Event()  # set by shutdown, until the pool is started again
+        self.stats = MiningStats()
+        self.cancel_times = {}  # cancelled job id : cancel time
 
-    def _mine_range(self, block_dict, difficulty, start_nonce, end_nonce, new_block_event, result_queue, block_class):
+    def start(self):
         """
-        Worker function to mine a block within a specific nonce range.
-        :param block_dict: Serialized Block object (dictionary) to be mined.
-        :param difficulty: The mining difficulty.
-        :param start_nonce: Start of the nonce range.
-        :param end_nonce: End of the nonce range.
-        :param new_block_event: Event to signal when a new block is found.
-        :param result_queue: Queue to store the mined block as a dictionary.
-        :param block_class: The Block class to deserialize the block.
-        """
-        target = "0" * difficulty
-        max_trailing_zeros = 0
-        best_hash = None
-
-        # Deserialize the block object
-        block = block_class.from_dict(block_dict)
-
-        for nonce in range(start_nonce, end_nonce):
-            if new_block_event.is_set():
-                return  # Stop mining if a new block is detected
-
-            block.nonce = nonce
-            block.hash = block.calculate_hash()
-
-            # Check if the hash meets the difficulty
-            if block.hash[:difficulty] == target:
-                result_queue.put(block.to_dict())  # Store serialized block
-                new_block_event.set()
+        Start the worker processes, if they are not running already.
+        Restarts the pool after a shutdown.
+        :return: None
+        """
+        with self.pool_lock:
+            self.stopped.clear()
+            self._start_processes()
+
+    def _start_processes(self):
+        """
+        Must be called with pool_lock held.
+        :return: None
+        """
+        if self.processes:
+            return
+        for worker_id in range(self.num_processes):
+            process = multiprocessing.Process(
+                target=_mining_worker,
+                args=(worker_id, self.backend_name, self.task_queue, self.current_job, self.result_queue),
+                daemon=True
+            )
+            process.start()
+            self.processes.append(process)
+        self.multiproc_logger.info(f"Started {self.num_processes} mining processes")
+
+    def shutdown(self):
+        """
+        Abort the current job and stop all the worker processes.
+        get_block_hash does not start them again, until start() is called.
+        :return: None
+        """
+        with self.pool_lock:
+            self.stopped.set()
+            self.cancel()
+            if not self.processes:
                 return
+            for _ in self.processes:
+                self.task_queue.put(None)
 
-            # Count trailing zeros in the current hash
-            trailing_zeros = len(block.hash) - len(block.hash.rstrip("0"))
-            if trailing_zeros > max_trailing_zeros:
-                max_trailing_zeros = trailing_zeros
-                best_hash = block.hash
+            for process in self.processes:
+                process.join(timeout=MinerSettings.SHUTDOWN_TIMEOUT)
+                if process.is_alive():
+                    self.multiproc_logger.warning(
+                        f"Mining process {process.pid} did not stop in time, terminating it")
+                    process.terminate()
+            self.processes = []
+        self.multiproc_logger.info("Mining processes stopped")
 
-            # Log the best hash every 100,000 attempts
-            if nonce % 100000 == 0 and not nonce == 0:
-                self.multiproc_logger.debug("Nonce: %d, Best hash so far: %s (Trailing zeros: %d)",
-                                            nonce, best_hash, max_trailing_zeros)
+    def cancel(self):
+        """
+        Abort the current job. The workers notice it within one batch of nonces,
+        and a waiting get_block_hash call returns None.
+        :return: None
+        """
+        with self.job_lock:
+            self._cancel_current_job()
 
-    def get_block_hash(self, block, difficulty):
+    def _cancel_current_job(self):
+        """
+        Move the shared job counter past the current job and remember when it was cancelled.
+        Must be called with job_lock held.
+        :return: None
         """
-        Mines the given block using multiple processes.
+        cancelled_job = self.job_id
+        self.job_id += 1
+        self.current_job.value = self.job_id
+
+        self.cancel_times[cancelled_job] = time.time()
+        while len(self.cancel_times) > MinerSettings.CANCEL_TIMES_KEPT:
+            self.cancel_times.pop(next(iter(self.cancel_times)))
+        # wake up get_block_hash in case it is waiting on the result queue
+        self.result_queue.put((cancelled_job, None, None, None, None, 0, 0, time.time(), True))
+
+    def get_hashrates(self):
+        """
+        :return: Dictionary of worker id to hashes per second, measured over the worker's latest chunk.
+        """
+        return self.stats.get_hashrates()
+
+    def get_cancel_latency(self):
+        """
+        Cancel latency is the time from cancelling a job until a worker that was searching it stopped.
+        :return: Dictionary with the number of samples, and the last, mean and max latency in seconds.
+        """
+        return self.stats.get_cancel_latency()
+
+    def get_stats(self):
+        """
+        :return: A JSON serializable snapshot of the mining counters (see MiningStats.snapshot).
+        """
+        snapshot = self.stats.snapshot()
+        snapshot["processes"] = len(self.processes)
+        snapshot["backend"] = self.backend_name
+        return snapshot
+
+    def _start_job(self, difficulty):
+        """
+        Retarget all the workers to a new job.
+        :param difficulty: The mining difficulty of the job.
+        :return: The new job id.
+        """
+        with self.job_lock:
+            self.job_id += 1
+            self.current_job.value = self.job_id
+            self.stats.start_job(self.job_id, difficulty)
+            return self.job_id
+
+    def _record_result(self, job_id, worker_id, attempts, elapsed, stopped_at, aborted):
+        """
+        Count the hashes of a finished chunk, and collect the cancel latency
+        from a worker that stopped searching a cancelled job.
+        """
+        if worker_id is None:
+            return  # a cancel notification, not a chunk
+        self.stats.record_chunk(job_id, worker_id, attempts, elapsed)
+        if aborted and job_id in self.cancel_times:
+            self.stats.record_cancel_latency(max(0.0, stopped_at - self.cancel_times[job_id]))
+
+    def get_block_hash(self, block, difficulty, cancel_event=None):
+        """
+        Mines the given block using the worker processes.
         :param block: The Block object to be mined.
         :param difficulty: The mining difficulty.
-        :return: The mined Block object with a valid hash, or None if aborted.
+        :param cancel_event: Optional event (threading or multiprocessing). Once set, the job is cancelled.
+        :return: The mined Block object with a valid hash, or None if aborted or the pool was shut down.
         """
-        processes = []
-        result_queue = multiprocessing.Queue()
+        with self.pool_lock:
+            if self.stopped.is_set():
+                self.multiproc_logger.info("Mining pool was shut down, not mining")
+                return None
+            self._start_processes()
+        scheduler = NonceScheduler(block)
+        job_id = self._start_job(difficulty)
 
-        # Serialize the block to a dictionary
-        block_dict = block.to_dict()
+        def put_chunk():
+            template_id, hash_prefix, start_nonce, end_nonce = scheduler.next_chunk()
+            self.task_queue.put((job_id, template_id, hash_prefix, difficulty, start_nonce, end_nonce))
 
-        # Calculate the nonce range for each process
-        nonce_range = 2**32 // self.num_processes  # Adjust for a suitable nonce range
-        for i in range(self.num_processes):
-            start_nonce = i * nonce_range
-            end_nonce = (i + 1) * nonce_range
-            process = multiprocessing.Process(
-                target=self._mine_range,
-                args=(block_dict, difficulty, start_nonce, end_nonce, self.new_block_event, result_queue, type(block))
-            )
-            processes.append(process)
-            process.start()
+        # keep a few chunks queued per worker, and hand out another one whenever a chunk is done
+        for _ in range(self.num_processes * MinerSettings.QUEUED_CHUNKS_PER_PROCESS):
+            put_chunk()
 
-        # Wait for any process to find a valid hash
         mined_block = None
         try:
-            mined_block_dict = result_queue.get(timeout=None)  # Wait indefinitely for a result
-            mined_block = type(block).from_dict(mined_block_dict)  # Deserialize the block
+            while True:
+                if cancel_event is not None and cancel_event.is_set():
+                    with self.job_lock:
+                        if self.job_id == job_id:
+                            self._cancel_current_job()
+                    self.multiproc_logger.info(f"Mining job {job_id} cancelled by a new block")
+                    break
+
+                try:
+                    result = self.result_queue.get(timeout=MinerSettings.CANCEL_POLL_INTERVAL)
+                except queue.Empty:
+                    # a shutdown may have stopped the workers before they got the job's chunks
+                    if self.stopped.is_set():
+                        self.multiproc_logger.info(f"Mining job {job_id} stopped by a shutdown")
+                        break
+                    continue
+
+                result_job_id, worker_id, template_id, nonce, block_hash, attempts, elapsed, stopped_at, aborted = \
+                    result
+                self._record_result(result_job_id, worker_id, attempts, elapsed, stopped_at, aborted)
+                if result_job_id != job_id:
+                    continue  # leftovers of an older job
+                if nonce is not None:
+                    mined_block = scheduler.apply_solution(template_id, nonce, block_hash)
+                    break
+                if worker_id is None:
+                    self.multiproc_logger.info(f"Mining job {job_id} cancelled")
+                    break
+                put_chunk()
         except Exception as e:
             self.multiproc_logger.error(f"Mining interrupted or no block found: {e}")
 
-        # Signal all processes to terminate and join them
-        self.new_block_event.set()
-        for process in processes:
-            process.join()
-
-        # Reset the event for future mining
-        self.new_block_event.clear()
+        # stop the other workers from searching the finished job
+        with self.job_lock:
+            if self.job_id == job_id:
+                self.job_id += 1
+                self.current_job.value = self.job_id
+        self.stats.finish_job(job_id, solved=mined_block is not None)
         return mined_block
 
 
+def _mining_worker(worker_id, backend_name, task_queue, current_job, result_queue):
+    """
+    Main loop of a mining process. Pulls nonce chunks from the shared task queue and searches them,
+    reporting every finished chunk so the pool owner can hand out the next one.
+    :param worker_id: Index of this worker in the pool.
+    :param backend_name: Name of the mining backend to search with.
+    :param task_queue: Queue of (job id, template id, hash prefix, difficulty, start, end) chunks. None means stop.
+    :param current_job: Shared value holding the id of the job that should be mined.
+    :param result_queue: Queue to put (job id, worker id, template id, nonce, hash, attempts, seconds,
+                         stop time, aborted) results on.
+    """
+    backend = get_mining_backend(backend_name)
+    while True:
+        task = task_queue.get()
+        if task is None:
+            return
+
+        job_id, template_id, hash_prefix, difficulty, start_nonce, end_nonce = task
+        if current_job.value != job_id:
+            continue  # the job was replaced before we got to it
+
+        start_time = time.perf_counter()
+        nonce, block_hash, attempts = backend.search(
+            hash_prefix, difficulty, start_nonce, end_nonce, lambda: current_job.value != job_id
+        )
+        elapsed = time.perf_counter() - start_time
+        aborted = nonce is None and current_job.value != job_id
+        result_queue.put(
+            (job_id, worker_id, template_id, nonce, block_hash, attempts, elapsed, time.time(), aborted)
+        )
+
+
 def assertion_check():
     # Assuming `block` is an instance of your Block class
-    miner = MultiprocessMining(num_processes=4)
+    miner = MultiprocessMining("assertion", num_processes=4)
     mined_block = miner.get_block_hash(create_sample_block(), difficulty=4)
+    assert mined_block is None or mined_block.hash == mined_block.calculate_hash(), "Mined hash does not match block"
 
     if mined_block:
         print(f"Successfully mined block with hash: {mined_block.hash}")
     else:
         print("Mining was aborted or failed.")
 
+    # the same pool should serve the next job
+    mined_block = miner.get_block_hash(create_sample_block(), difficulty=3)
+    assert mined_block and mined_block.hash == mined_block.calculate_hash(), "Mined hash does not match block"
+
+    # a cancelled job should return None instead of waiting for a nonce
+    unsolvable_block = create_sample_block()
+    threading.Timer(0.5, miner.cancel).start()
+    assert miner.get_block_hash(unsolvable_block, difficulty=64) is None, "Cancelled job should return None"
 
-def test_processes_speeds(start, end, difficulty=5):
-    time_list = []
-    for i in range(start, end, 1):
-        start_time = time.time()
-        miner = MultiprocessMining(num_processes=i)
-        miner.get_block_hash(create_sample_block(), difficulty=difficulty)
-        end_time = time.time()
-        elapsed_time = end_time - start_time
-        time_list.append(elapsed_time)
+    # the same should happen when an outside event is set
+    new_block_event = threading.Event()
+    threading.Timer(0.5, new_block_event.set).start()
+    assert miner.get_block_hash(unsolvable_block, 64, new_block_event) is None, "Cancelled job should return None"
 
-    # Pair each time with its original index
-    indexed_times = list(enumerate(time_list))
+    # the cancel latency is reported by the workers that stopped, and read on the next job
+    miner.get_block_hash(create_sample_block(), difficulty=2)
+    latency = miner.get_cancel_latency()
+    assert latency["samples"] > 0, "Workers should report their cancel latency"
+    print(f"Cancel latency: {latency}")
+    stats = miner.get_stats()
+    assert stats["solved_jobs"] == 3 and stats["aborted_jobs"] == 2, "Jobs should be counted by outcome"
+    assert 0 < stats["stale_ratio"] < 1, "Cancelled jobs should count as stale work"
+    assert miner.get_hashrates(), "Workers should report their hashrate"
 
-    # Sort the times in ascending order by the time value
-    sorted_times = sorted(indexed_times, key=lambda x: x[1])
+    # a shutdown from another thread stops a running job, and the pool is not restarted until started
+    threading.Timer(0.5, miner.shutdown).start()
+    assert miner.get_block_hash(unsolvable_block, difficulty=64) is None, "Shutdown should stop the job"
+    assert miner.get_block_hash(create_sample_block(), difficulty=2) is None, "A shut down pool should not restart"
+    assert miner.get_stats()["processes"] == 0, "Shutdown should stop the processes"
+    miner.start()
+    mined_block = miner.get_block_hash(create_sample_block(), difficulty=2)
+    assert mined_block and miner.get_stats()["processes"] == 4, "A started pool should mine again"
+    miner.shutdown()
 
-    # Print the sorted times with their original index
-    print("Sorted times:")
-    for index, time_value in sorted_times:
-        print(f"{index+1}: {time_value:.2f} seconds")
+    # a tiny nonce space forces the scheduler to roll the timestamp
+    block = create_sample_block()
+    scheduler = NonceScheduler(block, chunk_size=2, max_nonce=4)
+    chunks = [scheduler.next_chunk() for _ in range(3)]
+    assert chunks[2][0] == 1 and chunks[2][2] == 0, "Scheduler should roll to a new template"
+    assert chunks[2][1] != chunks[0][1], "Rolled template should have a new hash prefix"
+    solved = scheduler.apply_solution(0, 3, "hash")
+    assert solved.timestamp == scheduler.templates[0], "Solution should restore the template timestamp"
 
 
 if __name__ == "__main__":
-    test_processes_speeds(1, 20)
+    assertion_check()
@@ -0,0 +1,163 @@
+import queue
+import threading
+import time
+
+from core.transaction import create_sample_transaction
+from core.verification import get_verifier
+from utils.config import MinerSettings
+from utils.logging_utils import configure_logger
+
+
+class TransactionIngress:
+    """
+    Collects incoming transactions for a short window, verifies them as one parallel batch,
+    and hands the accepted ones over together, so the mempool lock is taken once per batch.
+    A batch is closed when `window` seconds passed since its first transaction, or when it has `max_batch` ones.
+    """
+
+    def __init__(
+            self,
+            on_accepted,
+            instance_id,
+            child_dir="ingress",
+            window=MinerSettings.INGRESS_WINDOW,
+            max_batch=MinerSettings.INGRESS_MAX_BATCH,
+            verifier=None
+    ):
+        """
+        :param on_accepted: Callable receiving the list of verified transactions of a batch.
+        :param window: Seconds to wait for more transactions after the first one of a batch.
+        :param max_batch: Maximum number of transactions in a batch.
+        :param verifier: TransactionVerifier to use, defaults to the process wide one.
+        """
+        self.ingress_logger = configure_logger(
+            class_name="TransactionIngress",
+            child_dir=child_dir,
+            instance_id=instance_id
+        )
+        self.on_accepted = on_accepted
+        self.window = window
+        self.max_batch = max_batch
+        self.verifier = verifier or get_verifier()
+        self.pending = queue.Queue()
+        self.thread = None
+
+        self.stats_lock = threading.Lock()
+        self.received = 0
+        self.accepted = 0
+        self.rejected = 0
+        self.batches = 0
+        self.total_latency = 0.0  # seconds from submit until handed over, summed over accepted transactions
+
+    def start(self):
+        if self.thread and self.thread.is_alive():
+            return
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if not self.thread:
+            return
+        self.pending.put(None)
+        self.thread.join()
+        self.thread = None
+
+    def submit(self, transaction):
+        """
+        Queue a transaction for verification.
+        :param transaction: The received transaction.
+        :return: None
+        """
+        with self.stats_lock:
+            self.received += 1
+        self.pending.put((transaction, time.monotonic()))
+
+    def _run(self):
+        while True:
+            item = self.pending.get()
+            if item is None:
+                return
+            batch = [item]
+
+            # keep collecting until the window closes or the batch is full
+            deadline = time.monotonic() + self.window
+            stop = False
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self.pending.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+
+            try:
+                self._process_batch(batch)
+            except Exception as e:
+                self.ingress_logger.error(f"Failed to process a batch of {len(batch)} transactions: {e}")
+            if stop:
+                return
+
+    def _process_batch(self, batch):
+        # drop transactions that were received twice in the same window
+        unique = {}
+        for transaction, submitted in batch:
+            unique.setdefault(transaction, submitted)
+        transactions = list(unique)
+
+        results = self.verifier.verify_all(transactions)
+        accepted = [tx for tx, verified in zip(transactions, results) if verified]
+        if len(accepted) != len(transactions):
+            self.ingress_logger.warning(f"Rejected {len(transactions) - len(accepted)} unverified transactions")
+
+        if accepted:
+            self.on_accepted(accepted)
+
+        now = time.monotonic()
+        with self.stats_lock:
+            self.batches += 1
+            self.accepted += len(accepted)
+            self.rejected += len(batch) - len(accepted)
+            self.total_latency += sum(now - unique[tx] for tx in accepted)
+        self.ingress_logger.info(f"Processed a batch of {len(batch)} transactions, accepted {len(accepted)}")
+
+    def get_stats(self):
+        """
+        :return: Dictionary with the received, accepted and rejected counts, batches, and mean batch size and latency.
+        """
+        with self.stats_lock:
+            return {
+                "received": self.received,
+                "accepted": self.accepted,
+                "rejected": self.rejected,
+                "queued": self.pending.qsize(),
+                "batches": self.batches,
+                "mean_batch_size": (self.accepted + self.rejected) / self.batches if self.batches else 0.0,
+                "mean_latency": self.total_latency / self.accepted if self.accepted else 0.0,
+            }
+
+
+def assertion_check():
+    accepted_batches = []
+    ingress = TransactionIngress(accepted_batches.append, "assertion", window=0.2, max_batch=10)
+    ingress.start()
+
+    transactions = [create_sample_transaction(10) for _ in range(4)]
+    transactions[3].amount += 1  # breaks the signature
+    for transaction in transactions + [transactions[0]]:
+        ingress.submit(transaction)
+    ingress.stop()
+
+    assert len(accepted_batches) == 1, "Transactions of one window should be handed over together"
+    assert accepted_batches[0] == transactions[:3], "Only verified, unique transactions should be accepted"
+    stats = ingress.get_stats()
+    assert stats["received"] == 5 and stats["accepted"] == 3 and stats["rejected"] == 2, "Wrong ingress counters"
+    print("Transaction ingress assertions passed!")
+
+
+if __name__ == "__main__":
+    assertion_check()
@@ -2,7 +2,10 @@ from cryptography.hazmat.primitives import serialization
 from network.bootstrap import Bootstrap
 import json
 import os
+from core.block import Block
 from core.wallet import Wallet, create_sample_wallet
+from core.wallet_store import WalletStore
+from network.chain_sync import ChainSynchronizer
 from core.transaction import Transaction, get_sk_pk_pair
 from utils.config import MsgTypes, MsgSubTypes, FilesSettings, BlockSettings, KeysSettings, ActionType, ActionSettings, \
     NodeSettings
@@ -51,32 +54,45 @@ class User(Bootstrap):
         # make the wallet directory if you don't already exist
         full_directory = os.path.dirname(self.wallet_path)
         os.makedirs(full_directory, exist_ok=True)
+        self.wallet_store = WalletStore(os.path.join(full_directory, FilesSettings.WALLET_DATABASE_FILE_NAME))
+        self.defer_wallet_saves = False  # set while catching up, so the wallet is saved once per batch of blocks
         if wallet:
             self.wallet = wallet
+            self.wallet_store.save(self.wallet, full=True)
         else:
             self.wallet = self.load_wallet(child_dir, name)
 
         self.save_wallet()
 
+        self.synchronizer = ChainSynchronizer(
+            send_request=lambda address, msg_subtype, *msg_params: self.send_focused_message(
+                address, MsgTypes.REQUEST, msg_subtype, *msg_params),
+            get_peers=self.get_connected_nodes,
+            get_latest_hash=lambda: self.wallet.latest_hash,
+            on_blocks=self.process_blocks,
+            instance_id=name,
+            child_dir=child_dir
+        )
+        self.synchronizer.start()
+
         # try and get updates for wallet (in case of missing out)
         self.request_blockchain_update()
 
     def request_blockchain_update(self):
         """
-        Requests an update of the blockchain from peers by sending the latest hash.
+        Synchronizes the blocks after the latest hash, headers first (see ChainSynchronizer).
         :return: None
         """
-        self.send_distributed_message(
-            MsgTypes.REQUEST,
-            MsgSubTypes.BLOCKCHAIN,
-            self.wallet.latest_hash
-        )
-        self.user_logger.info(f"Requesting updates with latest hash: {self.wallet.latest_hash}")
+        if self.synchronizer.synchronize():
+            self.user_logger.info(f"Requesting updates with latest hash: {self.wallet.latest_hash}")
 
     def __del__(self):
         super().__del__()
-        if hasattr(self, "wallet") and self.wallet:
+        if hasattr(self, "synchronizer"):
+            self.synchronizer.stop()
+        if hasattr(self, "wallet_store") and not self.wallet_store.closed:
             self.save_wallet()
+            self.wallet_store.close()
 
     def get_recent_transactions(self, num=5):
         """
@@ -150,6 +166,19 @@ class User(Bootstrap):
         except Exception as e:
             self.user_logger.error(f"error while trying to send a transaction to address {address}: - {e}")
 
+    def verify_payment(self, transaction, proof, merkle_root):
+        """
+        Verifies that a transaction is included in a block, using only the block Merkle root and
+        an inclusion proof from a full node, instead of downloading and scanning the whole block.
+        :param transaction: The transaction to verify.
+        :param proof: Merkle proof of the transaction (see Block.get_transaction_proof).
+        :param merkle_root: Merkle root from the block header.
+        :return: True if the transaction is included in the block.
+        """
+        verified = Block.verify_transaction_proof(transaction, proof, merkle_root)
+        self.user_logger.info(f"Payment {transaction} inclusion verified: {verified}")
+        return verified
+
     def process_block_data(self, block):
         """
         Processes and adds a received block to the user's wallet.
@@ -158,7 +187,8 @@ class User(Bootstrap):
         """
         # check
         already_seen = self.wallet.filter_and_add_block(block, self.nodes_names_addresses)
-        self.save_wallet()
+        if not self.defer_wallet_saves:
+            self.save_wallet()
         if not already_seen:
             self.user_logger.debug(f" Block added to wallet and saved. block: {block}")
         return already_seen
@@ -169,10 +199,40 @@ class User(Bootstrap):
         :param blockchain: The blockchain object received.
         :return: None
         """
-        relevant_blocks = blockchain.get_blocks_after(self.wallet.latest_hash)
-        for block in relevant_blocks:
-            self.process_block_data(block)
-        self.user_logger.debug(f"Blockchain response added to wallet and saved.")
+        self.process_blocks(blockchain.get_blocks_after(self.wallet.latest_hash))
+
+    def process_blocks(self, blocks):
+        """
+        Processes a batch of consecutive blocks, saving the wallet once for the whole batch.
+        :param blocks: List of blocks, in chain order.
+        :return: None
+        """
+        self.defer_wallet_saves = True
+        try:
+            for block in blocks:
+                self.process_block_data(block)
+        finally:
+            self.defer_wallet_saves = False
+            self.save_wallet()
+        self.user_logger.debug(f"Batch of {len(blocks)} blocks added to wallet and saved.")
+
+    def process_headers_data(self, headers, node_address):
+        """
+        Passes received block headers to the synchronizer.
+        :param headers: List of block headers.
+        :param node_address: Address of the node that sent them.
+        :return: None
+        """
+        self.synchronizer.handle_headers(headers, node_address)
+
+    def process_blocks_data(self, blocks, node_address):
+        """
+        Passes a received range of blocks to the synchronizer, which hands them over in order.
+        :param blocks: List of blocks.
+        :param node_address: Address of the node that sent them.
+        :return: None
+        """
+        self.synchronizer.handle_blocks(blocks, node_address)
 
     def serve_blockchain_request(self, latest_hash):
         """
@@ -182,6 +242,12 @@ class User(Bootstrap):
         """
         pass  # user does not handle blockchain requests
 
+    def serve_headers_request(self, latest_hash):
+        pass  # user does not handle header requests
+
+    def serve_blocks_request(self, start_hash, count):
+        pass  # user does not handle block requests
+
     def process_transaction_data(self, params):
         """
         Processes a received transaction, although users do not directly handle transactions.
@@ -202,7 +268,7 @@ class User(Bootstrap):
 
     def save_wallet(self):
         """
-        Saves the user's wallet to a file in JSON format.
+        Saves the wallet state and the actions changed since the last save to the wallet store.
         :return: None
         """
 
@@ -210,31 +276,38 @@ class User(Bootstrap):
         if not self.wallet:
             return
         try:
-            with open(self.wallet_path, "w") as f:
-                dictionary_wallet = self.wallet.to_dict()
-                json.dump(dictionary_wallet, f, indent=4)
+            self.wallet_store.save(self.wallet)
         except Exception as e:
             self.user_logger.error(f"Error saving wallet: {e}")
 
     def load_wallet(self, child_dir, name):
         """
-        Loads the wallet from a file if it exists; otherwise, initializes a new wallet.
+        Loads the wallet from the wallet store, or migrates a legacy JSON wallet file into it;
+        otherwise, initializes a new wallet.
         :param child_dir: The directory where the wallet file is stored.
         :param name: optional object name
         :return: Loaded wallet object.
         """
+        try:
+            wallet = self.wallet_store.load(child_dir, name)
+            if wallet:
+                self.user_logger.info(f"loaded wallet - {wallet}")
+                return wallet
+        except Exception as e:
+            self.user_logger.error(f"Error loading wallet: {e}")
+
         if os.path.exists(self.wallet_path) and os.path.getsize(self.wallet_path) != 0:
             try:
                 with open(self.wallet_path, "r") as f:
                     blockchain_data = json.load(f)
                     wallet = Wallet.from_dict(blockchain_data)
-                    self.user_logger.info(f"loaded wallet - {wallet}")
+                self.wallet_store.save(wallet, full=True)
+                self.user_logger.info(f"migrated wallet from {self.wallet_path} to {self.wallet_store.path}")
                 return wallet
             except Exception as e:
                 self.user_logger.error(f"Error loading wallet: {e}")
-                return Wallet(self.public_key, instance_id=f"{self.ip}-{self.port}", child_dir=child_dir, name=name)
 
-        self.user_logger.warning(f"No wallet file found at {self.wallet_path}, initializing new wallet.")
+        self.user_logger.warning(f"No wallet found at {self.wallet_store.path}, initializing new wallet.")
         return Wallet(self.public_key, instance_id=f"{self.ip}-{self.port}", child_dir=child_dir, name=name)
 
 
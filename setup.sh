@@ -17,7 +17,7 @@ pip install -r requirements.txt
 
 # Run key generation script
 echo "🔑 Generating keys..."
-python utils/keys_manager.py
+python -c "from utils.keys_manager import create_all_keys; create_all_keys()"
 
 # Frontend setup
 echo "📦 Installing frontend dependencies..."
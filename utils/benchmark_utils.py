@@ -0,0 +1,103 @@
+import json
+import math
+import os
+import platform
+import time
+from datetime import datetime
+
+from utils.config import FilesSettings
+from utils.logging_utils import setup_basic_logger
+
+logger = setup_basic_logger()
+
+BENCHMARKS_DIRECTORY = os.path.join(FilesSettings.DATA_ROOT_DIRECTORY, FilesSettings.BENCHMARKS_FOLDER_NAME)
+
+
+def time_trials(function, trials, warmup=0):
+    """
+    Time repeated calls of a function.
+    :param function: Callable with no arguments.
+    :param trials: Number of timed calls.
+    :param warmup: Number of untimed calls made first.
+    :return: List of durations in seconds.
+    """
+    for _ in range(warmup):
+        function()
+    samples = []
+    for _ in range(trials):
+        start_time = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - start_time)
+    return samples
+
+
+def percentile(sorted_samples, fraction):
+    """
+    Nearest-rank percentile of already sorted samples.
+    :param sorted_samples: Sorted list of numbers.
+    :param fraction: Percentile as a fraction, e.g. 0.9.
+    :return: The percentile value.
+    """
+    index = min(len(sorted_samples) - 1, max(0, math.ceil(fraction * len(sorted_samples)) - 1))
+    return sorted_samples[index]
+
+
+def summarize(samples):
+    """
+    :param samples: List of measurements.
+    :return: Dictionary with count, mean, min, max and the 50/90/99 percentiles.
+    """
+    if not samples:
+        return {"count": 0}
+    sorted_samples = sorted(samples)
+    return {
+        "count": len(samples),
+        "mean": sum(samples) / len(samples),
+        "min": sorted_samples[0],
+        "p50": percentile(sorted_samples, 0.5),
+        "p90": percentile(sorted_samples, 0.9),
+        "p99": percentile(sorted_samples, 0.99),
+        "max": sorted_samples[-1],
+    }
+
+
+def save_results(name, results, output_path=None):
+    """
+    Save benchmark results as JSON, together with some details about the machine.
+    :param name: Name of the benchmark, used for the default file name.
+    :param results: JSON serializable results.
+    :param output_path: Optional output path, defaults to data/benchmarks/<name>-<time>.json.
+    :return: The path the results were saved to.
+    """
+    if output_path is None:
+        timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        output_path = os.path.join(BENCHMARKS_DIRECTORY, f"{name}-{timestamp}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+
+    report = {
+        "benchmark": name,
+        "created": datetime.now().isoformat(),
+        "machine": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "results": results,
+    }
+    with open(output_path, "w") as f:
+        json.dump(report, f, indent=4)
+    logger.info(f"Benchmark '{name}' results saved to {output_path}")
+    return output_path
+
+
+def assertion_check():
+    summary = summarize([5, 1, 4, 2, 3])
+    assert summary["p50"] == 3 and summary["min"] == 1 and summary["max"] == 5, "Wrong summary"
+    assert summary["p90"] == 5 and summary["p99"] == 5, "Wrong summary"
+    assert summarize([1.0])["p99"] == 1.0, "Single sample percentile should be the sample"
+    assert len(time_trials(lambda: None, 3, warmup=1)) == 3, "Wrong number of trials"
+    print("Benchmark utils assertions passed!")
+
+
+if __name__ == "__main__":
+    assertion_check()
@@ -18,6 +18,13 @@ class PortsRanges:
 
 class TransactionSettings:
     MAX_AMOUNT = 10 ** 6
+    SIGNATURE_CACHE_SIZE = 2 ** 15  # verified signatures remembered per process
+
+
+class VerificationSettings:
+    WORKERS = None  # signature verification workers, None for the number of CPUs
+    EXECUTOR = "thread"  # "thread" or "process"
+    MIN_PARALLEL_BATCH = 8  # smaller batches are verified in the calling thread
 
 
 class ActionSettings:
@@ -44,6 +51,7 @@ class BlockSettings:
     BONUS_AMOUNT = 199
     USUAL_TIP = 5
     PROCESSES_NUMBER = 10
+    HEADER_VERSION = 1
 
 
 class BlockChainSettings:
@@ -51,9 +59,9 @@ class BlockChainSettings:
     GENESYS_PREVIEWS_HASH = hashlib.sha256(GENESYS_PREVIEWS_HASH_DATA.encode()).hexdigest()
     # e4e5e801f8d62dc6564612ad956763af4ac2350080093abca3765b020fa6af6c
 
-    GENESYS_HASH_DATA = 'e4e5e801f8d62dc6564612ad956763af4ac2350080093abca3765b020fa6af6c|Transaction(Sender: 251..., Recipient: 251..., Amount: 0, Tip: 0)|3|time-zero|0'
-    GENESYS_HASH = hashlib.sha256(GENESYS_HASH_DATA.encode()).hexdigest()
-    # 6c4709c3ec9daa2f9916b684c4eb5fb53912c883876e3f1cf817131d58d689e2
+    # hash of the binary header of the genesis block (version 1, previous hash above, merkle root of the
+    # genesis transaction made with the keys in data/keys.json, difficulty 3, timestamp 0, nonce 0)
+    GENESYS_HASH = "b83cfc52eadb10b2555fa9383002bd1df8b02456b90a8dda6e543b202df2ee8b"
 
 
 class KeysSettings:
@@ -71,7 +79,11 @@ class FilesSettings:
     BOOTSTRAP_CONFIG_FILENAME = "bootstrap_config.json"
     KEYS_FILENAME = "keys.json"
     WALLET_FILE_NAME = "wallet.json"
+    WALLET_DATABASE_FILE_NAME = "wallet.db"
     BLOCKCHAIN_FILE_NAME = "blockchain.json"
+    BLOCK_STORE_FOLDER_NAME = "blocks"
+    CHECKPOINTS_FILE_NAME = "checkpoints.json"
+    BENCHMARKS_FOLDER_NAME = "benchmarks"
 
 
 class MsgStructure:
@@ -97,13 +109,75 @@ class MsgSubTypes:
     BLOCK = "blok"
     TRANSACTION = "trsn"
     BLOCKCHAIN = "bkcn"
-    ALL_MSGSUB_TYPES = [TEST, NODE_ADDRESS, NODE_INIT, NODE_NAME, BLOCK, TRANSACTION, BLOCKCHAIN]
+    HEADERS = "hdrs"
+    BLOCKS = "blks"
+    ALL_MSGSUB_TYPES = [TEST, NODE_ADDRESS, NODE_INIT, NODE_NAME, BLOCK, TRANSACTION, BLOCKCHAIN, HEADERS, BLOCKS]
 
 
 class MinerSettings:
     PROCESSES_NUMBER = 7
     PROCESS_RANGE = 10 ** 4
     DIFFICULTY_LEVEL = 3
+    MINING_BACKEND = "batched"  # "batched" or "reference"
+    BATCH_SIZE = 4096
+    CHUNK_SIZE = 2 ** 16  # nonces handed to a mining process at a time
+    QUEUED_CHUNKS_PER_PROCESS = 2
+    MAX_NONCE = 2 ** 32
+    CANCEL_POLL_INTERVAL = 0.05  # seconds between checks of the miner's new block event
+    CANCEL_TIMES_KEPT = 16
+    LATENCY_SAMPLES = 100
+    JOBS_KEPT = 50  # finished jobs kept in the mining stats
+    METRICS_PORT = None  # local port of the miner metrics endpoint, None to disable
+    SHUTDOWN_TIMEOUT = 5  # seconds to wait for a mining process to exit
+    TEMPLATE_POLL_INTERVAL = 0.5  # seconds between checks for a stop request while waiting for transactions
+    RETARGET_INTERVAL = 1.0  # minimum seconds between template rebuilds for arriving high tip transactions
+    INGRESS_WINDOW = 0.05  # seconds to collect incoming transactions into one verification batch
+    INGRESS_MAX_BATCH = 256
+
+
+class BlockStoreSettings:
+    SEGMENT_SIZE = 64 * 2 ** 20  # bytes per segment file
+    FSYNC_POLICY = "always"  # "always", "batch" or "never"
+    FSYNC_BATCH = 16  # blocks appended between fsyncs with the "batch" policy
+
+
+class WalletStoreSettings:
+    SYNCHRONOUS = "NORMAL"  # SQLite synchronous mode, with WAL journaling "NORMAL" survives process crashes
+
+
+class SyncSettings:
+    MAX_HEADERS = 2000  # headers per response, more are requested from the same peer
+    BLOCKS_PER_REQUEST = 16  # blocks per body range request, also the most a peer serves at once
+    MAX_IN_FLIGHT = 8  # body ranges requested at the same time, spread over the peers
+    REQUEST_TIMEOUT = 5.0  # seconds before a request is sent to another peer
+    CHECK_INTERVAL = 0.5  # seconds between timeout checks
+
+
+class CheckpointSettings:
+    INTERVAL = 100  # validated blocks between checkpoints
+    KEPT = 10
+    BACKGROUND_REVALIDATION = True  # revalidate the whole chain in the background after starting from a checkpoint
+
+
+class MempoolSettings:
+    MAX_TRANSACTIONS = 10 ** 5
+    MAX_BYTES = 128 * 2 ** 20  # approximate size of the pending transactions
+    TRANSACTION_OVERHEAD = 64  # bytes counted for a transaction's amount, tip and bookkeeping
+    EXPIRY = 3 * 60 * 60  # seconds a transaction waits in the mempool before it is dropped
+    MIN_TIP = 0
+    MIN_TIP_INCREMENT = 1  # the minimum tip is raised this much above the highest evicted tip
+    MIN_TIP_HALF_LIFE = 10 * 60  # seconds for a raised minimum tip to decay by half
+    MIN_COMPACT_SIZE = 1024  # stale heap entries tolerated before the heap is rebuilt
+    TEMPLATE_MIN_TRANSACTIONS = 64  # pending transactions that start a block template without further waiting
+    TEMPLATE_MAX_WAIT = 0.2  # seconds to wait for more transactions once the first ones arrived
+
+
+class BenchmarkSettings:
+    SEED = 1234
+    TRIALS = 5
+    NONCES_PER_TRIAL = 2 ** 16
+    MEMPOOL_IDENTITY_COUNT = 2000
+    MEMPOOL_SIZES = (10 ** 4, 10 ** 5, 10 ** 6)
 
 
 class LoggingSettings:
@@ -1,6 +1,9 @@
 import base64
+import hashlib
 import json
 import os
+import tempfile
+import threading
 
 from cryptography.hazmat.primitives import serialization
 from cryptography.hazmat.primitives.asymmetric import rsa
@@ -58,6 +61,7 @@ def generate_and_save_keys(sk_name, pk_name):
         # Save back to the JSON file
         with open(KEYS_FILE, 'w') as json_file:
             json.dump(keys_dict, json_file, indent=4)
+        key_registry.invalidate()
 
         logger.info(f"Keys '{sk_name}' and '{pk_name}' saved/updated successfully in {KEYS_FILE}")
 
@@ -65,44 +69,143 @@ def generate_and_save_keys(sk_name, pk_name):
         logger.error(f"Error generating or saving keys: {e}")
 
 
-def load_key(key_name):
+class KeyRegistry:
     """
-    Load a single RSA key (private or public) from the JSON file.
-    :param key_name: The name of the key to load
-    :return: The key object (private or public), or None if the key is missing
+    Process wide cache of the keys in the keys file.
+    The file is parsed once and re-read only when its modification time or size changes,
+    and every key is decoded from PEM once, together with the fingerprint of its public key.
     """
 
-    try:
-        if not os.path.exists(KEYS_FILE):
-            logger.error(f"No keys file found at {KEYS_FILE}")
+    def __init__(self, keys_file=KEYS_FILE):
+        self.keys_file = keys_file
+        self.lock = threading.Lock()
+        self.file_state = None
+        self.encoded_keys = {}
+        self.keys = {}
+        self.fingerprints = {}
+
+    def invalidate(self):
+        """
+        Forget the loaded keys, so the keys file is read again on the next access.
+        """
+        with self.lock:
+            self.file_state = None
+
+    def _refresh(self):
+        """
+        Reload the keys file if it changed since it was last read. Must be called with the lock held.
+        :return: True if the keys file exists
+        """
+        try:
+            stat = os.stat(self.keys_file)
+        except FileNotFoundError:
+            self.file_state = None
+            self.encoded_keys = {}
+            self.keys = {}
+            self.fingerprints = {}
+            return False
+
+        file_state = (stat.st_mtime_ns, stat.st_size)
+        if file_state != self.file_state:
+            with open(self.keys_file, 'r') as json_file:
+                self.encoded_keys = json.load(json_file)
+            self.keys = {}
+            self.fingerprints = {}
+            self.file_state = file_state
+            logger.info(f"Keys loaded from {self.keys_file}")
+        return True
+
+    def get_key(self, key_name):
+        """
+        :param key_name: The name of the key to load
+        :return: The key object (private or public), or None if the key is missing
+        """
+        with self.lock:
+            if not self._refresh():
+                logger.error(f"No keys file found at {self.keys_file}")
+                return None
+
+            if key_name in self.keys:
+                return self.keys[key_name]
+
+            if key_name not in self.encoded_keys:
+                logger.error(f"Key '{key_name}' not found in {self.keys_file}")
+                return None
+
+            # Decode the Base64 string and load the PEM key
+            key_pem = base64.b64decode(self.encoded_keys[key_name])
+
+            if "sk" in key_name:
+                # Load secret key
+                key = serialization.load_pem_private_key(key_pem, password=None)
+                public_key = key.public_key()
+            else:
+                # Load public key
+                key = serialization.load_pem_public_key(key_pem)
+                public_key = key
+
+            self.keys[key_name] = key
+            self.fingerprints[key_name] = get_public_key_fingerprint(public_key)
+            return key
+
+    def get_fingerprint(self, key_name):
+        """
+        :param key_name: The name of the key
+        :return: The fingerprint of the key's public key, or None if the key is missing
+        """
+        if self.get_key(key_name) is None:
             return None
+        with self.lock:
+            return self.fingerprints.get(key_name)
 
-        # Load the keys from JSON
-        with open(KEYS_FILE, 'r') as json_file:
-            keys_dict = json.load(json_file)
 
-        if key_name not in keys_dict:
-            logger.error(f"Key '{key_name}' not found in {KEYS_FILE}")
-            return None
+key_registry = KeyRegistry()
 
-        # Decode the Base64 string and load the PEM key
-        key_pem = base64.b64decode(keys_dict[key_name])
 
-        if "sk" in key_name:
-            # Load secret key
-            key = serialization.load_pem_private_key(key_pem, password=None)
-        else:
-            # Load public key
-            key = serialization.load_pem_public_key(key_pem)
+def load_key(key_name):
+    """
+    Load a single RSA key (private or public) from the JSON file, through the process wide key registry.
+    :param key_name: The name of the key to load
+    :return: The key object (private or public), or None if the key is missing
+    """
+    try:
+        return key_registry.get_key(key_name)
+    except Exception as e:
+        logger.error(f"Error loading key '{key_name}': {e}")
+        return None
 
-        logger.info(f"Key '{key_name}' loaded successfully from {KEYS_FILE}")
-        return key
 
+def get_key_fingerprint(key_name):
+    """
+    :param key_name: The name of the key
+    :return: The fingerprint of the key's public key, or None if the key is missing
+    """
+    try:
+        return key_registry.get_fingerprint(key_name)
     except Exception as e:
         logger.error(f"Error loading key '{key_name}': {e}")
         return None
 
 
+def get_pem_fingerprint(public_pem):
+    """
+    :param public_pem: PEM encoded public key bytes.
+    :return: The 32 byte SHA-256 fingerprint of the key.
+    """
+    return hashlib.sha256(public_pem).digest()
+
+
+def get_public_key_fingerprint(public_key):
+    """
+    :param public_key: RSA public key object.
+    :return: The 32 byte SHA-256 fingerprint of its PEM encoding.
+    """
+    return get_pem_fingerprint(public_key.public_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PublicFormat.SubjectPublicKeyInfo,
+    ))
+
+
 def create_all_keys():
     generate_and_save_keys(KeysSettings.LORD_SK, KeysSettings.LORD_PK)
     generate_and_save_keys(KeysSettings.GENESIS_SK, KeysSettings.GENESIS_PK)
@@ -113,5 +216,30 @@ def create_all_keys():
     assert load_key(KeysSettings.LORD_PK)
 
 
+def assertion_check():
+    with tempfile.TemporaryDirectory() as directory:
+        keys_file = os.path.join(directory, FilesSettings.KEYS_FILENAME)
+        public_key = rsa.generate_private_key(public_exponent=65537, key_size=2048).public_key()
+        public_pem = public_key.public_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PublicFormat.SubjectPublicKeyInfo,
+        )
+        with open(keys_file, 'w') as json_file:
+            json.dump({"test_pk": base64.b64encode(public_pem).decode('utf-8')}, json_file)
+
+        registry = KeyRegistry(keys_file)
+        key = registry.get_key("test_pk")
+        assert registry.get_key("test_pk") is key, "Loaded keys should be cached"
+        assert registry.get_fingerprint("test_pk") == get_pem_fingerprint(public_pem), "Wrong key fingerprint"
+        assert registry.get_key("missing_pk") is None, "Missing key should not be loaded"
+
+        # rewriting the keys file drops the cached keys
+        with open(keys_file, 'w') as json_file:
+            json.dump({}, json_file)
+        registry.invalidate()
+        assert registry.get_key("test_pk") is None, "Keys should be reloaded after the file changed"
+    print("Key registry assertions passed!")
+
+
 if __name__ == "__main__":
-    create_all_keys()
+    assertion_check()
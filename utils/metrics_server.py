@@ -0,0 +1,77 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.request import urlopen
+
+from utils.logging_utils import setup_basic_logger
+
+logger = setup_basic_logger()
+
+METRICS_PATH = "/metrics"
+
+
+class MetricsServer:
+    """
+    A tiny local HTTP endpoint that serves a metrics dictionary as JSON on GET /metrics.
+    """
+
+    def __init__(self, get_metrics, port, host="127.0.0.1"):
+        """
+        :param get_metrics: Callable returning a JSON serializable dictionary.
+        :param port: Port to listen on (0 picks a free port).
+        :param host: Address to bind, local only by default.
+        """
+        self.get_metrics = get_metrics
+        self.host = host
+        self.port = port
+        self.server = None
+
+    def start(self):
+        if self.server:
+            return
+        get_metrics = self.get_metrics
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != METRICS_PATH:
+                    self.send_error(404)
+                    return
+                try:
+                    body = json.dumps(get_metrics()).encode()
+                except Exception as e:
+                    logger.error(f"Failed to collect metrics: {e}")
+                    self.send_error(500)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, message_format, *args):
+                pass  # don't spam the console with every scrape
+
+        self.server = ThreadingHTTPServer((self.host, self.port), MetricsHandler)
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        logger.info(f"Metrics served on http://{self.host}:{self.port}{METRICS_PATH}")
+
+    def stop(self):
+        if not self.server:
+            return
+        self.server.shutdown()
+        self.server.server_close()
+        self.server = None
+
+
+def assertion_check():
+    server = MetricsServer(lambda: {"hashrate": 10}, port=0)
+    server.start()
+    with urlopen(f"http://{server.host}:{server.port}{METRICS_PATH}") as response:
+        assert json.loads(response.read()) == {"hashrate": 10}, "Metrics endpoint returned wrong data"
+    server.stop()
+    print("Metrics server assertions passed!")
+
+
+if __name__ == "__main__":
+    assertion_check()